@@ -10,6 +10,15 @@ from .models import (
     BorrowedItem,
     Notification,
     EquipmentInstance,
+    SchedulerState,
+    BroadcastNotification,
+    NotificationReceipt,
+    QRRenderJob,
+    QRCode,
+    RequestBatch,
+    IdempotencyKey,
+    InstanceReservation,
+    InventorySnapshot,
 )
 
 
@@ -92,9 +101,10 @@ class SupplyRequestAdmin(admin.ModelAdmin):
 
 @admin.register(QRScanLog)
 class QRScanLogAdmin(admin.ModelAdmin):
-    list_display = ["supply", "scanned_by", "action", "location", "timestamp"]
+    list_display = ["supply", "scanned_by", "action", "location", "batch_group_id", "timestamp"]
     list_filter = ["action", "timestamp"]
-    search_fields = ["supply__name", "scanned_by__username"]
+    search_fields = ["supply__name", "scanned_by__username", "batch_group_id"]
+    raw_id_fields = ["supply_request"]
     readonly_fields = ["timestamp"]
 
 
@@ -167,6 +177,73 @@ class NotificationAdmin(admin.ModelAdmin):
     readonly_fields = ["created_at"]
 
 
+@admin.register(BroadcastNotification)
+class BroadcastNotificationAdmin(admin.ModelAdmin):
+    list_display = ["id", "audience", "title", "level", "is_active", "created_at", "resolved_at"]
+    list_filter = ["audience", "level", "is_active", "created_at"]
+    search_fields = ["title", "message", "dedupe_key"]
+    readonly_fields = ["created_at", "resolved_at"]
+
+
+@admin.register(NotificationReceipt)
+class NotificationReceiptAdmin(admin.ModelAdmin):
+    list_display = ["user", "broadcast", "read_at"]
+    search_fields = ["user__username", "broadcast__title"]
+    readonly_fields = ["read_at"]
+
+
+@admin.register(SchedulerState)
+class SchedulerStateAdmin(admin.ModelAdmin):
+    list_display = ["name", "last_run_at", "locked_until", "locked_by", "last_result"]
+    readonly_fields = ["updated_at"]
+
+
+@admin.register(QRRenderJob)
+class QRRenderJobAdmin(admin.ModelAdmin):
+    list_display = ["id", "kind", "status", "total", "completed", "failed", "created_by", "created_at", "finished_at"]
+    list_filter = ["kind", "status"]
+    readonly_fields = ["object_ids", "created_at", "started_at", "finished_at"]
+
+
+@admin.register(QRCode)
+class QRCodeAdmin(admin.ModelAdmin):
+    list_display = ["payload", "target_type", "target_id", "user", "batch_group_id", "created_at"]
+    list_filter = ["target_type"]
+    search_fields = ["payload", "batch_group_id"]
+    readonly_fields = ["created_at"]
+
+
+@admin.register(RequestBatch)
+class RequestBatchAdmin(admin.ModelAdmin):
+    list_display = ["group_id", "user", "is_borrowing", "status", "item_count", "borrowed_count", "returned_count", "created_at"]
+    list_filter = ["status", "is_borrowing"]
+    search_fields = ["group_id", "user__username"]
+    readonly_fields = ["created_at", "updated_at"]
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ["key", "user", "status_code", "created_at", "expires_at"]
+    list_filter = ["status_code"]
+    search_fields = ["key", "user__username"]
+    readonly_fields = ["request_hash", "response_body", "response_headers", "created_at"]
+
+
+@admin.register(InstanceReservation)
+class InstanceReservationAdmin(admin.ModelAdmin):
+    list_display = ["equipment_instance", "supply_request", "reserved_by", "created_at", "expires_at"]
+    search_fields = ["equipment_instance__instance_code", "supply_request__request_id"]
+    readonly_fields = ["created_at"]
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ["supply", "period", "as_of", "quantity", "cost_per_unit", "value"]
+    list_filter = ["period", "as_of"]
+    search_fields = ["supply__name"]
+    readonly_fields = ["created_at"]
+
+
 @admin.register(EquipmentInstance)
 class EquipmentInstanceAdmin(admin.ModelAdmin):
     list_display = [
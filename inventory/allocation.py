@@ -0,0 +1,183 @@
+"""
+Equipment instance allocation and reservations.
+
+Releases used to pick ``supply.instances.filter(status='available')[:n]``
+without a lock, so two staff releasing at once could hand out the same
+physical unit. allocate_instances locks the instances it takes with
+``select_for_update(skip_locked=True)``, limited to the number needed per
+supply: concurrent releases of the same supply skip each other's rows and
+take different units instead of queueing behind one another. The claim is
+a guarded UPDATE (only rows still available), and BorrowedItem's
+unique_open_borrow_per_instance constraint rejects a second open borrow of
+an instance on backends that do not lock rows at all.
+
+Instances picked on a borrow request or held at approval are recorded as
+InstanceReservation rows for INSTANCE_RESERVATION_TTL seconds. Reserved
+instances are not offered on borrow forms and are only allocated to the
+request holding them; an expired hold is ignored and replaced.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EquipmentInstance, InstanceReservation
+
+INSTANCE_RESERVATION_TTL = getattr(settings, 'INSTANCE_RESERVATION_TTL', 30 * 60)
+
+
+class InstancesTaken(Exception):
+    """Instances locked for a release were claimed by another writer."""
+
+
+def unreserved(instances, for_requests=(), now=None):
+    """
+    Narrow an EquipmentInstance queryset to instances not held for a request
+    other than ``for_requests``.
+    """
+    held = InstanceReservation.objects.filter(expires_at__gt=now or timezone.now())
+    if for_requests:
+        held = held.exclude(supply_request__in=for_requests)
+    return instances.exclude(pk__in=held.values('equipment_instance'))
+
+
+def _lock_available(instances, for_requests, now):
+    """Lock the available, unreserved instances of a queryset, skipping rows others hold."""
+    return unreserved(
+        instances.select_for_update(skip_locked=True).filter(status='available'), for_requests, now
+    ).order_by('id')
+
+
+def _wanted(req):
+    # A request naming an instance is for that unit only
+    return 1 if req.equipment_instance_id else req.quantity_requested
+
+
+def reserve_instances(requests, user):
+    """
+    Hold instances for borrowing requests awaiting approval or release: the
+    instance a request names if it is free, otherwise available units of
+    its supply up to the quantity requested. Holds the requests already
+    have are extended. Returns the new holds.
+    """
+    requests = [req for req in requests if '[BORROWING]' in req.purpose]
+    if not requests:
+        return []
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=INSTANCE_RESERVATION_TTL)
+    with transaction.atomic():
+        InstanceReservation.objects.filter(expires_at__lte=now).delete()
+        current = InstanceReservation.objects.filter(supply_request__in=requests)
+        held = defaultdict(int)
+        taken = set()
+        for request_id, instance_id in current.values_list('supply_request_id', 'equipment_instance_id'):
+            held[request_id] += 1
+            taken.add(instance_id)
+        if taken:
+            current.update(expires_at=expires_at)
+
+        missing = [req for req in requests if held[req.pk] < _wanted(req)]
+        named_ids = {req.equipment_instance_id for req in missing if req.equipment_instance_id} - taken
+        named = {}
+        if named_ids:
+            named = {
+                instance.pk: instance
+                for instance in _lock_available(EquipmentInstance.objects.filter(pk__in=named_ids), requests, now)
+            }
+
+        reservations = []
+        needs = defaultdict(list)
+        for req in missing:
+            instance = named.pop(req.equipment_instance_id, None)
+            if instance is not None:
+                reservations.append((req, instance))
+                taken.add(instance.pk)
+            else:
+                needs[req.supply_id].append(req)
+        for supply_id, supply_requests in needs.items():
+            count = sum(_wanted(req) - held[req.pk] for req in supply_requests)
+            pool = list(
+                _lock_available(EquipmentInstance.objects.filter(supply_id=supply_id), requests, now)
+                .exclude(pk__in=taken)[:count]
+            )
+            for req in supply_requests:
+                for instance in pool[:_wanted(req) - held[req.pk]]:
+                    reservations.append((req, instance))
+                del pool[:_wanted(req) - held[req.pk]]
+
+        return InstanceReservation.objects.bulk_create(
+            [
+                InstanceReservation(
+                    equipment_instance=instance, supply_request=req, reserved_by=user, expires_at=expires_at
+                )
+                for req, instance in reservations
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def release_reservations(requests):
+    """Drop the holds of requests that were rejected or released."""
+    InstanceReservation.objects.filter(supply_request__in=requests).delete()
+
+
+def allocate_instances(requests):
+    """
+    Claim instances for requests being released, in order: the instance a
+    request names if still free, then the instances held for it, then other
+    available units of its supply. A request naming an instance gets at most
+    one unit, others up to their quantity. The instances are marked borrowed
+    and the requests' holds dropped. Must run inside a transaction; returns
+    the instances allocated per request pk, possibly fewer than wanted.
+    """
+    now = timezone.now()
+    held = defaultdict(list)
+    for request_id, instance_id in InstanceReservation.objects.filter(
+        supply_request__in=requests, expires_at__gt=now
+    ).order_by('id').values_list('supply_request_id', 'equipment_instance_id'):
+        held[request_id].append(instance_id)
+
+    preferred_ids = {instance_id for ids in held.values() for instance_id in ids}
+    preferred_ids.update(req.equipment_instance_id for req in requests if req.equipment_instance_id)
+    preferred = {}
+    if preferred_ids:
+        preferred = {
+            instance.pk: instance
+            for instance in _lock_available(EquipmentInstance.objects.filter(pk__in=preferred_ids), requests, now)
+        }
+
+    allocation = {}
+    needs = defaultdict(list)
+    for req in requests:
+        ids = [req.equipment_instance_id] if req.equipment_instance_id else []
+        ids += [instance_id for instance_id in held[req.pk] if instance_id not in ids]
+        instances = [preferred.pop(instance_id) for instance_id in ids if instance_id in preferred]
+        allocation[req.pk] = instances[:_wanted(req)]
+        if len(allocation[req.pk]) < _wanted(req):
+            needs[req.supply_id].append(req)
+
+    taken = {instance.pk for instances in allocation.values() for instance in instances}
+    for supply_id, supply_requests in needs.items():
+        count = sum(_wanted(req) - len(allocation[req.pk]) for req in supply_requests)
+        pool = list(
+            _lock_available(EquipmentInstance.objects.filter(supply_id=supply_id), requests, now)
+            .exclude(pk__in=taken)[:count]
+        )
+        for req in supply_requests:
+            missing = _wanted(req) - len(allocation[req.pk])
+            allocation[req.pk] += pool[:missing]
+            del pool[:missing]
+
+    instance_ids = [instance.pk for instances in allocation.values() for instance in instances]
+    if instance_ids:
+        claimed = EquipmentInstance.objects.filter(pk__in=instance_ids, status='available').update(
+            status='borrowed', updated_at=now
+        )
+        if claimed != len(instance_ids):
+            raise InstancesTaken(f"{len(instance_ids) - claimed} instance(s) were taken by another release")
+        for instance in (instance for instances in allocation.values() for instance in instances):
+            instance.status = 'borrowed'
+    InstanceReservation.objects.filter(supply_request__in=requests).delete()
+    return allocation
@@ -157,12 +157,12 @@ def user_analytics_detail(request, user_id):
     requests = requests.order_by("-created_at")
 
     # Get borrowed items
-    borrowed_items = BorrowedItem.objects.filter(borrower=user)
+    borrowed_items = BorrowedItem.objects.with_due_status().filter(borrower=user)
     if start and end:
         borrowed_items = borrowed_items.filter(
             borrowed_at__gte=start, borrowed_at__lte=end
         )
-    borrowed_items = borrowed_items.order_by("-borrowed_at")
+    borrowed_items = borrowed_items.select_related("supply").order_by("-borrowed_at")
 
     # Get activity logs
     activity_logs = UserActivityLog.objects.filter(user=user)
@@ -244,7 +244,12 @@ def user_analytics_modal(request, user_id):
     requests = SupplyRequest.objects.filter(user=user).order_by("-created_at")
 
     # Get borrowed items
-    borrowed_items = BorrowedItem.objects.filter(borrower=user).order_by("-borrowed_at")
+    borrowed_items = (
+        BorrowedItem.objects.with_due_status()
+        .filter(borrower=user)
+        .select_related("supply")
+        .order_by("-borrowed_at")
+    )
 
     # Statistics
     total_requests = requests.count()
@@ -491,7 +496,7 @@ def export_user_analytics(request, user_id):
 
     # Get data
     requests = SupplyRequest.objects.filter(user=user)
-    borrowed_items = BorrowedItem.objects.filter(borrower=user)
+    borrowed_items = BorrowedItem.objects.with_due_status().filter(borrower=user).select_related("supply")
 
     if start and end:
         requests = requests.filter(created_at__gte=start, created_at__lte=end)
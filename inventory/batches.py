@@ -0,0 +1,163 @@
+"""
+Request batches: grouping of requests submitted together.
+
+Every SupplyRequest is attached to a RequestBatch when it is created, and
+borrowed items inherit the batch of the request they were issued from, so
+batch pages and batch actions join on an indexed foreign key instead of
+re-deriving groups from created_at. A submission creates its batch once
+(create_batch) and passes it to each request it creates. The batch keeps a denormalized status
+and item counts, recomputed here in a fixed number of queries.
+"""
+import threading
+import uuid
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q, Max, Min
+from django.utils import timezone
+
+from .models import RequestBatch, SupplyRequest, BorrowedItem
+
+SUMMARY_FIELDS = ('item_count', 'is_borrowing', 'borrowed_count', 'returned_count', 'has_issues', 'status')
+
+_pending = threading.local()
+
+
+def new_group_id(user_id):
+    """A fresh batch group id: the user id and a random token, as encoded in batch QR codes."""
+    return f"{user_id}-{uuid.uuid4().hex[:12].upper()}"
+
+
+def create_batch(user, is_borrowing=False):
+    """
+    Create the batch of one submission. Views create it once and pass it to
+    every request they create for the submission.
+    """
+    return RequestBatch.objects.create(
+        group_id=new_group_id(user.pk),
+        user=user,
+        is_borrowing=is_borrowing,
+        created_at=timezone.now(),
+    )
+
+
+def batch_for_request(supply_request):
+    """
+    The batch of a request created without one: the batch of earlier
+    requests with the same batch_group_id, otherwise a batch of its own.
+    """
+    if supply_request.batch_group_id:
+        batch = RequestBatch.objects.filter(
+            user_id=supply_request.user_id,
+            requests__batch_group_id=supply_request.batch_group_id,
+        ).first()
+        if batch is not None:
+            return batch
+    return RequestBatch.objects.create(
+        group_id=new_group_id(supply_request.user_id),
+        user_id=supply_request.user_id,
+        is_borrowing=supply_request.purpose.startswith('[BORROWING]'),
+        created_at=supply_request.created_at,
+    )
+
+
+def get_batch(group_id):
+    """The batch for a group id from a URL or QR code (tolerating a BATCH- prefix)."""
+    if 'BATCH-' in group_id:
+        group_id = group_id.split('BATCH-')[-1]
+    return RequestBatch.objects.filter(group_id=group_id).first()
+
+
+def batch_borrowed_items(group_id):
+    """
+    Borrowed items of the batch with this group id, including older items
+    linked only by their own batch_group_id (e.g. BATCH-XXXX), with or
+    without the BATCH- prefix.
+    """
+    bare = group_id.split('BATCH-')[-1]
+    group_ids = {bare, f'BATCH-{bare}'}
+    return BorrowedItem.objects.filter(Q(batch__group_id__in=group_ids) | Q(batch_group_id__in=group_ids))
+
+
+def refresh_batch_summaries(batch_ids):
+    """
+    Recompute status and counts for the given batches: three reads and one
+    UPDATE per distinct changed summary.
+    """
+    batch_ids = {batch_id for batch_id in batch_ids if batch_id}
+    if not batch_ids:
+        return
+
+    request_rows = {
+        row['batch_id']: row
+        for row in SupplyRequest.objects.filter(batch_id__in=batch_ids)
+        .values('batch_id')
+        .annotate(
+            items=Count('id'),
+            min_status=Min('status'),
+            max_status=Max('status'),
+            borrowing=Count('id', filter=Q(purpose__startswith='[BORROWING]')),
+        )
+    }
+    borrowed_rows = {
+        row['batch_id']: row
+        for row in BorrowedItem.objects.filter(batch_id__in=batch_ids)
+        .values('batch_id')
+        .annotate(
+            total=Count('id'),
+            returned=Count('id', filter=Q(returned_at__isnull=False)),
+            issues=Count('id', filter=Q(return_status__in=['damaged', 'lost'])),
+        )
+    }
+
+    # Batches with the same summary are written together, so a refresh costs
+    # one UPDATE per distinct summary rather than one per batch
+    changes = defaultdict(list)
+    current = RequestBatch.objects.filter(id__in=batch_ids).values('id', *SUMMARY_FIELDS)
+    for batch in current:
+        requests = request_rows.get(batch['id'], {})
+        borrowed = borrowed_rows.get(batch['id'], {})
+        summary = {
+            'item_count': requests.get('items', 0),
+            'is_borrowing': bool(requests.get('borrowing')),
+            'borrowed_count': borrowed.get('total', 0),
+            'returned_count': borrowed.get('returned', 0),
+            'has_issues': bool(borrowed.get('issues')),
+        }
+        if requests.get('min_status') == requests.get('max_status'):
+            summary['status'] = requests.get('min_status') or 'pending'
+        else:
+            summary['status'] = 'mixed'
+        if summary['is_borrowing'] and summary['borrowed_count'] and summary['returned_count']:
+            if summary['returned_count'] < summary['borrowed_count']:
+                summary['status'] = 'partially_returned'
+            else:
+                summary['status'] = 'returned_with_issues' if summary['has_issues'] else 'returned'
+
+        summary = tuple(summary[field] for field in SUMMARY_FIELDS)
+        if summary != tuple(batch[field] for field in SUMMARY_FIELDS):
+            changes[summary].append(batch['id'])
+
+    now = timezone.now()
+    for summary, ids in changes.items():
+        RequestBatch.objects.filter(id__in=ids).update(updated_at=now, **dict(zip(SUMMARY_FIELDS, summary)))
+
+
+def _flush_pending():
+    batch_ids = getattr(_pending, 'batch_ids', set())
+    _pending.batch_ids = set()
+    refresh_batch_summaries(batch_ids)
+
+
+def schedule_batch_refresh(batch_id):
+    """
+    Refresh a batch summary once the current transaction commits. The first
+    callback to run refreshes every batch touched so far, so many saves to
+    one batch in a transaction cost a single refresh.
+    """
+    if not batch_id:
+        return
+    if not hasattr(_pending, 'batch_ids'):
+        _pending.batch_ids = set()
+    _pending.batch_ids.add(batch_id)
+    transaction.on_commit(_flush_pending)
@@ -0,0 +1,62 @@
+"""
+Cache keys and invalidation helpers for values read on every page render.
+
+Entries are dropped by the signal handlers in ``inventory.signals`` whenever
+the underlying rows change, and code paths that bypass signals
+(``bulk_create``/``update``) call the invalidation helpers directly.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+NOTIFICATION_COUNTER_TIMEOUT = getattr(settings, 'NOTIFICATION_COUNTER_CACHE_TIMEOUT', 300)
+
+LOW_STOCK_SUMMARY_KEY = 'inventory:low_stock_summary'
+OVERDUE_SUMMARY_KEY = 'inventory:overdue_summary'
+
+
+def user_notifications_key(user_id):
+    return f'inventory:user_notifications:{user_id}'
+
+
+def invalidate_user_notifications(user_ids):
+    """Drop the cached unread notification summary for the given users."""
+    keys = [user_notifications_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_low_stock_summary():
+    cache.delete(LOW_STOCK_SUMMARY_KEY)
+
+
+def invalidate_overdue_summary():
+    cache.delete(OVERDUE_SUMMARY_KEY)
+
+
+DASHBOARD_SNAPSHOT_TIMEOUT = getattr(settings, 'DASHBOARD_SNAPSHOT_CACHE_TIMEOUT', 60)
+DASHBOARD_VERSION_KEY = 'inventory:dashboard_version'
+
+
+def _dashboard_version():
+    version = cache.get(DASHBOARD_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(DASHBOARD_VERSION_KEY, version, None)
+        version = cache.get(DASHBOARD_VERSION_KEY, version)
+    return version
+
+
+def dashboard_snapshot_key(user):
+    """
+    Admins share one snapshot; GSO staff and department users see
+    user-specific lists, so their snapshots are keyed per user.
+    """
+    scope = 'admin' if user.role == 'admin' else f'{user.role}:{user.pk}'
+    return f'inventory:dashboard:{_dashboard_version()}:{scope}'
+
+
+def invalidate_dashboard_snapshots():
+    """Retire every cached dashboard snapshot by rotating the key version."""
+    cache.set(DASHBOARD_VERSION_KEY, uuid.uuid4().hex, None)
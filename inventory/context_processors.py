@@ -1,33 +1,95 @@
-from .models import Notification
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import (
+    NOTIFICATION_COUNTER_TIMEOUT,
+    LOW_STOCK_SUMMARY_KEY,
+    OVERDUE_SUMMARY_KEY,
+    user_notifications_key,
+)
+from .models import Notification, Supply, BorrowedItem
+from .utils import STAFF_ROLES, unread_broadcasts
+
+UNREAD_PREVIEW_LIMIT = 6
+LOW_STOCK_PREVIEW_LIMIT = 5
+
+
+def _unread_summary(unread_qs):
+    latest = list(unread_qs[:UNREAD_PREVIEW_LIMIT])
+    # A short preview already tells us the full count
+    count = len(latest) if len(latest) < UNREAD_PREVIEW_LIMIT else unread_qs.count()
+    return count, latest
+
+
+def _user_notification_summary(user):
+    """Unread personal notifications merged with unread staff broadcasts."""
+    count, latest = _unread_summary(
+        Notification.objects.filter(recipient=user, is_read=False)
+    )
+    broadcast_count, broadcast_latest = _unread_summary(unread_broadcasts(user))
+    latest = sorted(latest + broadcast_latest, key=lambda note: note.created_at, reverse=True)
+    return {'count': count + broadcast_count, 'latest': latest[:UNREAD_PREVIEW_LIMIT]}
+
+
+def _low_stock_summary():
+    low_stock_qs = Supply.objects.filter(quantity__lte=F('min_stock_level'))
+    return {
+        'count': low_stock_qs.count(),
+        'latest': list(low_stock_qs[:LOW_STOCK_PREVIEW_LIMIT]),
+    }
+
+
+def _overdue_summary(today):
+    overdue_qs = BorrowedItem.objects.filter(
+        returned_at__isnull=True,
+        return_deadline__isnull=False,
+        return_deadline__lt=today
+    )
+    return {'date': today, 'count': overdue_qs.count()}
 
 
 def unread_notifications(request):
-    """Context processor that provides unread notifications for the logged-in user."""
+    """
+    Context processor that provides unread notifications for the logged-in user.
+
+    Counters are served from the cache and rebuilt only after the signal
+    handlers invalidate them, so a normal render issues no extra queries.
+    """
     if not request.user or not request.user.is_authenticated:
         return {}
 
-    unread_qs = Notification.objects.filter(recipient=request.user, is_read=False)
-    
+    user_key = user_notifications_key(request.user.pk)
+    is_staff = request.user.role in STAFF_ROLES
+    keys = [user_key, LOW_STOCK_SUMMARY_KEY, OVERDUE_SUMMARY_KEY] if is_staff else [user_key]
+    cached = cache.get_many(keys)
+    to_cache = {}
+
+    user_summary = cached.get(user_key)
+    if user_summary is None:
+        user_summary = to_cache[user_key] = _user_notification_summary(request.user)
+
     context = {
-        'unread_notifications_count': unread_qs.count(),
-        'unread_notifications': unread_qs[:6],
+        'unread_notifications_count': user_summary['count'],
+        'unread_notifications': user_summary['latest'],
     }
 
     # Add low stock and overdue info for staff
-    if request.user.role in ['admin', 'gso_staff']:
-        from .models import Supply, BorrowedItem
-        from django.db.models import F
-        from django.utils import timezone
-        
-        low_stock_qs = Supply.objects.filter(quantity__lte=F('min_stock_level'))
-        context['low_stock_count'] = low_stock_qs.count()
-        context['low_stock_items_global'] = low_stock_qs[:5]
-        
-        overdue_qs = BorrowedItem.objects.filter(
-            returned_at__isnull=True,
-            return_deadline__isnull=False,
-            return_deadline__lt=timezone.now().date()
-        )
-        context['overdue_count'] = overdue_qs.count()
+    if is_staff:
+        low_stock = cached.get(LOW_STOCK_SUMMARY_KEY)
+        if low_stock is None:
+            low_stock = to_cache[LOW_STOCK_SUMMARY_KEY] = _low_stock_summary()
+        context['low_stock_count'] = low_stock['count']
+        context['low_stock_items_global'] = low_stock['latest']
+
+        # Overdue status changes with the calendar day, not only on writes
+        today = timezone.now().date()
+        overdue = cached.get(OVERDUE_SUMMARY_KEY)
+        if overdue is None or overdue['date'] != today:
+            overdue = to_cache[OVERDUE_SUMMARY_KEY] = _overdue_summary(today)
+        context['overdue_count'] = overdue['count']
+
+    if to_cache:
+        cache.set_many(to_cache, NOTIFICATION_COUNTER_TIMEOUT)
 
     return context
@@ -0,0 +1,98 @@
+"""
+Data service for the dashboard view.
+
+Counters are computed with one conditional-aggregation query per model and
+list widgets are fetched with their related rows, so rendering the dashboard
+does not lazy-load users or supplies per row. The resulting role-specific
+snapshot is cached briefly and retired early by the signal handlers whenever
+requests, stock or borrow records change.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .caching import DASHBOARD_SNAPSHOT_TIMEOUT, dashboard_snapshot_key
+from .models import Supply, SupplyRequest, BorrowedItem
+from .utils import get_user_overdue_items
+
+LIST_LIMIT = 10
+
+
+def _supply_counters():
+    return Supply.objects.aggregate(
+        total_supplies=Count('id'),
+        low_stock_count=Count('id', filter=Q(quantity__lte=F('min_stock_level'))),
+    )
+
+
+def _request_counters(requests):
+    return requests.aggregate(
+        total_requests=Count('id'),
+        pending_requests_count=Count('id', filter=Q(status='pending')),
+    )
+
+
+def _staff_widgets():
+    open_items = BorrowedItem.objects.filter(
+        returned_at__isnull=True
+    ).select_related('supply', 'borrower')
+    return {
+        'low_stock_items': list(
+            Supply.objects.filter(quantity__lte=F('min_stock_level'))
+            .select_related('category')[:LIST_LIMIT]
+        ),
+        'recently_borrowed': list(open_items.order_by('-borrowed_at')[:LIST_LIMIT]),
+        'overdue_items_list': list(
+            open_items.filter(return_deadline__lt=timezone.now().date())
+            .order_by('return_deadline')[:LIST_LIMIT]
+        ),
+    }
+
+
+def build_dashboard_snapshot(user):
+    """Compute the dashboard context for ``user`` straight from the database."""
+    snapshot = _supply_counters()
+
+    if user.role == 'admin':
+        snapshot.update(_request_counters(SupplyRequest.objects.all()))
+        snapshot['recent_requests'] = list(
+            SupplyRequest.objects.select_related('user', 'supply')
+            .order_by('-created_at')[:LIST_LIMIT]
+        )
+        snapshot.update(_staff_widgets())
+    elif user.role == 'gso_staff':
+        requests = SupplyRequest.objects.select_related('user', 'supply')
+        snapshot.update(_request_counters(SupplyRequest.objects.all()))
+        snapshot['gso_pending_requests'] = list(
+            requests.filter(status='pending').order_by('-created_at')[:LIST_LIMIT]
+        )
+        snapshot['recent_approvals'] = list(
+            requests.filter(approved_by=user).order_by('-approved_at')[:5]
+        )
+        snapshot.update(_staff_widgets())
+    else:  # department_user
+        # For department users, only show their own requests
+        user_requests = SupplyRequest.objects.filter(user=user)
+        snapshot.update(_request_counters(user_requests))
+        snapshot['my_requests'] = list(
+            user_requests.select_related('user', 'supply').order_by('-created_at')[:LIST_LIMIT]
+        )
+        snapshot['my_borrowed_items'] = list(
+            BorrowedItem.objects.filter(borrower=user, returned_at__isnull=True)
+            .select_related('supply').order_by('-borrowed_at')[:LIST_LIMIT]
+        )
+        overdue_items = list(get_user_overdue_items(user))
+        snapshot['overdue_items'] = overdue_items
+        snapshot['has_overdue_items'] = bool(overdue_items)
+
+    return snapshot
+
+
+def get_dashboard_snapshot(user):
+    """Return the cached dashboard context for ``user``, building it on a miss."""
+    key = dashboard_snapshot_key(user)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_dashboard_snapshot(user)
+        cache.set(key, snapshot, DASHBOARD_SNAPSHOT_TIMEOUT)
+    return snapshot
@@ -0,0 +1,126 @@
+"""
+In-process, database-backed event broker for the Server-Sent Events stream.
+
+A single poller task per process reads rows newer than its cursors from the
+Notification, BroadcastNotification and QRScanLog tables (one indexed
+``id > cursor`` query per table per tick) and fans the events out to the
+subscribed connections. No external message service is needed, and the
+database cost is per process rather than per connected browser.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Notification, BroadcastNotification, QRScanLog
+
+POLL_INTERVAL = getattr(settings, 'EVENT_STREAM_POLL_INTERVAL', 2)
+QUEUE_SIZE = 100
+FETCH_LIMIT = 200
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, user_id, is_staff):
+        self.user_id = user_id
+        self.is_staff = is_staff
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def wants(self, event):
+        if event['type'] == 'notification':
+            return event['recipient_id'] == self.user_id
+        # Staff broadcasts and scanner activity are only for admin/GSO staff
+        return self.is_staff
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client should not hold up the others; it will
+            # resync from the page on its next reload.
+            pass
+
+
+class EventBroker:
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.subscriptions = set()
+        self.cursors = None
+        self._task = None
+
+    def subscribe(self, user_id, is_staff):
+        subscription = Subscription(user_id, is_staff)
+        self.subscriptions.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    async def _run(self):
+        failing = False
+        while self.subscriptions:
+            try:
+                events = await sync_to_async(self.fetch_new_events)()
+                failing = False
+            except Exception:
+                # Logged once per run of failures rather than on every tick
+                if not failing:
+                    logger.warning("Event stream poll failed", exc_info=True)
+                failing = True
+                events = []
+            for event in events:
+                for subscription in list(self.subscriptions):
+                    if subscription.wants(event):
+                        subscription.push(event)
+            await asyncio.sleep(self.poll_interval)
+        # Forget the position once nobody listens; the next subscriber
+        # starts from the newest rows instead of replaying the backlog.
+        self.cursors = None
+
+    def fetch_new_events(self):
+        """Return events for rows created since the previous call."""
+        sources = {
+            'notification': Notification.objects.all(),
+            'broadcast': BroadcastNotification.objects.all(),
+            'scan': QRScanLog.objects.all(),
+        }
+        if self.cursors is None:
+            self.cursors = {
+                name: qs.order_by('-id').values_list('id', flat=True).first() or 0
+                for name, qs in sources.items()
+            }
+            return []
+
+        events = []
+        for row in (
+            sources['notification'].filter(id__gt=self.cursors['notification'])
+            .order_by('id')
+            .values('id', 'recipient_id', 'title', 'message', 'url', 'level', 'created_at')[:FETCH_LIMIT]
+        ):
+            events.append({'type': 'notification', 'recipient_id': row.pop('recipient_id'), 'data': row})
+            self.cursors['notification'] = row['id']
+
+        for row in (
+            sources['broadcast'].filter(id__gt=self.cursors['broadcast'])
+            .order_by('id')
+            .values('id', 'title', 'message', 'url', 'level', 'created_at')[:FETCH_LIMIT]
+        ):
+            events.append({'type': 'broadcast', 'data': row})
+            self.cursors['broadcast'] = row['id']
+
+        for row in (
+            sources['scan'].filter(id__gt=self.cursors['scan'])
+            .order_by('id')
+            .values('id', 'action', 'location', 'timestamp', 'supply__name', 'scanned_by__username')[:FETCH_LIMIT]
+        ):
+            events.append({'type': 'scan', 'data': row})
+            self.cursors['scan'] = row['id']
+
+        return events
+
+
+broker = EventBroker()
@@ -0,0 +1,120 @@
+"""
+Idempotency keys for state-changing POSTs.
+
+Handheld scanners on flaky Wi-Fi resend a POST when its response is lost,
+and executing it twice releases or returns stock twice. Views wrapped in
+``idempotent`` accept an ``Idempotency-Key`` header: the first request with
+a key claims it and its response is stored in IdempotencyKey; a retry with
+the same key gets the stored response back without the view running again.
+Requests without the header are handled as before.
+
+Keys are scoped to the user and expire after IDEMPOTENCY_KEY_TTL seconds;
+``manage.py prune_idempotency_keys`` deletes expired rows.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+MAX_KEY_LENGTH = 255
+
+# Headers kept with a stored response; the rest are regenerated on replay
+STORED_HEADERS = ('Content-Type', 'Location')
+
+
+def request_hash(request):
+    """Fingerprint of a request, so a key reused for a different request is caught."""
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """
+    Insert the in-progress row for a key. Returns the row and whether this
+    request claimed it; an unclaimed row belongs to an earlier request.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.filter(user=user, key=key, expires_at__lte=now).delete()
+            record = IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                request_hash=fingerprint,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.response_body), status=record.status_code)
+    for header, value in record.response_headers.items():
+        response[header] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _store(record_id, response):
+    IdempotencyKey.objects.filter(pk=record_id).update(
+        status_code=response.status_code,
+        response_body=response.content,
+        response_headers={header: response[header] for header in STORED_HEADERS if response.has_header(header)},
+    )
+
+
+def idempotent(view):
+    """
+    Replay the stored response of a POST retried with the same
+    Idempotency-Key. Place it below login_required: keys belong to a user.
+
+    A key still being processed answers 409 and a key reused with a
+    different request answers 422. Server errors and exceptions release the
+    key so the request can be retried; streamed responses are not stored.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}, status=400
+            )
+
+        fingerprint = request_hash(request)
+        record, claimed = _claim(request.user, key, fingerprint)
+        if not claimed:
+            if record is not None and record.request_hash != fingerprint:
+                return JsonResponse(
+                    {'error': 'Idempotency-Key was already used for a different request'}, status=422
+                )
+            if record is None or record.status_code is None:
+                return JsonResponse(
+                    {'error': 'A request with this Idempotency-Key is still being processed'}, status=409
+                )
+            return _replay(record)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        else:
+            _store(record.pk, response)
+        return response
+
+    return wrapper
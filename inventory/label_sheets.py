@@ -0,0 +1,160 @@
+"""
+Streaming multi-up label sheets for equipment instances.
+
+reportlab's canvas keeps every page in memory until ``save()``, so a sheet of
+ten thousand tags would be built in full before the first byte is sent.
+Instead this module writes the (very small) PDF structure itself: each page
+is a compressed content stream of vector QR codes and base-14 text that is
+yielded as soon as it is drawn, and only the object offsets are kept until
+the cross-reference table is written at the end.
+"""
+import zlib
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from .qr_pdf import qr_rects
+from .qr_rendering import instance_qr_data
+
+DEFAULT_COLUMNS = 3
+DEFAULT_ROWS = 8
+MAX_COLUMNS = 6
+MAX_ROWS = 14
+PAGE_MARGIN = 8 * mm
+LABEL_PADDING = 2.5 * mm
+
+# Fixed object numbers; pages are numbered from FIRST_PAGE_OBJECT upwards
+CATALOG, PAGES, FONT_REGULAR, FONT_BOLD, RESOURCES = 1, 2, 3, 4, 5
+FIRST_PAGE_OBJECT = 6
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+
+
+def _pdf_text(text):
+    """A PDF string literal; latin-1 round-trips the cp1252 bytes into the stream."""
+    encoded = text.encode('cp1252', errors='replace').decode('latin-1')
+    return '(' + encoded.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def _fit(text, font, size, width):
+    """Truncate text with an ellipsis so it fits the given width."""
+    if stringWidth(text, FONTS[font], size) <= width:
+        return text
+    while text and stringWidth(text + '...', FONTS[font], size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def _label_ops(label, x, y, width, height):
+    """Content-stream operators for one label cell with its lower-left corner at (x, y)."""
+    ops = [f'0.85 G 0.3 w {x:.2f} {y:.2f} {width:.2f} {height:.2f} re S']
+
+    qr_size = min(height - 2 * LABEL_PADDING, width * 0.45)
+    qr_x = x + LABEL_PADDING
+    qr_y = y + (height - qr_size) / 2
+    ops.append('0 g')
+    ops.extend(
+        f'{rx:.2f} {ry:.2f} {rw:.2f} {rh:.2f} re'
+        for rx, ry, rw, rh in qr_rects(instance_qr_data(label['id']), qr_x, qr_y, qr_size)
+    )
+    ops.append('f')
+
+    text_x = qr_x + qr_size + LABEL_PADDING
+    text_width = x + width - LABEL_PADDING - text_x
+    details = ' '.join(part for part in (label['brand'], label['model_name']) if part)
+    lines = [
+        ('F2', 9, label['instance_code']),
+        ('F1', 7, label['supply__name']),
+        ('F1', 7, details),
+    ]
+    line_y = y + height / 2 + 9
+    for font, size, text in lines:
+        if text:
+            text = _pdf_text(_fit(text, font, size, text_width))
+            ops.append(f'BT /{font} {size} Tf {text_x:.2f} {line_y:.2f} Td {text} Tj ET')
+        line_y -= size + 3
+    return ops
+
+
+class LabelSheetWriter:
+    """Lay out labels ``columns`` x ``rows`` per A4 page and stream the PDF."""
+
+    def __init__(self, columns=DEFAULT_COLUMNS, rows=DEFAULT_ROWS):
+        self.columns = columns
+        self.rows = rows
+        self.page_width, self.page_height = A4
+        self.cell_width = (self.page_width - 2 * PAGE_MARGIN) / columns
+        self.cell_height = (self.page_height - 2 * PAGE_MARGIN) / rows
+
+    def _page_ops(self, labels):
+        ops = []
+        for index, label in enumerate(labels):
+            row, col = divmod(index, self.columns)
+            x = PAGE_MARGIN + col * self.cell_width
+            y = self.page_height - PAGE_MARGIN - (row + 1) * self.cell_height
+            ops.extend(_label_ops(label, x, y, self.cell_width, self.cell_height))
+        return ops
+
+    def stream(self, labels):
+        """
+        Yield the PDF in pieces. ``labels`` is any iterable of dicts with id,
+        instance_code, supply__name, brand and model_name; it is consumed one
+        page at a time.
+        """
+        offsets = {}
+        position = 0
+
+        def emit(number, body):
+            nonlocal position
+            offsets[number] = position
+            chunk = f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+            position += len(chunk)
+            return chunk
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position = len(header)
+        yield header
+        yield emit(CATALOG, f'<< /Type /Catalog /Pages {PAGES} 0 R >>'.encode())
+        for number, base_font in zip((FONT_REGULAR, FONT_BOLD), FONTS.values()):
+            yield emit(
+                number,
+                f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /Encoding /WinAnsiEncoding >>'.encode(),
+            )
+        yield emit(RESOURCES, f'<< /Font << /F1 {FONT_REGULAR} 0 R /F2 {FONT_BOLD} 0 R >> >>'.encode())
+
+        per_page = self.columns * self.rows
+        page_objects = []
+        next_object = FIRST_PAGE_OBJECT
+        page = []
+        labels = iter(labels)
+        while True:
+            label = next(labels, None)
+            if label is not None:
+                page.append(label)
+            if page and (label is None or len(page) == per_page):
+                content = zlib.compress('\n'.join(self._page_ops(page)).encode('latin-1'))
+                content_object, page_object = next_object, next_object + 1
+                next_object += 2
+                yield emit(
+                    content_object,
+                    f'<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n'.encode()
+                    + content + b'\nendstream',
+                )
+                yield emit(
+                    page_object,
+                    f'<< /Type /Page /Parent {PAGES} 0 R /Resources {RESOURCES} 0 R '
+                    f'/MediaBox [0 0 {self.page_width:.4f} {self.page_height:.4f}] '
+                    f'/Contents {content_object} 0 R >>'.encode(),
+                )
+                page_objects.append(page_object)
+                page = []
+            if label is None:
+                break
+
+        kids = ' '.join(f'{number} 0 R' for number in page_objects)
+        yield emit(PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_objects)} >>'.encode())
+
+        xref = [f'xref\n0 {next_object}\n', '0000000000 65535 f \n']
+        xref.extend(f'{offsets[number]:010d} 00000 n \n' for number in range(1, next_object))
+        xref.append(f'trailer\n<< /Size {next_object} /Root {CATALOG} 0 R >>\nstartxref\n{position}\n%%EOF\n')
+        yield ''.join(xref).encode()
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from inventory.models import (
+    ArchivedNotification, BroadcastNotification, Notification, NotificationReceipt,
+)
+
+ARCHIVED_FIELDS = ['id', 'recipient_id', 'title', 'message', 'url', 'level', 'dedupe_key', 'created_at']
+
+
+class Command(BaseCommand):
+    help = ('Move read notifications older than the retention period into the archive table '
+            'and purge resolved staff broadcasts with their read receipts')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=90,
+            help='Archive read notifications older than this many days (default: 90)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of notifications moved per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many notifications would be archived',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(days=options['days'])
+        expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+        # Active broadcasts are never purged; their receipts still hide them
+        # from staff who already read them.
+        resolved = BroadcastNotification.objects.filter(is_active=False, resolved_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'{expired.count()} read notifications older than {cutoff:%Y-%m-%d} would be archived.'
+            )
+            receipts = NotificationReceipt.objects.filter(broadcast__in=resolved).count()
+            self.stdout.write(
+                f'{resolved.count()} resolved broadcasts and {receipts} read receipts would be purged.'
+            )
+            return
+
+        archived = 0
+        while True:
+            # Each chunk is copied and deleted atomically so an interrupted run
+            # never loses or duplicates notifications.
+            with transaction.atomic():
+                rows = list(expired.order_by('id').values(*ARCHIVED_FIELDS)[:options['chunk_size']])
+                if not rows:
+                    break
+                ArchivedNotification.objects.bulk_create([
+                    ArchivedNotification(**{k: v for k, v in row.items() if k != 'id'})
+                    for row in rows
+                ])
+                Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            archived += len(rows)
+            self.stdout.write(f'  Archived {archived} notifications...')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {archived} read notifications older than {cutoff:%Y-%m-%d}.')
+        )
+
+        broadcasts = receipts = 0
+        while True:
+            with transaction.atomic():
+                ids = list(resolved.order_by('id').values_list('id', flat=True)[:options['chunk_size']])
+                if not ids:
+                    break
+                receipts += NotificationReceipt.objects.filter(broadcast_id__in=ids).delete()[0]
+                broadcasts += BroadcastNotification.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Purged {broadcasts} resolved broadcasts and {receipts} read receipts.')
+        )
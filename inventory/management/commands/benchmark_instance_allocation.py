@@ -0,0 +1,196 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from inventory.allocation import allocate_instances, reserve_instances
+from inventory.models import (
+    BorrowedItem, EquipmentInstance, QRCode, RequestBatch, Supply, SupplyCategory, SupplyRequest, User,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Release borrow requests for one scratch supply from parallel threads and check '
+        'that no equipment instance is allocated twice or against a reservation'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of threads releasing at the same time (default: 8)',
+        )
+        parser.add_argument(
+            '--instances',
+            type=int,
+            default=100,
+            help='Number of equipment instances of the scratch supply (default: 100)',
+        )
+        parser.add_argument(
+            '--releases',
+            type=int,
+            default=None,
+            help='Number of one-unit borrow requests to release; defaults to a quarter more '
+                 'than --instances so allocation runs out under contention',
+        )
+        parser.add_argument(
+            '--reserved',
+            type=int,
+            default=None,
+            help='Instances held for a pending request that the releases must not take '
+                 '(default: a tenth of --instances)',
+        )
+        parser.add_argument(
+            '--legacy',
+            action='store_true',
+            help="Allocate with the old unlocked filter(status='available') pattern for comparison",
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the scratch supply, its instances and requests afterwards',
+        )
+
+    def handle(self, *args, **options):
+        workers, instance_count = options['workers'], options['instances']
+        releases = options['releases'] if options['releases'] is not None else instance_count * 5 // 4
+        reserved = options['reserved'] if options['reserved'] is not None else instance_count // 10
+        staff = User.objects.filter(role__in=['admin', 'gso_staff']).first()
+        borrower = User.objects.filter(role='department_user').first() or staff
+        if staff is None:
+            raise CommandError('An admin or GSO staff user is needed to perform the releases.')
+
+        category, _ = SupplyCategory.objects.get_or_create(name='Benchmark')
+        supply = Supply.objects.create(
+            name=f'Instance allocation benchmark {int(time.time())}',
+            description='Scratch supply created by benchmark_instance_allocation',
+            category=category,
+            quantity=instance_count,
+            is_consumable=False,
+        )
+        prefix = f'BENCH-{uuid.uuid4().hex[:6].upper()}'
+        EquipmentInstance.objects.bulk_create([
+            EquipmentInstance(supply=supply, instance_code=f'{prefix}-{index:05d}')
+            for index in range(instance_count)
+        ])
+        request_ids = [self._request(supply, borrower, 'approved').pk for _ in range(releases)]
+        holder = self._request(supply, borrower, 'pending', quantity=reserved)
+        held = {reservation.equipment_instance_id for reservation in reserve_instances([holder], staff)}
+
+        release = self._release_legacy if options['legacy'] else self._release
+        outcomes = {'allocated': 0, 'unallocated': 0, 'conflict': 0, 'error': 0}
+        lock = threading.Lock()
+
+        def run(ids):
+            try:
+                for request_id in ids:
+                    outcome = release(request_id)
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        shares = [request_ids[index::workers] for index in range(workers)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, shares))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{releases} releases by {workers} workers in {elapsed:.2f}s '
+            f'({releases / elapsed:.0f}/s): {outcomes["allocated"]} allocated an instance, '
+            f'{outcomes["unallocated"]} found none free, {outcomes["conflict"]} hit the '
+            f'open-borrow constraint, {outcomes["error"]} errors'
+        )
+        problems = self._check(supply.pk, instance_count, held, outcomes['allocated'])
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(f'  {problem}'))
+        if not problems:
+            self.stdout.write(self.style.SUCCESS(
+                f'No instance allocated twice; the {len(held)} reserved instances were left alone.'
+            ))
+
+        if not options['keep']:
+            batch_ids = list(
+                SupplyRequest.objects.filter(supply=supply, batch__isnull=False).values_list('batch_id', flat=True)
+            )
+            QRCode.objects.filter(target_type='supply', target_id=supply.pk).delete()
+            supply.delete()
+            RequestBatch.objects.filter(pk__in=batch_ids, requests__isnull=True).delete()
+
+    def _request(self, supply, borrower, status, quantity=1):
+        return SupplyRequest.objects.create(
+            user=borrower,
+            supply=supply,
+            quantity_requested=quantity,
+            purpose='[BORROWING] Instance allocation benchmark',
+            status=status,
+        )
+
+    def _borrowed_item(self, req, instance):
+        return BorrowedItem(
+            supply_id=req.supply_id,
+            supply_request=req,
+            equipment_instance=instance,
+            borrower_id=req.user_id,
+            borrowed_date=timezone.now().date(),
+            notes=f'Benchmark release - Instance: {instance.instance_code}',
+        )
+
+    def _release(self, request_id):
+        try:
+            with transaction.atomic():
+                req = SupplyRequest.objects.select_for_update().get(pk=request_id)
+                instances = allocate_instances([req])[req.pk]
+                if not instances:
+                    return 'unallocated'
+                BorrowedItem.objects.bulk_create([self._borrowed_item(req, instance) for instance in instances])
+        except IntegrityError:
+            return 'conflict'
+        except Exception as e:
+            self.stderr.write(f'  {type(e).__name__}: {e}')
+            return 'error'
+        return 'allocated'
+
+    def _release_legacy(self, request_id):
+        try:
+            req = SupplyRequest.objects.get(pk=request_id)
+            instance = EquipmentInstance.objects.filter(supply_id=req.supply_id, status='available').first()
+            if instance is None:
+                return 'unallocated'
+            BorrowedItem.objects.bulk_create([self._borrowed_item(req, instance)])
+            instance.status = 'borrowed'
+            instance.save()
+        except IntegrityError:
+            return 'conflict'
+        except Exception as e:
+            self.stderr.write(f'  {type(e).__name__}: {e}')
+            return 'error'
+        return 'allocated'
+
+    def _check(self, supply_id, instance_count, held, allocated):
+        """Compare open borrows, instance statuses and reservations against the allocations."""
+        problems = []
+        open_borrows = BorrowedItem.objects.filter(supply_id=supply_id, returned_at__isnull=True)
+        doubled = (
+            open_borrows.values('equipment_instance').annotate(borrows=Count('id')).filter(borrows__gt=1).count()
+        )
+        if doubled:
+            problems.append(f'{doubled} instances are on more than one open borrow')
+        if open_borrows.count() != allocated:
+            problems.append(f'{open_borrows.count()} open borrows for {allocated} allocations')
+        if allocated > instance_count - len(held):
+            problems.append(f'{allocated} allocations from {instance_count - len(held)} unreserved instances')
+        borrowed = EquipmentInstance.objects.filter(supply_id=supply_id, status='borrowed').count()
+        if borrowed != allocated:
+            problems.append(f'{borrowed} instances marked borrowed for {allocated} allocations')
+        taken = open_borrows.filter(equipment_instance__in=held).count()
+        if taken:
+            problems.append(f'{taken} reserved instances were allocated to other requests')
+        return problems
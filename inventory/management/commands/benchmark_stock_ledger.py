@@ -0,0 +1,153 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from inventory.models import InventoryTransaction, QRCode, Supply, SupplyCategory, User
+from inventory.stock_ledger import StockLedger, InsufficientStock
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire parallel stock releases at a scratch supply and check that the final '
+        'quantity and the InventoryTransaction ledger agree'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of threads releasing at the same time (default: 8)',
+        )
+        parser.add_argument(
+            '--releases',
+            type=int,
+            default=200,
+            help='Total number of releases of one unit each (default: 200)',
+        )
+        parser.add_argument(
+            '--stock',
+            type=int,
+            default=None,
+            help='Starting quantity; defaults to three quarters of --releases so the '
+                 'non-negative guard is exercised',
+        )
+        parser.add_argument(
+            '--legacy',
+            action='store_true',
+            help='Release with the old read, subtract and save() pattern for comparison',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the scratch supply and its transactions afterwards',
+        )
+
+    def handle(self, *args, **options):
+        workers, releases = options['workers'], options['releases']
+        stock = options['stock'] if options['stock'] is not None else releases * 3 // 4
+        user = User.objects.filter(role='admin').first()
+        if user is None:
+            raise CommandError('An admin user is needed to perform the releases.')
+
+        category, _ = SupplyCategory.objects.get_or_create(name='Benchmark')
+        supply = Supply.objects.create(
+            name=f'Stock ledger benchmark {int(time.time())}',
+            description='Scratch supply created by benchmark_stock_ledger',
+            category=category,
+            quantity=stock,
+        )
+        release = self._release_legacy if options['legacy'] else self._release
+        outcomes = {'released': 0, 'insufficient': 0, 'error': 0}
+        lock = threading.Lock()
+
+        def run(count):
+            try:
+                for _ in range(count):
+                    outcome = release(supply.pk, user)
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        shares = [releases // workers + (1 if i < releases % workers else 0) for i in range(workers)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, shares))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{releases} releases by {workers} workers in {elapsed:.2f}s '
+            f'({releases / elapsed:.0f}/s): {outcomes["released"]} released, '
+            f'{outcomes["insufficient"]} refused for insufficient stock, {outcomes["error"]} errors'
+        )
+        problems = self._check(supply.pk, stock, outcomes['released'])
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(f'  {problem}'))
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('Final quantity and ledger are consistent.'))
+
+        if not options['keep']:
+            QRCode.objects.filter(target_type='supply', target_id=supply.pk).delete()
+            supply.delete()
+
+    def _release(self, supply_id, user):
+        try:
+            StockLedger(user).remove(Supply.objects.get(pk=supply_id), 1, 'Benchmark release')
+        except InsufficientStock:
+            return 'insufficient'
+        except Exception as e:
+            self.stderr.write(f'  {type(e).__name__}: {e}')
+            return 'error'
+        return 'released'
+
+    def _release_legacy(self, supply_id, user):
+        try:
+            supply = Supply.objects.get(pk=supply_id)
+            if supply.quantity < 1:
+                return 'insufficient'
+            previous_quantity = supply.quantity
+            supply.quantity -= 1
+            supply.save()
+            InventoryTransaction.objects.create(
+                supply=supply,
+                transaction_type='out',
+                quantity=-1,
+                previous_quantity=previous_quantity,
+                new_quantity=supply.quantity,
+                reason='Benchmark release (legacy)',
+                performed_by=user,
+            )
+        except Exception as e:
+            self.stderr.write(f'  {type(e).__name__}: {e}')
+            return 'error'
+        return 'released'
+
+    def _check(self, supply_id, stock, released):
+        """Compare the final quantity and the ledger against the successful releases."""
+        problems = []
+        final = Supply.objects.values_list('quantity', flat=True).get(pk=supply_id)
+        if final != stock - released:
+            problems.append(f'Final quantity is {final}, expected {stock - released}')
+
+        entries = list(
+            InventoryTransaction.objects.filter(supply_id=supply_id)
+            .order_by('id')
+            .values_list('quantity', 'previous_quantity', 'new_quantity')
+        )
+        if len(entries) != released:
+            problems.append(f'{len(entries)} ledger rows for {released} releases')
+        expected_previous = stock
+        for index, (quantity, previous, new) in enumerate(entries):
+            if previous != expected_previous or new != previous + quantity:
+                problems.append(
+                    f'Ledger row {index} goes {previous} -> {new} ({quantity:+d}), '
+                    f'expected to start at {expected_previous}'
+                )
+                break
+            expected_previous = new
+        if entries and expected_previous != final:
+            problems.append(f'Ledger ends at {expected_previous}, supply is at {final}')
+        return problems
@@ -184,7 +184,6 @@ class Command(BaseCommand):
                     approved_by=gso,
                     approved_at=timezone.now(),
                 )
-                req.generate_borrowing_qr_code()
                 self.stdout.write(self.style.SUCCESS(f"Created APPROVED request: {supply.name} x{qty} (Ready for QR issue)"))
         
         self.stdout.write("\n" + "=" * 60)
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from inventory.models import QRRenderJob
+from inventory.qr_pipeline import QR_RENDER_STALE_AFTER, requeue_stale_jobs, run_qr_render_job
+
+
+class Command(BaseCommand):
+    help = 'Render QR labels for queued QR render jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=5,
+            help='Seconds to wait between polls for new jobs (default: 5)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=QR_RENDER_STALE_AFTER,
+            help='Requeue jobs left running for longer than this many seconds '
+                 f'(default: {QR_RENDER_STALE_AFTER})',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs currently queued and exit',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs(options['stale_after'])
+            if requeued:
+                self.stdout.write(f'Requeued {requeued} stale running job(s)')
+            pending = list(
+                QRRenderJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+            )
+            for job_id in pending:
+                if run_qr_render_job(job_id):
+                    job = QRRenderJob.objects.get(pk=job_id)
+                    self.stdout.write(
+                        f'Job #{job.pk}: {job.status}, {job.completed}/{job.total} rendered, {job.failed} failed'
+                    )
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
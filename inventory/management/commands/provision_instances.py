@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import Supply, User
+from inventory.provisioning import provision_instances, read_serials
+
+
+class Command(BaseCommand):
+    help = (
+        'Create equipment instances for a supply in bulk, with consecutive codes and '
+        'optional serial numbers from a CSV; QR labels are queued for process_qr_jobs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('supply_id', type=int, help='Supply to create instances for')
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=None,
+            help='Number of instances to create (ignored with --serials)',
+        )
+        parser.add_argument(
+            '--serials',
+            default=None,
+            help='CSV file with one serial number per row in the first column',
+        )
+        parser.add_argument('--brand', default='', help='Brand applied to every instance')
+        parser.add_argument('--model', default='', help='Model name applied to every instance')
+
+    def handle(self, *args, **options):
+        try:
+            supply = Supply.objects.get(pk=options['supply_id'])
+        except Supply.DoesNotExist:
+            raise CommandError(f"Supply {options['supply_id']} does not exist.")
+
+        started = time.perf_counter()
+        try:
+            serials = None
+            if options['serials']:
+                with open(options['serials'], 'rb') as upload:
+                    serials = read_serials(upload)
+            instances, job = provision_instances(
+                supply,
+                options['count'],
+                serials,
+                brand=options['brand'],
+                model_name=options['model'],
+                user=User.objects.filter(role='admin').first(),
+                render_in_process=False,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(instances)} instances of {supply.name} '
+            f'({instances[0].instance_code} to {instances[-1].instance_code}) in {elapsed:.2f}s; '
+            f'QR render job #{job.pk} queued for process_qr_jobs.'
+        ))
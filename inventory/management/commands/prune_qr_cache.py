@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from inventory.qr_cache import QR_CACHE_MAX_BYTES, prune_disk_cache
+
+
+class Command(BaseCommand):
+    help = 'Trim the on-disk QR label cache to a size limit, least recently used files first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            default=QR_CACHE_MAX_BYTES,
+            help=f'Size the cache is trimmed to (default: {QR_CACHE_MAX_BYTES})',
+        )
+
+    def handle(self, *args, **options):
+        removed, freed = prune_disk_cache(options['max_bytes'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {removed} cached QR labels ({freed / 1024 / 1024:.1f} MB).'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from inventory.models import QRCode, Supply, SupplyRequest, EquipmentInstance
+from inventory.qr_registry import register_codes, supply_codes, instance_codes, request_codes
+
+
+class Command(BaseCommand):
+    help = 'Register the QR payloads of existing supplies, instances and requests for indexed scan lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of rows registered per insert (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        before = QRCode.objects.count()
+
+        sources = [
+            (Supply.objects.values_list('id', 'name'), supply_codes),
+            (EquipmentInstance.objects.values_list('id', flat=True), instance_codes),
+            (
+                SupplyRequest.objects.values_list('id', 'user_id', 'supply_id', 'purpose', 'created_at', 'batch__group_id'),
+                request_codes,
+            ),
+        ]
+        for rows, build in sources:
+            codes = []
+            for row in rows.order_by('id').iterator(chunk_size=chunk_size):
+                codes.extend(build(*row) if isinstance(row, tuple) else build(row))
+                if len(codes) >= chunk_size:
+                    register_codes(codes)
+                    codes = []
+            register_codes(codes)
+
+        self.stdout.write(f'Registered {QRCode.objects.count() - before} QR codes.')
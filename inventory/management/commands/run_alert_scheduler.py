@@ -0,0 +1,76 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from ...utils import (
+    ensure_low_stock_notifications,
+    ensure_overdue_notifications,
+    check_overdue_borrowed_items,
+    acquire_scheduler_lock,
+    release_scheduler_lock,
+)
+
+JOB_NAME = 'staff_alert_reconciliation'
+
+
+class Command(BaseCommand):
+    help = 'Periodically reconcile low-stock/overdue staff notifications and borrower due-date alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='Seconds between reconciliation runs (default: 300)',
+        )
+        parser.add_argument(
+            '--lock-ttl',
+            type=int,
+            default=600,
+            help='Seconds before a lock held by a crashed worker expires (default: 600)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single reconciliation pass and exit',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Alert scheduler started as {owner} (interval: {interval}s)')
+        )
+
+        while True:
+            self.run_pass(owner, interval, options['lock_ttl'])
+            if options['once']:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
+
+    def run_pass(self, owner, interval, lock_ttl):
+        # Another worker may already be running, or may have run within the
+        # interval; in both cases the watermark/lock tells us to skip.
+        if not acquire_scheduler_lock(JOB_NAME, owner, lock_ttl, min_interval_seconds=interval):
+            self.stdout.write('Skipped: another worker holds the lock or ran recently.')
+            return
+
+        result = None
+        try:
+            low_stock_created = ensure_low_stock_notifications()
+            overdue_created = ensure_overdue_notifications()
+            borrower_alerts = check_overdue_borrowed_items()
+            result = (
+                f'{low_stock_created} low-stock, {overdue_created} overdue notifications created; '
+                f'{borrower_alerts} borrower due-date alerts sent'
+            )
+            self.stdout.write(self.style.SUCCESS(result))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'Reconciliation failed: {e}'))
+        finally:
+            release_scheduler_lock(JOB_NAME, owner, result)
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.models import InventorySnapshot
+from inventory.snapshots import period_start, take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Record every supply's stock and value at the start of the current day or month, "
+        'for point-in-time stock queries (run daily from cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period',
+            choices=['daily', 'monthly'],
+            default='daily',
+            help='Snapshot the start of the day or of the month (default: daily)',
+        )
+        parser.add_argument(
+            '--date',
+            default=None,
+            help='Snapshot the period containing this date (YYYY-MM-DD) instead of the current one',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=90,
+            help='Delete daily snapshots older than this many days; monthly ones are kept (default: 90)',
+        )
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format.')
+            if day > timezone.localdate():
+                raise CommandError('Cannot snapshot a future date.')
+
+        period = options['period']
+        written = take_snapshots(period, day)
+        as_of = period_start(period, day or timezone.localdate())
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} {period} snapshots as of {timezone.localtime(as_of):%Y-%m-%d %H:%M}.'
+        ))
+
+        cutoff = timezone.now() - timedelta(days=options['keep_days'])
+        deleted, _ = InventorySnapshot.objects.filter(period='daily', as_of__lt=cutoff).delete()
+        if deleted:
+            self.stdout.write(f'Deleted {deleted} daily snapshots older than {options["keep_days"]} days.')
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:08
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_low_stock_dedupe_keys(apps, schema_editor):
+    """Key existing unread low-stock alerts by the supply id in their URL"""
+    Notification = apps.get_model('inventory', 'Notification')
+
+    pending = Notification.objects.filter(
+        is_read=False,
+        dedupe_key__isnull=True,
+        title__startswith='Low Stock Alert: ',
+        url__startswith='/supplies/',
+    ).only('id', 'url')
+
+    to_update = []
+    for notification in pending.iterator():
+        match = re.match(r'^/supplies/(\d+)/$', notification.url or '')
+        if match:
+            notification.dedupe_key = f"low_stock:{match.group(1)}"
+            to_update.append(notification)
+    Notification.objects.bulk_update(to_update, ['dedupe_key'], batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0030_link_borrowed_items_to_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='dedupe_key',
+            field=models.CharField(blank=True, help_text="Stable key identifying the event (e.g. 'low_stock:12') used to avoid duplicate unread alerts", max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['dedupe_key', 'recipient', 'is_read'], name='inventory_n_dedupe__850880_idx'),
+        ),
+        migrations.RunPython(backfill_low_stock_dedupe_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0032_schedulerstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audience', models.CharField(choices=[('staff', 'Admin and GSO Staff')], default='staff', max_length=20)),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('url', models.CharField(blank=True, max_length=400, null=True)),
+                ('level', models.CharField(choices=[('info', 'Info'), ('warning', 'Warning'), ('error', 'Error')], default='info', max_length=20)),
+                ('dedupe_key', models.CharField(help_text="Stable key identifying the event (e.g. 'low_stock:12')", max_length=100)),
+                ('is_active', models.BooleanField(default=True, help_text='Cleared once the alert condition no longer holds')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['audience', 'is_active', 'created_at'], name='inventory_b_audienc_885453_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('dedupe_key',), name='unique_active_broadcast_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(auto_now_add=True)),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='inventory.broadcastnotification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_receipts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'broadcast'), name='unique_receipt_per_user')],
+            },
+        ),
+    ]
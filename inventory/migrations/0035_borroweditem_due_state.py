@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:14
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_due_states(apps, schema_editor):
+    """Start open loans in their current state so existing alerts are not resent"""
+    BorrowedItem = apps.get_model('inventory', 'BorrowedItem')
+    today = timezone.now().date()
+    open_items = BorrowedItem.objects.filter(
+        returned_at__isnull=True, return_deadline__isnull=False
+    )
+    open_items.filter(return_deadline__lt=today).update(due_state='overdue')
+    open_items.filter(
+        return_deadline__gte=today,
+        return_deadline__lte=today + datetime.timedelta(days=1),
+    ).update(due_state='due_soon')
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0034_notification_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borroweditem',
+            name='due_state',
+            field=models.CharField(choices=[('on_time', 'On Time'), ('due_soon', 'Due Soon'), ('overdue', 'Overdue')], default='on_time', help_text='Last due state the borrower was notified about (advanced by check_overdue_items)', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='borroweditem',
+            index=models.Index(condition=models.Q(('returned_at__isnull', True)), fields=['due_state', 'return_deadline'], name='borrow_open_due_state'),
+        ),
+        migrations.RunPython(backfill_due_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0036_qr_render_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QRCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.CharField(max_length=255, unique=True)),
+                ('target_type', models.CharField(choices=[('supply', 'Supply'), ('instance', 'Equipment Instance'), ('request', 'Request'), ('batch', 'Request Batch')], max_length=20)),
+                ('target_id', models.PositiveIntegerField(blank=True, help_text='Supply, instance or request id', null=True)),
+                ('batch_group_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'QR Code',
+                'verbose_name_plural': 'QR Codes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='supplyrequest',
+            index=models.Index(fields=['user', 'created_at'], name='request_user_created'),
+        ),
+        migrations.AddField(
+            model_name='qrcode',
+            name='user',
+            field=models.ForeignKey(blank=True, help_text='Requester of request and batch codes', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='qr_codes', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,181 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:32
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def batch_group_key(user_id, created_at):
+    """Group id of a batch: a user's requests created within the same minute (frozen copy)"""
+    return f"{user_id}-{created_at.strftime('%Y%m%d%H%M')}"
+
+
+def _refresh_batch_summaries(RequestBatch, SupplyRequest, BorrowedItem, batch_ids):
+    """Compute status and counts of the given batches (frozen copy of inventory.batches)"""
+    request_rows = {
+        row['batch_id']: row
+        for row in SupplyRequest.objects.filter(batch_id__in=batch_ids)
+        .values('batch_id')
+        .annotate(
+            items=Count('id'),
+            min_status=Min('status'),
+            max_status=Max('status'),
+            borrowing=Count('id', filter=Q(purpose__startswith='[BORROWING]')),
+        )
+    }
+    borrowed_rows = {
+        row['batch_id']: row
+        for row in BorrowedItem.objects.filter(batch_id__in=batch_ids)
+        .values('batch_id')
+        .annotate(
+            total=Count('id'),
+            returned=Count('id', filter=Q(returned_at__isnull=False)),
+            issues=Count('id', filter=Q(return_status__in=['damaged', 'lost'])),
+        )
+    }
+
+    changes = defaultdict(list)
+    for batch_id in batch_ids:
+        requests = request_rows.get(batch_id, {})
+        borrowed = borrowed_rows.get(batch_id, {})
+        summary = {
+            'item_count': requests.get('items', 0),
+            'is_borrowing': bool(requests.get('borrowing')),
+            'borrowed_count': borrowed.get('total', 0),
+            'returned_count': borrowed.get('returned', 0),
+            'has_issues': bool(borrowed.get('issues')),
+        }
+        if requests.get('min_status') == requests.get('max_status'):
+            summary['status'] = requests.get('min_status') or 'pending'
+        else:
+            summary['status'] = 'mixed'
+        if summary['is_borrowing'] and summary['borrowed_count'] and summary['returned_count']:
+            if summary['returned_count'] < summary['borrowed_count']:
+                summary['status'] = 'partially_returned'
+            else:
+                summary['status'] = 'returned_with_issues' if summary['has_issues'] else 'returned'
+        changes[tuple(sorted(summary.items()))].append(batch_id)
+
+    for summary, ids in changes.items():
+        RequestBatch.objects.filter(id__in=ids).update(**dict(summary))
+
+
+def _keyset_chunks(queryset, *fields):
+    """Yield rows of (id, *fields) in id order, one chunk per query"""
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:BACKFILL_CHUNK_SIZE]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _attach_requests(RequestBatch, SupplyRequest, assignments, new_batches):
+    """Create the batches of one chunk and point its requests at them"""
+    RequestBatch.objects.bulk_create(new_batches.values(), ignore_conflicts=True)
+    batch_ids = dict(
+        RequestBatch.objects.filter(group_id__in={group_id for _, group_id in assignments})
+        .values_list('group_id', 'id')
+    )
+    requests_by_batch = defaultdict(list)
+    for pk, group_id in assignments:
+        requests_by_batch[batch_ids[group_id]].append(pk)
+    for batch_id, pks in requests_by_batch.items():
+        SupplyRequest.objects.filter(pk__in=pks).update(batch_id=batch_id)
+
+
+def backfill_request_batches(apps, schema_editor):
+    """
+    Group existing requests into batches the way they were grouped before:
+    by user and creation minute, keeping requests that share a batch_group_id
+    together. Borrowed items then follow their request, or their own
+    batch_group_id when they have no request.
+    """
+    RequestBatch = apps.get_model('inventory', 'RequestBatch')
+    SupplyRequest = apps.get_model('inventory', 'SupplyRequest')
+    BorrowedItem = apps.get_model('inventory', 'BorrowedItem')
+
+    shared_groups = {}
+    for rows in _keyset_chunks(SupplyRequest.objects.all(), 'user_id', 'batch_group_id', 'purpose', 'created_at'):
+        assignments, new_batches = [], {}
+        for pk, user_id, shared_id, purpose, created_at in rows:
+            group_id = shared_groups.get((user_id, shared_id)) if shared_id else None
+            if group_id is None:
+                group_id = batch_group_key(user_id, created_at)
+                if shared_id:
+                    shared_groups[(user_id, shared_id)] = group_id
+            if group_id not in new_batches:
+                new_batches[group_id] = RequestBatch(
+                    group_id=group_id,
+                    user_id=user_id,
+                    is_borrowing=purpose.startswith('[BORROWING]'),
+                    created_at=created_at.replace(second=0, microsecond=0),
+                )
+            assignments.append((pk, group_id))
+        _attach_requests(RequestBatch, SupplyRequest, assignments, new_batches)
+
+    BorrowedItem.objects.filter(batch__isnull=True, supply_request__isnull=False).update(
+        batch_id=Subquery(SupplyRequest.objects.filter(pk=OuterRef('supply_request_id')).values('batch_id')[:1])
+    )
+    BorrowedItem.objects.filter(batch__isnull=True, batch_group_id__isnull=False).update(
+        batch_id=Subquery(RequestBatch.objects.filter(group_id=OuterRef('batch_group_id')).values('id')[:1])
+    )
+
+    for rows in _keyset_chunks(RequestBatch.objects.all()):
+        _refresh_batch_summaries(RequestBatch, SupplyRequest, BorrowedItem, [batch_id for batch_id, in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0037_qr_code_registry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_id', models.CharField(max_length=100, unique=True)),
+                ('is_borrowing', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('released', 'Released'), ('rejected', 'Rejected'), ('returned', 'Returned'), ('partially_returned', 'Partially Returned'), ('returned_with_issues', 'Returned with Issues'), ('mixed', 'Mixed')], default='pending', max_length=20)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('borrowed_count', models.PositiveIntegerField(default=0, help_text='Borrowed item records issued for the batch')),
+                ('returned_count', models.PositiveIntegerField(default=0)),
+                ('has_issues', models.BooleanField(default=False, help_text='Any borrowed item returned damaged or lost')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='request_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='borroweditem',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='borrowed_items', to='inventory.requestbatch'),
+        ),
+        migrations.AddField(
+            model_name='supplyrequest',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='requests', to='inventory.requestbatch'),
+        ),
+        migrations.AddIndex(
+            model_name='requestbatch',
+            index=models.Index(fields=['user', '-created_at'], name='batch_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='requestbatch',
+            index=models.Index(fields=['status', '-created_at'], name='batch_status_created'),
+        ),
+        migrations.RunPython(backfill_request_batches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:39
+
+import django.db.models.deletion
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BACKFILL_CHUNK_SIZE = 2000
+GROUP_NOTE = re.compile(r"\(Group: (.*?)\)")
+REQUEST_NOTE = re.compile(r"\(REQ: (.*?)\)")
+
+
+def backfill_scan_groups(apps, schema_editor):
+    """Move the group and request ids written into scan notes into their columns"""
+    QRScanLog = apps.get_model('inventory', 'QRScanLog')
+    SupplyRequest = apps.get_model('inventory', 'SupplyRequest')
+    tagged = QRScanLog.objects.filter(
+        models.Q(notes__contains='(Group: ') | models.Q(notes__contains='(REQ: ')
+    )
+
+    last_id = 0
+    while True:
+        rows = list(tagged.filter(id__gt=last_id).order_by('id').values_list('id', 'notes')[:BACKFILL_CHUNK_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        by_group, by_request = defaultdict(list), defaultdict(list)
+        for pk, notes in rows:
+            group = GROUP_NOTE.search(notes)
+            if group:
+                by_group[group.group(1)].append(pk)
+            request = REQUEST_NOTE.search(notes)
+            if request:
+                by_request[request.group(1)].append(pk)
+
+        for group_id, pks in by_group.items():
+            QRScanLog.objects.filter(pk__in=pks).update(batch_group_id=group_id)
+        request_ids = dict(
+            SupplyRequest.objects.filter(request_id__in=by_request).values_list('request_id', 'id')
+        )
+        for request_id, pks in by_request.items():
+            if request_id in request_ids:
+                QRScanLog.objects.filter(pk__in=pks).update(supply_request_id=request_ids[request_id])
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0038_request_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrscanlog',
+            name='batch_group_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Group id of the batch the scan was part of; scans sharing it are shown as one entry', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='qrscanlog',
+            name='supply_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scan_logs', to='inventory.supplyrequest'),
+        ),
+        migrations.AddIndex(
+            model_name='qrscanlog',
+            index=models.Index(fields=['scanned_by', '-timestamp'], name='scan_user_timestamp'),
+        ),
+        migrations.RunPython(backfill_scan_groups, migrations.RunPython.noop),
+    ]
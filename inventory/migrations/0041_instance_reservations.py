@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def detach_duplicate_open_borrows(apps, schema_editor):
+    """
+    Leave only the newest open borrow linked to an instance that several
+    open borrows point at, so the unique constraint can be added
+    """
+    BorrowedItem = apps.get_model('inventory', 'BorrowedItem')
+
+    duplicated = (
+        BorrowedItem.objects.filter(returned_at__isnull=True, equipment_instance__isnull=False)
+        .values('equipment_instance')
+        .annotate(open_borrows=Count('id'))
+        .filter(open_borrows__gt=1)
+        .values_list('equipment_instance', flat=True)
+    )
+    for instance_id in list(duplicated):
+        older = BorrowedItem.objects.filter(
+            equipment_instance_id=instance_id, returned_at__isnull=True
+        ).order_by('-borrowed_at', '-id')[1:]
+        for item in older:
+            note = f"Unlinked from instance {instance_id}: a newer open borrow holds it"
+            item.notes = f"{item.notes}\n\n{note}" if item.notes else note
+            item.equipment_instance_id = None
+            item.save(update_fields=['equipment_instance', 'notes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0040_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstanceReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(detach_duplicate_open_borrows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='borroweditem',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned_at__isnull', True)), fields=('equipment_instance',), name='unique_open_borrow_per_instance'),
+        ),
+        migrations.AddField(
+            model_name='instancereservation',
+            name='equipment_instance',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='inventory.equipmentinstance'),
+        ),
+        migrations.AddField(
+            model_name='instancereservation',
+            name='reserved_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='instance_reservations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='instancereservation',
+            name='supply_request',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='inventory.supplyrequest'),
+        ),
+        migrations.AddConstraint(
+            model_name='instancereservation',
+            constraint=models.UniqueConstraint(fields=('equipment_instance',), name='unique_instance_reservation'),
+        ),
+    ]
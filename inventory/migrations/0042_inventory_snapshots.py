@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0041_instance_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('daily', 'Daily'), ('monthly', 'Monthly')], max_length=10)),
+                ('as_of', models.DateTimeField(help_text='Stock after every transaction recorded before this instant')),
+                ('quantity', models.PositiveIntegerField()),
+                ('cost_per_unit', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-as_of'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['created_at', 'supply'], name='transaction_created_supply'),
+        ),
+        migrations.AddField(
+            model_name='inventorysnapshot',
+            name='supply',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.supply'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorysnapshot',
+            index=models.Index(fields=['as_of', 'supply'], name='snapshot_as_of_supply'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventorysnapshot',
+            constraint=models.UniqueConstraint(fields=('supply', 'period', 'as_of'), name='unique_supply_snapshot'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:16
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_qr_labels(apps, schema_editor):
+    """Carry over which label each request was last issued from its stored PNG"""
+    SupplyRequest = apps.get_model('inventory', 'SupplyRequest')
+    SupplyRequest.objects.filter(borrowing_qr_code__icontains='batch').update(qr_label='batch')
+    SupplyRequest.objects.filter(Q(borrowing_qr_code='') | Q(borrowing_qr_code__isnull=True)).update(qr_label='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0043_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplyrequest',
+            name='qr_label',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('request', 'Request label'), ('batch', 'Batch label')], default='request', help_text='QR label issued to the requester, rendered on demand at /qr/<kind>/<key>.png', max_length=10),
+        ),
+        migrations.RunPython(backfill_qr_labels, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='supplyrequest',
+            name='borrowing_qr_code',
+        ),
+    ]
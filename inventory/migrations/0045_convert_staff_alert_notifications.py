@@ -0,0 +1,44 @@
+from django.db import migrations
+
+STAFF_ROLES = ['admin', 'gso_staff']
+LEGACY_PREFIXES = ('low_stock:', 'overdue:')
+
+
+def convert_staff_alerts(apps, schema_editor):
+    """Fold the old per-user low stock / overdue rows into staff broadcasts"""
+    Notification = apps.get_model('inventory', 'Notification')
+    BroadcastNotification = apps.get_model('inventory', 'BroadcastNotification')
+
+    legacy = Notification.objects.none()
+    for prefix in LEGACY_PREFIXES:
+        legacy |= Notification.objects.filter(
+            dedupe_key__startswith=prefix, recipient__role__in=STAFF_ROLES
+        )
+
+    active = set(BroadcastNotification.objects.filter(
+        audience='staff', is_active=True
+    ).values_list('dedupe_key', flat=True))
+    # Still-unread alerts become one broadcast per key; the next reconcile
+    # resolves any whose condition has since cleared.
+    seen = set()
+    for row in legacy.filter(is_read=False).order_by('-created_at').iterator():
+        if row.dedupe_key in active or row.dedupe_key in seen:
+            continue
+        seen.add(row.dedupe_key)
+        BroadcastNotification.objects.create(
+            audience='staff', title=row.title, message=row.message, url=row.url,
+            level=row.level, dedupe_key=row.dedupe_key, is_active=True,
+        )
+
+    legacy.filter(is_read=False).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0044_request_qr_label'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_staff_alerts, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,24 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from .qr_rendering import render_supply_label, render_instance_label, label_digest
 from django.utils import timezone
 import math
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from PIL import Image, ImageDraw
+from django.core.files.base import ContentFile
 import uuid
 from datetime import datetime
 
+
+def qr_image_url(kind, key, row):
+    """
+    URL of the on-demand QR label (inventory.qr_cache). The content digest is
+    part of the URL so the image can be cached for a long time and still be
+    refreshed as soon as the data it is drawn from changes.
+    """
+    return f"{reverse('qr_image', args=[kind, key])}?v={label_digest(kind, row)[:16]}"
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
@@ -91,42 +100,61 @@ class Supply(models.Model):
     
     def generate_qr_code(self):
         if not self.qr_code:
-            qr_data = f"SUPPLY-{self.id}-{self.name}"
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert PIL image to RGB if it's not already
-            img = img.convert('RGB') if hasattr(img, 'convert') else img
-            
-            # Get the size of the QR code image
-            img_width, img_height = img.size
-            
-            # Create a canvas with enough space for the QR code and text
-            canvas_width = max(300, img_width + 100)
-            canvas_height = img_height + 100
-            canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
-            draw = ImageDraw.Draw(canvas)
-            
-            # Center the QR code on the canvas
-            x_offset = (canvas_width - img_width) // 2
-            y_offset = 20
-            canvas.paste(img, (x_offset, y_offset))
-            
-            # Add supply name and ID
-            text_y = y_offset + img_height + 10
-            draw.text((20, text_y), f"{self.name[:30]}...", fill='black')
-            draw.text((20, text_y + 20), f"ID: {self.id}", fill='black')
-            
-            buffer = BytesIO()
-            canvas.save(buffer, 'PNG')
-            buffer.seek(0)
-            
+            png = render_supply_label(self.id, self.name)
             filename = f'supply_{self.id}_qr.png'
-            self.qr_code.save(filename, File(buffer), save=False)
-            self.save()
+            self.qr_code.save(filename, ContentFile(png), save=False)
+            self.save(update_fields=['qr_code'])
+
+    @property
+    def qr_image_url(self):
+        return qr_image_url('supply', self.pk, {'id': self.pk, 'name': self.name})
+
+class RequestBatch(models.Model):
+    """
+    Requests a user submits together (created within the same minute). The
+    group_id is the "<user id>-<YYYYmmddHHMM>" key used in batch URLs, batch
+    QR codes and BorrowedItem.batch_group_id. Status and counts are a
+    denormalized summary kept current by inventory.batches.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('approved', 'Approved'),
+        ('released', 'Released'),
+        ('rejected', 'Rejected'),
+        ('returned', 'Returned'),
+        ('partially_returned', 'Partially Returned'),
+        ('returned_with_issues', 'Returned with Issues'),
+        ('mixed', 'Mixed'),
+    ]
+
+    group_id = models.CharField(max_length=100, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='request_batches')
+    is_borrowing = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    item_count = models.PositiveIntegerField(default=0)
+    borrowed_count = models.PositiveIntegerField(default=0, help_text="Borrowed item records issued for the batch")
+    returned_count = models.PositiveIntegerField(default=0)
+    has_issues = models.BooleanField(default=False, help_text="Any borrowed item returned damaged or lost")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='batch_user_created'),
+            models.Index(fields=['status', '-created_at'], name='batch_status_created'),
+        ]
+
+    def __str__(self):
+        return f"Batch {self.group_id} ({self.item_count} items)"
+
+    @property
+    def display_status(self):
+        if self.is_borrowing and self.borrowed_count and self.returned_count:
+            if self.returned_count < self.borrowed_count:
+                return f"{self.returned_count}/{self.borrowed_count} Returned"
+        return self.get_status_display()
+
 
 class SupplyRequest(models.Model):
     STATUS_CHOICES = [
@@ -151,14 +179,24 @@ class SupplyRequest(models.Model):
     released_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='released_requests')
     released_at = models.DateTimeField(null=True, blank=True)
     rejected_reason = models.TextField(blank=True, null=True)
-    borrowing_qr_code = models.ImageField(upload_to='borrowing_qr_codes/', blank=True, null=True)
+    QR_LABEL_CHOICES = [
+        ('', 'None'),
+        ('request', 'Request label'),
+        ('batch', 'Batch label'),
+    ]
+    qr_label = models.CharField(max_length=10, choices=QR_LABEL_CHOICES, default='request', blank=True, help_text="QR label issued to the requester, rendered on demand at /qr/<kind>/<key>.png")
     requested_location = models.CharField(max_length=200, blank=True, null=True, help_text='Location where the requester intends to use the equipment')
     batch_group_id = models.CharField(max_length=100, blank=True, null=True, db_index=True, help_text="ID to group requests submitted together")
+    batch = models.ForeignKey(RequestBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='requests')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Batch QR codes address a user's requests within one minute
+            models.Index(fields=['user', 'created_at'], name='request_user_created'),
+        ]
     
     def __str__(self):
         return f"Request {self.request_id} - {self.supply.name}"
@@ -168,72 +206,48 @@ class SupplyRequest(models.Model):
             self.request_id = f"REQ-{timezone.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
         super().save(*args, **kwargs)
     
-    def generate_borrowing_qr_code(self, group_id=None):
-        """
-        Generate a QR code for requests. Supports single and batch requests,
-        both for borrowing and consumable supplies.
-        """
-        is_borrowing = self.purpose.startswith('[BORROWING]')
-        prefix = "BORROW" if is_borrowing else "SUPPLY-REQ"
-        
-        # Create QR code data
-        if group_id:
-            qr_data = f"{prefix}-BATCH-{group_id}"
-            label_id = f"Batch: {group_id}"
-        else:
-            qr_data = f"{prefix}-{self.id}-{self.user.id}-{self.supply.id}"
-            label_id = f"Request ID: {self.request_id}"
-        
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=20, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert PIL image to RGB if it's not already
-        img = img.convert('RGB') if hasattr(img, 'convert') else img
-        
-        # Get the size of the QR code image
-        img_width, img_height = img.size
-        
-        # Create a canvas with enough space for the QR code and text
-        canvas_width = max(500, img_width + 100)
-        canvas_height = img_height + (150 if not group_id else 120)
-        canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
-        draw = ImageDraw.Draw(canvas)
-        
-        # Center the QR code on the canvas
-        x_offset = (canvas_width - img_width) // 2
-        y_offset = 20
-        canvas.paste(img, (x_offset, y_offset))
-        
-        # Add request details
-        text_y = y_offset + img_height + 20
-        if group_id:
-            msg = "BATCH BORROWING REQUEST" if is_borrowing else "BATCH SUPPLY REQUEST"
-            draw.text((40, text_y), msg, fill='black')
-            draw.text((40, text_y + 25), f"Group ID: {group_id}", fill='black')
-            draw.text((40, text_y + 50), f"Requested by: {self.user.username}", fill='black')
-        else:
-            msg = "INDIVIDUAL BORROWING REQUEST" if is_borrowing else "INDIVIDUAL SUPPLY REQUEST"
-            draw.text((40, text_y), msg, fill='black')
-            draw.text((40, text_y + 25), f"Item: {self.supply.name[:30]}", fill='black')
-            draw.text((40, text_y + 50), f"Quantity: {self.quantity_requested}", fill='black')
-            draw.text((40, text_y + 75), f"Requester: {self.user.username}", fill='black')
-            draw.text((40, text_y + 100), f"ID: {self.request_id}", fill='black')
-        
-        buffer = BytesIO()
-        canvas.save(buffer, 'PNG')
-        buffer.seek(0)
-        
-        if group_id:
-            filename = f'{"borrowing" if is_borrowing else "supply"}_batch_{group_id}_qr.png'
-        else:
-            filename = f'{"borrowing" if is_borrowing else "supply"}_{self.id}_qr.png'
-            
-        self.borrowing_qr_code.save(filename, File(buffer), save=False)
-        self.save()
+    def issue_batch_qr_label(self):
+        """Switch every request of this request's batch to the batch QR label."""
+        if self.batch_id:
+            SupplyRequest.objects.filter(batch_id=self.batch_id).update(qr_label='batch')
+        self.qr_label = 'batch'
+
+    @property
+    def batch_qr_group_id(self):
+        """Group id encoded in batch QR codes: the group_id of the request's batch."""
+        if self.batch_id:
+            return self.batch.group_id
+        return self.batch_group_id
+
+    @property
+    def qr_image_url(self):
+        return qr_image_url('request', self.pk, {
+            'id': self.pk,
+            'purpose': self.purpose,
+            'user_id': self.user_id,
+            'user__username': self.user.username,
+            'supply_id': self.supply_id,
+            'supply__name': self.supply.name,
+            'quantity_requested': self.quantity_requested,
+            'request_id': self.request_id,
+        })
+
+    @property
+    def issued_qr_image_url(self):
+        """On-demand URL of the label last issued for the request."""
+        if self.qr_label == 'batch':
+            return self.batch_qr_image_url
+        return self.qr_image_url
+
+    @property
+    def batch_qr_image_url(self):
+        group_id = self.batch_qr_group_id
+        return qr_image_url('batch', group_id, {
+            'purpose': self.purpose,
+            'user_id': self.user_id,
+            'user__username': self.user.username,
+            'group_id': group_id,
+        })
 
 class QRScanLog(models.Model):
     ACTION_CHOICES = [
@@ -248,9 +262,15 @@ class QRScanLog(models.Model):
     location = models.CharField(max_length=100, default='Unknown')
     timestamp = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True, null=True)
+    supply_request = models.ForeignKey('SupplyRequest', on_delete=models.SET_NULL, null=True, blank=True, related_name='scan_logs')
+    batch_group_id = models.CharField(max_length=100, blank=True, null=True, db_index=True,
+        help_text="Group id of the batch the scan was part of; scans sharing it are shown as one entry")
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['scanned_by', '-timestamp'], name='scan_user_timestamp'),
+        ]
     
     def __str__(self):
         return f"{self.action.upper()} - {self.supply.name} by {self.scanned_by.username}"
@@ -275,11 +295,48 @@ class InventoryTransaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Point-in-time stock sums the ledger rows between a snapshot and the date asked for
+            models.Index(fields=['created_at', 'supply'], name='transaction_created_supply'),
+        ]
     
     def __str__(self):
         return f"{self.transaction_type.upper()} - {self.supply.name} ({self.quantity})"
 
 
+class InventorySnapshot(models.Model):
+    """
+    Stock on hand and its value for one supply at the start of a day or
+    month, written by the snapshot_inventory command. Stock at any other
+    point in time is read from the nearest snapshot plus the ledger rows in
+    between (see inventory.snapshots).
+    """
+    PERIOD_CHOICES = [
+        ('daily', 'Daily'),
+        ('monthly', 'Monthly'),
+    ]
+
+    supply = models.ForeignKey(Supply, on_delete=models.CASCADE, related_name='snapshots')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    as_of = models.DateTimeField(help_text="Stock after every transaction recorded before this instant")
+    quantity = models.PositiveIntegerField()
+    cost_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
+    value = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-as_of']
+        indexes = [
+            models.Index(fields=['as_of', 'supply'], name='snapshot_as_of_supply'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['supply', 'period', 'as_of'], name='unique_supply_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.supply_id} {self.period} snapshot at {self.as_of:%Y-%m-%d}: {self.quantity}"
+
+
 class EquipmentInstance(models.Model):
     """
     Individual physical equipment item with unique QR code.
@@ -317,40 +374,215 @@ class EquipmentInstance(models.Model):
         if self.qr_code:
             return  # Already has QR code
             
-        qr_data = f"INSTANCE-{self.id}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        img = img.convert('RGB') if hasattr(img, 'convert') else img
-        
-        img_width, img_height = img.size
-        canvas_width = max(350, img_width + 100)
-        canvas_height = img_height + 120
-        canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
-        draw = ImageDraw.Draw(canvas)
-        
-        x_offset = (canvas_width - img_width) // 2
-        y_offset = 20
-        canvas.paste(img, (x_offset, y_offset))
-        
-        # Add instance details
-        text_y = y_offset + img_height + 10
-        draw.text((20, text_y), f"{self.supply.name[:25]}", fill='black')
-        draw.text((20, text_y + 20), f"Code: {self.instance_code}", fill='black')
-        if self.brand:
-            draw.text((20, text_y + 40), f"Brand: {self.brand[:20]}", fill='black')
-        if self.model_name:
-            draw.text((20, text_y + 60), f"Model: {self.model_name[:20]}", fill='black')
-        
-        buffer = BytesIO()
-        canvas.save(buffer, 'PNG')
-        buffer.seek(0)
+        png = render_instance_label(
+            self.id, self.supply.name, self.instance_code, self.brand, self.model_name
+        )
         
         filename = f'instance_{self.id}_{self.instance_code}_qr.png'
-        self.qr_code.save(filename, File(buffer), save=False)
-        self.save()
+        self.qr_code.save(filename, ContentFile(png), save=False)
+        self.save(update_fields=['qr_code'])
+
+    @property
+    def qr_image_url(self):
+        return qr_image_url('instance', self.pk, {
+            'id': self.pk,
+            'supply__name': self.supply.name,
+            'instance_code': self.instance_code,
+            'brand': self.brand,
+            'model_name': self.model_name,
+        })
+
+class QRRenderJob(models.Model):
+    """
+    A queued batch of QR label renders, processed off the request path by
+    inventory.qr_pipeline. Progress counters are updated per chunk so the
+    UI can poll them.
+    """
+    KIND_CHOICES = [
+        ('supply', 'Supply'),
+        ('instance', 'Equipment Instance'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='qr_render_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "QR Render Job"
+        verbose_name_plural = "QR Render Jobs"
+
+    def __str__(self):
+        return f"QR render job #{self.id} ({self.get_kind_display()}, {self.completed}/{self.total})"
+
+    @property
+    def progress_percent(self):
+        if not self.total:
+            return 100
+        return int((self.completed + self.failed) * 100 / self.total)
+
+
+class QRCode(models.Model):
+    """
+    Registry of issued QR payloads. A scan resolves its payload to the target
+    with one lookup on the unique payload index (see inventory.qr_registry)
+    instead of parsing it and searching for the matching rows.
+    """
+    TARGET_CHOICES = [
+        ('supply', 'Supply'),
+        ('instance', 'Equipment Instance'),
+        ('request', 'Request'),
+        ('batch', 'Request Batch'),
+    ]
+
+    payload = models.CharField(max_length=255, unique=True)
+    target_type = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    target_id = models.PositiveIntegerField(null=True, blank=True, help_text="Supply, instance or request id")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='qr_codes',
+        help_text="Requester of request and batch codes")
+    batch_group_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "QR Code"
+        verbose_name_plural = "QR Codes"
+
+    def __str__(self):
+        return f"{self.payload} -> {self.target_type}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response stored for a client-supplied Idempotency-Key, so a retried POST
+    is answered from here instead of being executed again (see
+    inventory.idempotency). A row without status_code is still in progress.
+    """
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    request_hash = models.CharField(max_length=64, help_text="SHA-256 of method, path and body")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.BinaryField(blank=True, default=b'')
+    response_headers = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+class InstanceReservation(models.Model):
+    """
+    Short-lived hold on an equipment instance for a request awaiting
+    approval or release, so the instance is not offered to or allocated for
+    anyone else (see inventory.allocation). Expired holds are ignored.
+    """
+    equipment_instance = models.ForeignKey(EquipmentInstance, on_delete=models.CASCADE, related_name='reservations')
+    supply_request = models.ForeignKey(SupplyRequest, on_delete=models.CASCADE, related_name='reservations')
+    reserved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='instance_reservations')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['equipment_instance'], name='unique_instance_reservation'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_instance_id} held for request {self.supply_request_id}"
+
+
+# Open loans due within this many days are reported as 'due_soon'
+DUE_SOON_THRESHOLD = 3
+
+DUE_STATUS_PRIORITY = {
+    'overdue': 0,
+    'due_today': 1,
+    'due_soon': 2,
+    'on_time': 3,
+    'no_deadline': 4,
+    'returned': 5,
+}
+
+
+class BorrowedItemQuerySet(models.QuerySet):
+    def with_due_status(self):
+        """
+        Annotate the due state in SQL so lists can filter, sort and paginate
+        on it: due_status_db, due_priority, is_overdue_db, days_until_due_db,
+        due_in_days_db and duration_db.
+
+        The model properties of the same name without the ``_db`` suffix
+        read these annotations when present instead of recomputing.
+        ``due_priority`` orders rows from most to least urgent.
+        """
+        now = timezone.now()
+        today = now.date()
+        open_with_deadline = models.Q(returned_at__isnull=True, return_deadline__isnull=False)
+        status_whens = [
+            models.When(returned_at__isnull=False, then=models.Value('returned')),
+            models.When(return_deadline__isnull=True, then=models.Value('no_deadline')),
+            models.When(return_deadline__lt=today, then=models.Value('overdue')),
+            models.When(return_deadline=today, then=models.Value('due_today')),
+            models.When(
+                return_deadline__lte=today + timezone.timedelta(days=DUE_SOON_THRESHOLD),
+                then=models.Value('due_soon'),
+            ),
+        ]
+        remaining = models.Case(
+            models.When(
+                open_with_deadline,
+                then=models.F('return_deadline') - models.Value(today, output_field=models.DateField()),
+            ),
+            default=None,
+            output_field=models.DurationField(),
+        )
+        return self.annotate(
+            due_status_db=models.Case(
+                *status_whens,
+                default=models.Value('on_time'),
+                output_field=models.CharField(),
+            ),
+            due_priority=models.Case(
+                *[
+                    models.When(when.condition, then=models.Value(DUE_STATUS_PRIORITY[when.result.value]))
+                    for when in status_whens
+                ],
+                default=models.Value(DUE_STATUS_PRIORITY['on_time']),
+                output_field=models.IntegerField(),
+            ),
+            is_overdue_db=models.Case(
+                models.When(open_with_deadline & models.Q(return_deadline__lt=today), then=models.Value(True)),
+                default=models.Value(False),
+                output_field=models.BooleanField(),
+            ),
+            days_until_due_db=remaining,
+            due_in_days_db=remaining,
+            duration_db=models.ExpressionWrapper(
+                Coalesce('returned_at', models.Value(now, output_field=models.DateTimeField()))
+                - models.F('borrowed_at'),
+                output_field=models.DurationField(),
+            ),
+        )
+
 
 class BorrowedItem(models.Model):
     """
@@ -383,10 +615,34 @@ class BorrowedItem(models.Model):
     borrow_duration_days = models.PositiveIntegerField(default=3, help_text="Number of days the item can be borrowed")
     batch_group_id = models.CharField(max_length=100, blank=True, null=True, db_index=True,
         help_text="Group identifier for items borrowed together in a batch")
+    batch = models.ForeignKey(RequestBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='borrowed_items')
+    DUE_STATE_CHOICES = [
+        ('on_time', 'On Time'),
+        ('due_soon', 'Due Soon'),
+        ('overdue', 'Overdue'),
+    ]
+    due_state = models.CharField(max_length=20, choices=DUE_STATE_CHOICES, default='on_time',
+        help_text="Last due state the borrower was notified about (advanced by check_overdue_items)")
     
+    objects = BorrowedItemQuerySet.as_manager()
     
     class Meta:
         ordering = ['-borrowed_at']
+        indexes = [
+            models.Index(
+                fields=['due_state', 'return_deadline'],
+                condition=models.Q(returned_at__isnull=True),
+                name='borrow_open_due_state',
+            ),
+        ]
+        constraints = [
+            # An instance can be out on one open borrow at a time
+            models.UniqueConstraint(
+                fields=['equipment_instance'],
+                condition=models.Q(returned_at__isnull=True),
+                name='unique_open_borrow_per_instance',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.supply.name} borrowed by {self.borrower.username}"
@@ -404,6 +660,8 @@ class BorrowedItem(models.Model):
     @property
     def is_overdue(self):
         """Check if the item is overdue"""
+        if 'is_overdue_db' in self.__dict__:
+            return self.is_overdue_db
         if self.is_returned or not self.return_deadline:
             return False
         today = timezone.now().date()
@@ -414,6 +672,9 @@ class BorrowedItem(models.Model):
     @property
     def days_until_due(self):
         """Calculate days until the item is due"""
+        if 'days_until_due_db' in self.__dict__:
+            remaining = self.days_until_due_db
+            return remaining.days if remaining is not None else None
         if self.is_returned or not self.return_deadline:
             return None
         # Return integer days remaining (can be 0 if due within 24h, negative if overdue)
@@ -423,6 +684,9 @@ class BorrowedItem(models.Model):
     @property
     def due_in_days(self):
         """Return remaining time until due in fractional days (float). Negative when overdue."""
+        if 'due_in_days_db' in self.__dict__:
+            remaining = self.due_in_days_db
+            return remaining.total_seconds() / 86400 if remaining is not None else None
         if self.is_returned or not self.return_deadline:
             return None
         delta = self.return_deadline - timezone.now().date()
@@ -440,6 +704,8 @@ class BorrowedItem(models.Model):
           - 'due_soon'    : due within threshold (3 days)
           - 'on_time'     : due later than threshold
         """
+        if 'due_status_db' in self.__dict__:
+            return self.due_status_db
         if self.is_returned:
             return 'returned'
         if not self.return_deadline:
@@ -453,8 +719,7 @@ class BorrowedItem(models.Model):
         if self.return_deadline == today:
             return 'due_today'
 
-        # Consider due soon when within this many days
-        DUE_SOON_THRESHOLD = 3
+        # Consider due soon when within DUE_SOON_THRESHOLD days
         if self.due_in_days is not None and self.due_in_days <= DUE_SOON_THRESHOLD:
             return 'due_soon'
 
@@ -468,6 +733,9 @@ class BorrowedItem(models.Model):
         Returns duration in seconds. If the item is still borrowed, returns
         the time elapsed since borrowing (i.e., now - borrowed_at).
         """
+        if 'duration_db' in self.__dict__:
+            elapsed = self.duration_db
+            return elapsed.total_seconds() if elapsed is not None else None
         if not self.borrowed_at:
             return None
 
@@ -517,14 +785,127 @@ class Notification(models.Model):
     url = models.CharField(max_length=400, blank=True, null=True)
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='info')
     is_read = models.BooleanField(default=False)
+    dedupe_key = models.CharField(max_length=100, blank=True, null=True,
+        help_text="Stable key identifying the event (e.g. 'low_stock:12') used to avoid duplicate unread alerts")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['dedupe_key', 'recipient', 'is_read']),
+            models.Index(
+                fields=['recipient', '-created_at'],
+                condition=models.Q(is_read=False),
+                name='notif_unread_by_recipient',
+            ),
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(is_read=True),
+                name='notif_read_by_created',
+            ),
+        ]
 
     def __str__(self):
         return f"Notification to {self.recipient.username}: {self.title}"
 
+
+class ArchivedNotification(models.Model):
+    """
+    Read notification moved out of the live table by the retention policy
+    (see the archive_notifications management command).
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    url = models.CharField(max_length=400, blank=True, null=True)
+    level = models.CharField(max_length=20, choices=Notification.LEVEL_CHOICES, default='info')
+    dedupe_key = models.CharField(max_length=100, blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Archived notification to {self.recipient.username}: {self.title}"
+
+class BroadcastNotification(models.Model):
+    """
+    A notification addressed to a whole audience (e.g. all admin/GSO staff).
+    The event is stored once; per-user read state lives in NotificationReceipt.
+    An alert stays active while its condition holds and at most one active
+    broadcast may exist per dedupe key.
+    """
+    AUDIENCE_CHOICES = [
+        ('staff', 'Admin and GSO Staff'),
+    ]
+
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES, default='staff')
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    url = models.CharField(max_length=400, blank=True, null=True)
+    level = models.CharField(max_length=20, choices=Notification.LEVEL_CHOICES, default='info')
+    dedupe_key = models.CharField(max_length=100,
+        help_text="Stable key identifying the event (e.g. 'low_stock:12')")
+    is_active = models.BooleanField(default=True, help_text="Cleared once the alert condition no longer holds")
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['audience', 'is_active', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(is_active=True),
+                name='unique_active_broadcast_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Broadcast to {self.get_audience_display()}: {self.title}"
+
+
+class NotificationReceipt(models.Model):
+    """Marks a broadcast notification as read by one user."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_receipts')
+    broadcast = models.ForeignKey(BroadcastNotification, on_delete=models.CASCADE, related_name='receipts')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'broadcast'], name='unique_receipt_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} read {self.broadcast.title}"
+
+
+class SchedulerState(models.Model):
+    """
+    Watermark and single-run lock for a periodic background job.
+    A worker may only run the job after claiming the row by moving
+    ``locked_until`` into the future, so concurrent workers never overlap.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_run_at = models.DateTimeField(null=True, blank=True, help_text="When the job last completed successfully")
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=200, blank=True, default='')
+    last_result = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Scheduler State"
+        verbose_name_plural = "Scheduler States"
+
+    def __str__(self):
+        return f"{self.name} (last run: {self.last_run_at or 'never'})"
+
 class RequestorBorrowerAnalytics(models.Model):
     """
     Tracks analytics for requestors and borrowers
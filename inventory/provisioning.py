@@ -0,0 +1,114 @@
+"""
+High-volume provisioning of equipment instances.
+
+Creating instances one create() at a time, probing for a free code in a
+Python loop, capped a bulk create at 100 units. provision_instances takes
+the next contiguous block of codes for the supply's prefix with one
+aggregate query, inserts the instances with bulk_create in chunks,
+registers their QR payloads (bulk_create skips the post_save signal that
+normally does it) and hands label rendering to the background QR pipeline.
+An optional CSV supplies one serial number per instance.
+"""
+import csv
+import io
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import IntegerField, Max
+from django.db.models.functions import Cast, Substr
+
+from .models import EquipmentInstance, Supply
+from .qr_pipeline import enqueue_qr_render
+from .qr_registry import instance_codes, register_codes
+
+MAX_INSTANCES = 10000
+CHUNK_SIZE = 1000
+# Another supply with the same prefix may take the same codes in between
+CODE_ATTEMPTS = 3
+
+SERIAL_HEADERS = {'serial', 'serial_number', 'serial number', 'serial no', 'sn'}
+
+
+def code_prefix(supply):
+    """Prefix of the generated instance codes of a supply, e.g. 'LAP' for laptops."""
+    return supply.name[:3].upper().replace(' ', '')
+
+
+def next_code_number(prefix):
+    """The number following the highest '<prefix>-<number>' code in use."""
+    last = (
+        EquipmentInstance.objects.filter(instance_code__regex=rf'^{re.escape(prefix)}-[0-9]+$')
+        .annotate(number=Cast(Substr('instance_code', len(prefix) + 2), IntegerField()))
+        .aggregate(last=Max('number'))['last']
+    )
+    return (last or 0) + 1
+
+
+def read_serials(upload):
+    """
+    Serial numbers from the first column of an uploaded CSV, skipping blank
+    rows and a header row. Raises ValueError for unreadable files and
+    duplicate serials.
+    """
+    try:
+        text = upload.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("The serial number file must be a UTF-8 CSV")
+    serials = [row[0].strip() for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    if serials and serials[0].lower() in SERIAL_HEADERS:
+        serials = serials[1:]
+
+    seen, duplicates = set(), []
+    for serial in serials:
+        if serial in seen:
+            duplicates.append(serial)
+        seen.add(serial)
+    if duplicates:
+        raise ValueError(f"Duplicate serial numbers in the file: {', '.join(duplicates[:5])}")
+    return serials
+
+
+def provision_instances(supply, count=None, serials=None, brand=None, model_name=None, user=None,
+                        render_in_process=None):
+    """
+    Create ``count`` instances of a supply, or one per serial number when
+    ``serials`` is given, with consecutive codes after the highest code in
+    use for its prefix. Returns the created instances and the QR render job
+    queued for their labels (see enqueue_qr_render for
+    ``render_in_process``). Raises ValueError for an invalid count.
+    """
+    if serials:
+        count = len(serials)
+    if not count or count < 1 or count > MAX_INSTANCES:
+        raise ValueError(f"Count must be between 1 and {MAX_INSTANCES}")
+
+    prefix = code_prefix(supply)
+    for attempt in range(CODE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                # Serializes provisioning of the same supply
+                Supply.objects.select_for_update().get(pk=supply.pk)
+                start = next_code_number(prefix)
+                instances = EquipmentInstance.objects.bulk_create(
+                    [
+                        EquipmentInstance(
+                            supply=supply,
+                            instance_code=f"{prefix}-{number:03d}",
+                            brand=brand or None,
+                            model_name=model_name or None,
+                            serial_number=serials[index] if serials else None,
+                        )
+                        for index, number in enumerate(range(start, start + count))
+                    ],
+                    batch_size=CHUNK_SIZE,
+                )
+                ids = [instance.pk for instance in instances]
+                for offset in range(0, len(ids), CHUNK_SIZE):
+                    register_codes([
+                        code for instance_id in ids[offset:offset + CHUNK_SIZE] for code in instance_codes(instance_id)
+                    ])
+                job = enqueue_qr_render('instance', ids, user, in_process=render_in_process)
+            return instances, job
+        except IntegrityError:
+            if attempt == CODE_ATTEMPTS - 1:
+                raise ValueError("Could not reserve instance codes, please try again")
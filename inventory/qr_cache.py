@@ -0,0 +1,166 @@
+"""
+On-demand QR labels for the /qr/<kind>/<key>.png endpoint.
+
+Labels are rendered from the current values of their source row instead of
+being stored per record. A rendered PNG is addressed by ``label_digest`` of
+that row, kept in a bounded in-process LRU and backed by a content-hashed
+file cache on disk, so each distinct label is drawn once no matter how many
+workers or restarts ask for it. The disk cache is kept under
+QR_CACHE_MAX_BYTES by prune_disk_cache, which drops the least recently used
+files (hits refresh a file's mtime); it runs every QR_CACHE_PRUNE_EVERY new
+files and from the prune_qr_cache command.
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Supply, SupplyRequest, EquipmentInstance
+from .qr_rendering import render_label, label_digest
+
+QR_CACHE_DIR = getattr(settings, 'QR_CACHE_DIR', os.path.join(settings.BASE_DIR, 'qr_cache'))
+QR_MEMORY_CACHE_ENTRIES = getattr(settings, 'QR_MEMORY_CACHE_ENTRIES', 256)
+QR_CACHE_MAX_BYTES = getattr(settings, 'QR_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+QR_CACHE_PRUNE_EVERY = getattr(settings, 'QR_CACHE_PRUNE_EVERY', 500)
+
+LABEL_SOURCES = {
+    'supply': (Supply, ['id', 'name']),
+    'instance': (EquipmentInstance, ['id', 'supply__name', 'instance_code', 'brand', 'model_name']),
+    'request': (
+        SupplyRequest,
+        ['id', 'purpose', 'user_id', 'user__username', 'supply_id', 'supply__name',
+         'quantity_requested', 'request_id'],
+    ),
+}
+BATCH_FIELDS = ['purpose', 'user_id', 'user__username']
+
+
+class LRUCache:
+    """A small thread-safe LRU bounded by entry count."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+memory_cache = LRUCache(QR_MEMORY_CACHE_ENTRIES)
+
+_writes = 0
+_writes_lock = threading.Lock()
+
+
+def label_row(kind, key):
+    """
+    Load the values a label is drawn from, or None if the object does not
+    exist. Batch labels are keyed by the RequestBatch group id encoded in
+    BORROW-BATCH-/SUPPLY-REQ-BATCH- codes.
+    """
+    if kind == 'batch':
+        row = (
+            SupplyRequest.objects.filter(batch__group_id=key)
+            .order_by('id')
+            .values(*BATCH_FIELDS)
+            .first()
+        )
+        if row:
+            row['group_id'] = key
+        return row
+
+    if kind not in LABEL_SOURCES or not str(key).isdigit():
+        return None
+    model, fields = LABEL_SOURCES[kind]
+    return model.objects.filter(pk=key).values(*fields).first()
+
+
+def _disk_path(digest):
+    return os.path.join(QR_CACHE_DIR, digest[:2], f'{digest}.png')
+
+
+def get_label_png(kind, row, digest=None):
+    """Return the PNG for a label row, rendering it only on a cache miss."""
+    digest = digest or label_digest(kind, row)
+
+    png = memory_cache.get(digest)
+    if png is not None:
+        return png
+
+    path = _disk_path(digest)
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        # Mark the file as recently used for prune_disk_cache
+        os.utime(path)
+    except FileNotFoundError:
+        png = render_label(kind, row)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+        _count_write()
+
+    memory_cache.set(digest, png)
+    return png
+
+
+def _count_write():
+    global _writes
+    with _writes_lock:
+        _writes += 1
+        due = _writes % QR_CACHE_PRUNE_EVERY == 0
+    if due:
+        prune_disk_cache()
+
+
+def prune_disk_cache(max_bytes=None):
+    """
+    Delete the least recently used label files until the disk cache fits in
+    ``max_bytes`` (QR_CACHE_MAX_BYTES by default). Returns the number of
+    files removed and the bytes freed.
+    """
+    max_bytes = QR_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files, total = [], 0
+    for directory, _, names in os.walk(QR_CACHE_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    removed = freed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
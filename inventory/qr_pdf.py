@@ -0,0 +1,47 @@
+"""
+QR codes drawn as vector graphics on reportlab canvases.
+
+Unlike the PNG labels in inventory.qr_rendering, nothing is rasterised or
+read from disk: the module matrix is computed with qrcode and emitted as a
+single filled path, one rectangle per horizontal run of dark modules, so
+pages stay small and print sharply at any size.
+"""
+import qrcode
+
+
+def qr_matrix(data, border=4):
+    # A fixed mask skips qrcode's trial of all eight masks, by far the most
+    # expensive step; any mask yields a valid, scannable code
+    qr = qrcode.QRCode(border=border, error_correction=qrcode.constants.ERROR_CORRECT_M, mask_pattern=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def qr_rects(data, x, y, size):
+    """Yield (x, y, width, height) for each horizontal run of dark modules."""
+    matrix = qr_matrix(data)
+    module = size / len(matrix)
+    for row_index, row in enumerate(matrix):
+        # PDF y grows upwards, matrix rows go down
+        row_y = y + size - (row_index + 1) * module
+        col = 0
+        while col < len(row):
+            if not row[col]:
+                col += 1
+                continue
+            run_start = col
+            while col < len(row) and row[col]:
+                col += 1
+            yield x + run_start * module, row_y, (col - run_start) * module, module
+
+
+def draw_qr_code(canvas, data, x, y, size):
+    """Draw a ``size`` x ``size`` QR code for ``data`` with its lower-left corner at (x, y)."""
+    path = canvas.beginPath()
+    for rect in qr_rects(data, x, y, size):
+        path.rect(*rect)
+    canvas.saveState()
+    canvas.setFillColorRGB(0, 0, 0)
+    canvas.drawPath(path, stroke=0, fill=1)
+    canvas.restoreState()
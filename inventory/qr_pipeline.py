@@ -0,0 +1,160 @@
+"""
+Background QR rendering pipeline.
+
+Bulk operations enqueue a QRRenderJob and return immediately. The job is
+run in a background thread of the web process (QR_RENDER_IN_PROCESS) or by
+the process_qr_jobs management command; rendering is spread over a process
+pool and each chunk of results is written with one bulk_update of the
+``qr_code`` column. A job left running by a runner that died is put back
+in the queue by requeue_stale_jobs once QR_RENDER_STALE_AFTER has passed.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .models import QRRenderJob, Supply, EquipmentInstance
+from .qr_rendering import render_job_item
+
+QR_RENDER_WORKERS = getattr(settings, 'QR_RENDER_WORKERS', None) or os.cpu_count() or 1
+QR_RENDER_IN_PROCESS = getattr(settings, 'QR_RENDER_IN_PROCESS', True)
+# Seconds after which a job still marked running is assumed abandoned
+QR_RENDER_STALE_AFTER = getattr(settings, 'QR_RENDER_STALE_AFTER', 15 * 60)
+CHUNK_SIZE = 50
+# Below this many labels a process pool costs more to start than it saves
+POOL_THRESHOLD = 8
+
+JOB_SOURCES = {
+    'supply': (Supply, ['id', 'name'], 'supply_{id}_qr.png'),
+    'instance': (
+        EquipmentInstance,
+        ['id', 'supply__name', 'instance_code', 'brand', 'model_name'],
+        'instance_{id}_{instance_code}_qr.png',
+    ),
+}
+
+
+def enqueue_qr_render(kind, object_ids, user=None, in_process=None):
+    """
+    Queue QR rendering for the given objects and return the job. Pass
+    ``in_process=False`` from short-lived processes to leave the job to
+    process_qr_jobs instead of a thread that would die with the process.
+    """
+    object_ids = [int(object_id) for object_id in object_ids]
+    job = QRRenderJob.objects.create(
+        kind=kind, object_ids=object_ids, total=len(object_ids), created_by=user
+    )
+    if QR_RENDER_IN_PROCESS if in_process is None else in_process:
+        # Start only once the job (and the objects it renders) are committed
+        transaction.on_commit(lambda: start_job_thread(job.pk))
+    return job
+
+
+def start_job_thread(job_id):
+    thread = threading.Thread(target=_run_in_thread, args=(job_id,), daemon=True)
+    thread.start()
+    return thread
+
+
+def _run_in_thread(job_id):
+    try:
+        run_qr_render_job(job_id)
+    finally:
+        connection.close()
+
+
+def requeue_stale_jobs(stale_after=None):
+    """
+    Put jobs that have been running for longer than ``stale_after`` seconds
+    back in the queue, their runner having died with them. Labels already
+    rendered are skipped on the next run. Returns the number requeued.
+    """
+    stale_after = QR_RENDER_STALE_AFTER if stale_after is None else stale_after
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return QRRenderJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='pending', started_at=None, completed=0, failed=0
+    )
+
+
+def run_qr_render_job(job_id):
+    """
+    Render every label of a pending job. Returns False when the job was
+    already claimed by another runner.
+    """
+    claimed = QRRenderJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = QRRenderJob.objects.get(pk=job_id)
+    model, fields, filename_pattern = JOB_SOURCES[job.kind]
+    # Objects that already have a QR code (or were deleted) are skipped
+    payloads = list(
+        model.objects.filter(id__in=job.object_ids)
+        .filter(Q(qr_code='') | Q(qr_code__isnull=True))
+        .order_by('id')
+        .values(*fields)
+    )
+    QRRenderJob.objects.filter(pk=job_id).update(
+        completed=F('completed') + (job.total - len(payloads))
+    )
+
+    try:
+        if len(payloads) < POOL_THRESHOLD:
+            _render_chunks(job, model, filename_pattern, payloads, map)
+        else:
+            workers = min(QR_RENDER_WORKERS, len(payloads))
+            # spawn keeps worker processes independent of the web server's threads
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                _render_chunks(job, model, filename_pattern, payloads, pool.map)
+    except Exception as e:
+        QRRenderJob.objects.filter(pk=job_id).update(
+            status='failed', error=str(e), finished_at=timezone.now()
+        )
+        return True
+
+    QRRenderJob.objects.filter(pk=job_id).update(status='completed', finished_at=timezone.now())
+    return True
+
+
+def _render_chunks(job, model, filename_pattern, payloads, map_fn):
+    by_id = {payload['id']: payload for payload in payloads}
+    for start in range(0, len(payloads), CHUNK_SIZE):
+        chunk = payloads[start:start + CHUNK_SIZE]
+        results = map_fn(render_job_item, [job.kind] * len(chunk), chunk)
+
+        rendered, errors = [], []
+        for object_id, png, error in results:
+            if error:
+                errors.append(f"#{object_id}: {error}")
+                continue
+            obj = model(id=object_id)
+            filename = filename_pattern.format(**by_id[object_id])
+            obj.qr_code.save(filename, ContentFile(png), save=False)
+            rendered.append(obj)
+
+        # Only the qr_code column is written; other fields are left untouched
+        model.objects.bulk_update(rendered, ['qr_code'])
+        updates = {
+            'completed': F('completed') + len(rendered),
+            'failed': F('failed') + len(errors),
+        }
+        if errors:
+            # Keep the failures of earlier chunks
+            message = "\n".join(errors)
+            updates['error'] = Case(
+                When(error='', then=Value(message)),
+                default=Concat(F('error'), Value("\n" + message)),
+                output_field=TextField(),
+            )
+        QRRenderJob.objects.filter(pk=job.pk).update(**updates)
@@ -0,0 +1,100 @@
+"""
+Registry of issued QR payloads.
+
+Every payload that is printed on a label is recorded in the QRCode table
+when its target is created, so a scan is resolved with one lookup on the
+unique payload index. Codes issued before the registry existed are parsed
+the old way once and registered on first scan (or up front with the
+register_qr_codes command).
+"""
+from .models import QRCode, Supply, SupplyRequest, EquipmentInstance
+from .qr_rendering import supply_qr_data, instance_qr_data, request_qr_data
+
+
+def supply_codes(supply_id, name):
+    payload = supply_qr_data(supply_id, name)
+    return [QRCode(payload=payload, target_type='supply', target_id=supply_id)]
+
+
+def instance_codes(instance_id):
+    payload = instance_qr_data(instance_id)
+    return [QRCode(payload=payload, target_type='instance', target_id=instance_id)]
+
+
+def request_codes(request_id, user_id, supply_id, purpose, group_id=None):
+    """The individual code of a request and the batch code of its RequestBatch."""
+    is_borrowing = purpose.startswith('[BORROWING]')
+    codes = [
+        QRCode(
+            payload=request_qr_data(is_borrowing, request_id, user_id, supply_id),
+            target_type='request', target_id=request_id, user_id=user_id, batch_group_id=group_id,
+        ),
+    ]
+    if group_id:
+        codes.append(QRCode(
+            payload=request_qr_data(is_borrowing, group_id=group_id),
+            target_type='batch', user_id=user_id, batch_group_id=group_id,
+        ))
+    return codes
+
+
+def register_codes(codes):
+    """Insert registry rows, skipping payloads that are already registered."""
+    QRCode.objects.bulk_create(codes, ignore_conflicts=True)
+
+
+def _parse_legacy_payload(payload):
+    """
+    Interpret a payload the way scans did before the registry, returning the
+    registry rows it corresponds to if its target exists. The first row is
+    always the scanned payload itself.
+    """
+    parts = payload.split('-')
+    try:
+        if payload.startswith('INSTANCE-'):
+            instance_id = int(parts[1])
+            if EquipmentInstance.objects.filter(pk=instance_id).exists():
+                return [QRCode(payload=payload, target_type='instance', target_id=instance_id)]
+        elif payload.startswith('BORROW-BATCH-') or payload.startswith('SUPPLY-REQ-BATCH-'):
+            offset = 2 if payload.startswith('BORROW-') else 3
+            group_id = f"{int(parts[offset])}-{parts[offset + 1]}"
+            code = QRCode(payload=payload, target_type='batch', user_id=int(parts[offset]), batch_group_id=group_id)
+            if batch_requests(code).exists():
+                return [code]
+        elif payload.startswith('BORROW-') or payload.startswith('SUPPLY-REQ-'):
+            offset = 1 if payload.startswith('BORROW-') else 2
+            request_id, user_id, supply_id = (int(part) for part in parts[offset:offset + 3])
+            row = (
+                SupplyRequest.objects.filter(id=request_id, user_id=user_id, supply_id=supply_id)
+                .values('purpose', 'batch__group_id')
+                .first()
+            )
+            if row:
+                codes = request_codes(request_id, user_id, supply_id, row['purpose'], row['batch__group_id'])
+                codes[0].payload = payload
+                return codes
+        else:
+            supply_id = int(parts[1]) if payload.startswith('SUPPLY-') else int(payload)
+            if Supply.objects.filter(pk=supply_id).exists():
+                return [QRCode(payload=payload, target_type='supply', target_id=supply_id)]
+    except (ValueError, IndexError):
+        pass
+    return []
+
+
+def resolve_qr_code(payload):
+    """Return the registry entry for a scanned payload, or None if it is unknown."""
+    code = QRCode.objects.filter(payload=payload).first()
+    if code is not None:
+        return code
+
+    codes = _parse_legacy_payload(payload)
+    if not codes:
+        return None
+    register_codes(codes)
+    return codes[0]
+
+
+def batch_requests(code):
+    """Requests addressed by a batch code, joined through their RequestBatch."""
+    return SupplyRequest.objects.filter(batch__group_id=code.batch_group_id).order_by('id')
@@ -0,0 +1,157 @@
+"""
+Pure QR label rendering.
+
+These functions only depend on qrcode and Pillow and take plain values, so
+they can run in worker processes (see inventory.qr_pipeline) as well as
+inline from the model helpers. Each returns the encoded PNG bytes.
+
+Labels can also be described by a plain ``row`` dict (the values() row of
+the source object), which is what the on-demand /qr/ endpoint and the
+render pipeline use; ``label_digest`` hashes such a row into the content
+address the label is cached under.
+"""
+import hashlib
+import json
+from io import BytesIO
+
+import qrcode
+from PIL import Image, ImageDraw
+
+# Bump whenever the drawing code changes so cached labels are re-rendered
+RENDER_VERSION = 1
+
+
+def _qr_image(qr_data, box_size):
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=5)
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    # Convert PIL image to RGB if it's not already
+    return img.convert('RGB') if hasattr(img, 'convert') else img
+
+
+def _render_label(qr_data, box_size, min_width, text_height, text_x, text_offset, lines):
+    """Paste the QR code centered on a white canvas and draw text lines below it."""
+    img = _qr_image(qr_data, box_size)
+    img_width, img_height = img.size
+
+    canvas_width = max(min_width, img_width + 100)
+    canvas_height = img_height + text_height
+    canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
+    draw = ImageDraw.Draw(canvas)
+
+    x_offset = (canvas_width - img_width) // 2
+    y_offset = 20
+    canvas.paste(img, (x_offset, y_offset))
+
+    text_y = y_offset + img_height + text_offset
+    for line_y, text in lines:
+        draw.text((text_x, text_y + line_y), text, fill='black')
+
+    buffer = BytesIO()
+    canvas.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def supply_qr_data(supply_id, name):
+    return f"SUPPLY-{supply_id}-{name}"
+
+
+def render_supply_label(supply_id, name):
+    return _render_label(
+        supply_qr_data(supply_id, name), box_size=10, min_width=300,
+        text_height=100, text_x=20, text_offset=10,
+        lines=[(0, f"{name[:30]}..."), (20, f"ID: {supply_id}")],
+    )
+
+
+def instance_qr_data(instance_id):
+    return f"INSTANCE-{instance_id}"
+
+
+def render_instance_label(instance_id, supply_name, instance_code, brand=None, model_name=None):
+    lines = [(0, f"{supply_name[:25]}"), (20, f"Code: {instance_code}")]
+    if brand:
+        lines.append((40, f"Brand: {brand[:20]}"))
+    if model_name:
+        lines.append((60, f"Model: {model_name[:20]}"))
+    return _render_label(
+        instance_qr_data(instance_id), box_size=10, min_width=350,
+        text_height=120, text_x=20, text_offset=10, lines=lines,
+    )
+
+
+def request_qr_data(is_borrowing, request_pk=None, user_id=None, supply_id=None, group_id=None):
+    prefix = "BORROW" if is_borrowing else "SUPPLY-REQ"
+    if group_id:
+        return f"{prefix}-BATCH-{group_id}"
+    return f"{prefix}-{request_pk}-{user_id}-{supply_id}"
+
+
+def render_request_label(is_borrowing, username, request_pk=None, user_id=None, supply_id=None,
+                         supply_name='', quantity=None, request_id='', group_id=None):
+    qr_data = request_qr_data(is_borrowing, request_pk, user_id, supply_id, group_id)
+    if group_id:
+        msg = "BATCH BORROWING REQUEST" if is_borrowing else "BATCH SUPPLY REQUEST"
+        lines = [
+            (0, msg),
+            (25, f"Group ID: {group_id}"),
+            (50, f"Requested by: {username}"),
+        ]
+    else:
+        msg = "INDIVIDUAL BORROWING REQUEST" if is_borrowing else "INDIVIDUAL SUPPLY REQUEST"
+        lines = [
+            (0, msg),
+            (25, f"Item: {supply_name[:30]}"),
+            (50, f"Quantity: {quantity}"),
+            (75, f"Requester: {username}"),
+            (100, f"ID: {request_id}"),
+        ]
+    return _render_label(
+        qr_data, box_size=20, min_width=500,
+        text_height=120 if group_id else 150, text_x=40, text_offset=20, lines=lines,
+    )
+
+
+def render_label(kind, row):
+    """Render the label described by a values() row of the given kind."""
+    if kind == 'supply':
+        return render_supply_label(row['id'], row['name'])
+    if kind == 'instance':
+        return render_instance_label(
+            row['id'], row['supply__name'], row['instance_code'],
+            row['brand'], row['model_name'],
+        )
+    is_borrowing = row['purpose'].startswith('[BORROWING]')
+    if kind == 'batch':
+        return render_request_label(is_borrowing, row['user__username'], group_id=row['group_id'])
+    return render_request_label(
+        is_borrowing,
+        row['user__username'],
+        request_pk=row['id'],
+        user_id=row['user_id'],
+        supply_id=row['supply_id'],
+        supply_name=row['supply__name'],
+        quantity=row['quantity_requested'],
+        request_id=row['request_id'],
+    )
+
+
+def label_digest(kind, row):
+    """Content address of a label: changes whenever its rendered output would."""
+    source = json.dumps([RENDER_VERSION, kind, row], sort_keys=True, default=str)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def render_job_item(kind, payload):
+    """
+    Worker entry point for the render pipeline: returns (object id, PNG bytes,
+    error message). Errors are returned rather than raised so one bad row
+    does not abort the rest of its chunk.
+    """
+    object_id = payload['id']
+    try:
+        return object_id, render_label(kind, payload), None
+    except Exception as e:
+        return object_id, None, str(e)
@@ -0,0 +1,150 @@
+"""
+Set-based processing of a return manifest.
+
+Returning a batch one borrowed item at a time saved every item, instance
+and supply separately, logged a ledger row per item and recomputed each
+parent request's status with several queries, with post_save analytics on
+every save. return_items takes the whole manifest, locks the open items it
+names and writes the results in one transaction: borrowed items and
+instances are updated in bulk, stock goes back in one UPDATE through
+StockLedger.apply_many, and request statuses come from one aggregate
+query. The return analytics the signals would have recorded are
+applied once.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .batches import refresh_batch_summaries
+from .caching import invalidate_dashboard_snapshots, invalidate_overdue_summary
+from .models import BorrowedItem, EquipmentInstance, RequestorBorrowerAnalytics, SupplyRequest, UserActivityLog
+from .stock_ledger import StockLedger
+
+RETURN_STATUSES = ('returned', 'damaged', 'lost')
+
+# Equipment instance status after a return in each condition
+INSTANCE_STATUS = {'returned': 'available', 'damaged': 'maintenance', 'lost': 'retired'}
+
+
+def return_items(user, manifest, source='Batch return'):
+    """
+    Process a return manifest, mapping borrowed item ids to ``(status,
+    notes)`` with status one of RETURN_STATUSES. Items already returned are
+    skipped, so a resubmitted manifest changes nothing. ``source`` names the
+    return in the ledger reasons. Returns a Counter of the items processed
+    per status.
+    """
+    now = timezone.now()
+    stamp = f"[{user.username} - {now.strftime('%Y-%m-%d %H:%M')}]"
+    manifest = {item_id: entry for item_id, entry in manifest.items() if entry[0] in RETURN_STATUSES}
+    with transaction.atomic():
+        items = list(
+            BorrowedItem.objects.select_for_update()
+            .filter(pk__in=manifest, returned_at__isnull=True)
+            .select_related('supply', 'equipment_instance')
+            .order_by('id')
+        )
+        if not items:
+            return Counter()
+
+        lines = []
+        instances = defaultdict(list)
+        for item in items:
+            status, notes = manifest[item.pk]
+            item.returned_at = now
+            item.return_status = status
+            if notes or status != 'returned':
+                note_text = f"{stamp} {status.upper()}: {notes}"
+                item.notes = f"{item.notes}\n\n{note_text}" if item.notes else note_text
+            if item.equipment_instance_id:
+                instances[INSTANCE_STATUS[status]].append(item.equipment_instance_id)
+
+            if status == 'returned':
+                instance = f" - Instance: {item.equipment_instance.instance_code}" if item.equipment_instance else ''
+                lines.append((item.supply, item.borrowed_quantity, 'in',
+                              f"Returned borrowed item ({source}, ID: {item.id}){instance}", None))
+            else:
+                # Damaged and lost items are written off without restocking
+                lines.append((item.supply, 0, status,
+                              f"Item reported {status} ({source}): {notes}", -item.borrowed_quantity))
+
+        BorrowedItem.objects.bulk_update(items, ['returned_at', 'return_status', 'notes'])
+        for instance_status, instance_ids in instances.items():
+            EquipmentInstance.objects.filter(pk__in=instance_ids).update(status=instance_status, updated_at=now)
+        StockLedger(user).apply_many(lines)
+
+        _update_request_statuses({item.supply_request_id for item in items if item.supply_request_id})
+        _record_return_analytics(items)
+        refresh_batch_summaries({item.batch_id for item in items})
+        transaction.on_commit(invalidate_overdue_summary)
+        transaction.on_commit(invalidate_dashboard_snapshots)
+    return Counter(item.return_status for item in items)
+
+
+def _update_request_statuses(request_ids):
+    """
+    Mark requests whose items are all back as returned (or returned with
+    issues) and those with some items back as partially returned, from one
+    aggregate over their borrowed items.
+    """
+    if not request_ids:
+        return
+    rows = (
+        BorrowedItem.objects.filter(supply_request_id__in=request_ids)
+        .values('supply_request_id')
+        .annotate(
+            returned=Count('id', filter=Q(returned_at__isnull=False)),
+            unreturned=Count('id', filter=Q(returned_at__isnull=True)),
+            issues=Count('id', filter=Q(return_status__in=['damaged', 'lost'], returned_at__isnull=False)),
+        )
+    )
+    by_status = defaultdict(list)
+    for row in rows:
+        if not row['unreturned']:
+            status = 'returned_with_issues' if row['issues'] else 'returned'
+        elif row['returned']:
+            status = 'partially_returned'
+        else:
+            continue
+        by_status[status].append(row['supply_request_id'])
+    for status, ids in by_status.items():
+        SupplyRequest.objects.filter(pk__in=ids).update(status=status)
+
+
+def _record_return_analytics(items):
+    """
+    Apply what track_borrow_activity records when an item is returned: the
+    borrower's returned, lost and damaged counts and a return activity log.
+    """
+    counts = {
+        'returned_items': Counter(item.borrower_id for item in items),
+        'lost_items': Counter(item.borrower_id for item in items if item.return_status == 'lost'),
+        'damaged_items': Counter(item.borrower_id for item in items if item.return_status == 'damaged'),
+    }
+    borrower_ids = set(counts['returned_items'])
+    RequestorBorrowerAnalytics.objects.bulk_create(
+        [RequestorBorrowerAnalytics(user_id=user_id) for user_id in borrower_ids], ignore_conflicts=True
+    )
+    RequestorBorrowerAnalytics.objects.filter(user_id__in=borrower_ids).update(
+        updated_at=timezone.now(),
+        **{
+            field: F(field) + Case(
+                *[When(user_id=user_id, then=Value(count)) for user_id, count in per_user.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            for field, per_user in counts.items()
+        },
+    )
+    UserActivityLog.objects.bulk_create([
+        UserActivityLog(
+            user_id=item.borrower_id,
+            activity_type='return',
+            supply_id=item.supply_id,
+            quantity=item.borrowed_quantity,
+            description=f'Returned item (was borrowed for {item.duration_display})',
+        )
+        for item in items
+    ])
@@ -0,0 +1,185 @@
+"""
+Latency and query-count metrics for QR scan processing.
+
+Every call of ``views._process_scan`` is wrapped in a ``ScanTrace`` that
+measures wall time and the number of SQL statements executed, and records
+them under the branch the payload resolved to, the action and the outcome.
+Samples go into fixed-bucket histograms, so memory stays bounded however
+many scans are processed. The numbers are per worker process and reset on
+restart; ``qr_scan_metrics`` serves them to admins as JSON.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Scans slower than this many milliseconds are logged and listed by the metrics endpoint; None disables it
+QR_SCAN_SLOW_MS = getattr(settings, 'QR_SCAN_SLOW_MS', None)
+SLOW_SCAN_HISTORY = 50
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+ACTIONS = ('scan', 'issue', 'return')
+
+
+def scan_branch(code):
+    """Name of the process_qr_scan branch a registry entry is handled by."""
+    if code is None:
+        return 'unknown'
+    if code.target_type == 'batch':
+        return 'borrow_batch' if code.payload.startswith('BORROW-BATCH-') else 'supply_request_batch'
+    if code.target_type == 'request':
+        return 'borrow_request' if code.payload.startswith('BORROW-') else 'supply_request'
+    return code.target_type
+
+
+def _outcome(status):
+    if status is None or status >= 500:
+        return 'error'
+    return 'rejected' if status >= 400 else 'ok'
+
+
+class Histogram:
+    """Counts of samples per upper bucket bound, plus count, sum and max."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        buckets = {f'le_{bound}': count for bound, count in zip(self.bounds, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 2) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'max': round(self.max, 2),
+            'buckets': buckets,
+        }
+
+
+class ScanMetrics:
+    """Thread-safe store of scan histograms keyed by (branch, action)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._slow = deque(maxlen=SLOW_SCAN_HISTORY)
+            self._since = time.time()
+
+    def record(self, branch, action, outcome, elapsed_ms, queries, payload=''):
+        slow = QR_SCAN_SLOW_MS is not None and elapsed_ms >= QR_SCAN_SLOW_MS
+        if slow:
+            logger.warning(
+                'Slow QR scan: branch=%s action=%s outcome=%s elapsed=%.1fms queries=%d',
+                branch, action, outcome, elapsed_ms, queries,
+            )
+        with self._lock:
+            series = self._series.get((branch, action))
+            if series is None:
+                series = self._series[(branch, action)] = {
+                    'outcomes': {'ok': 0, 'rejected': 0, 'error': 0},
+                    'latency_ms': Histogram(LATENCY_BUCKETS_MS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                }
+            series['outcomes'][outcome] += 1
+            series['latency_ms'].add(elapsed_ms)
+            series['queries'].add(queries)
+
+            if slow:
+                self._slow.append({
+                    'at': time.time(),
+                    'branch': branch,
+                    'action': action,
+                    'outcome': outcome,
+                    'elapsed_ms': round(elapsed_ms, 2),
+                    'queries': queries,
+                    'payload': payload[:100],
+                })
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'since': self._since,
+                'slow_scan_threshold_ms': QR_SCAN_SLOW_MS,
+                'series': [
+                    {
+                        'branch': branch,
+                        'action': action,
+                        'outcomes': dict(series['outcomes']),
+                        'latency_ms': series['latency_ms'].as_dict(),
+                        'queries': series['queries'].as_dict(),
+                    }
+                    for (branch, action), series in sorted(self._series.items())
+                ],
+                'slow_scans': list(self._slow),
+            }
+
+
+metrics = ScanMetrics()
+
+
+class ScanTrace:
+    """
+    Context manager timing one scan. The handler sets ``branch`` once the
+    payload is resolved and ``status`` from its response; an exception
+    escaping the block is recorded as an error.
+    """
+
+    def __init__(self, action, payload=''):
+        self.action = action if action in ACTIONS else 'invalid'
+        self.payload = payload
+        self.branch = 'unresolved'
+        self.status = None
+        self.queries = 0
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._count_query)
+        self._wrapper.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._started) * 1000
+        self._wrapper.__exit__(exc_type, exc, tb)
+        status = None if exc_type else self.status
+        metrics.record(self.branch, self.action, _outcome(status), elapsed_ms, self.queries, self.payload)
+        return False
@@ -1,13 +1,23 @@
 """
 Django signals for automatic analytics tracking
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
+from .caching import (
+    invalidate_user_notifications,
+    invalidate_low_stock_summary,
+    invalidate_overdue_summary,
+    invalidate_dashboard_snapshots,
+)
+from .utils import invalidate_staff_notifications
+from .batches import batch_for_request, schedule_batch_refresh
+from .qr_registry import register_codes, supply_codes, instance_codes, request_codes
 from .models import (
-    SupplyRequest, BorrowedItem, User,
-    RequestorBorrowerAnalytics, UserActivityLog, MostRequestedItem
+    SupplyRequest, BorrowedItem, User, Supply, Notification, BroadcastNotification,
+    RequestorBorrowerAnalytics, UserActivityLog, MostRequestedItem, EquipmentInstance,
+    RequestBatch
 )
 
 
@@ -115,3 +125,84 @@ def track_borrow_activity(sender, instance, created, **kwargs):
             )
             
             instance._return_tracked = True
+
+
+@receiver([post_save, post_delete], sender=Notification)
+def invalidate_notification_counters(sender, instance, **kwargs):
+    """Drop the recipient's cached unread notification summary"""
+    invalidate_user_notifications([instance.recipient_id])
+
+
+@receiver([post_save, post_delete], sender=BroadcastNotification)
+def invalidate_broadcast_counters(sender, instance, **kwargs):
+    """Drop cached unread summaries of every broadcast recipient"""
+    invalidate_staff_notifications()
+
+
+@receiver([post_save, post_delete], sender=Supply)
+def invalidate_low_stock_counters(sender, instance, **kwargs):
+    """Drop the cached low stock summary when stock levels change"""
+    invalidate_low_stock_summary()
+
+
+@receiver([post_save, post_delete], sender=BorrowedItem)
+def invalidate_overdue_counters(sender, instance, **kwargs):
+    """Drop the cached overdue summary when borrow records change"""
+    invalidate_overdue_summary()
+
+
+@receiver([post_save, post_delete], sender=Supply)
+@receiver([post_save, post_delete], sender=SupplyRequest)
+@receiver([post_save, post_delete], sender=BorrowedItem)
+def invalidate_dashboard_cache(sender, instance, **kwargs):
+    """Retire cached dashboard snapshots when requests or stock change"""
+    invalidate_dashboard_snapshots()
+
+
+@receiver(post_save, sender=SupplyRequest)
+def attach_request_batch(sender, instance, created, **kwargs):
+    """Put a new request into its RequestBatch"""
+    if created and not instance.batch_id:
+        instance.batch = batch_for_request(instance)
+        SupplyRequest.objects.filter(pk=instance.pk).update(batch=instance.batch)
+
+
+@receiver(post_save, sender=BorrowedItem)
+def attach_borrowed_item_batch(sender, instance, created, **kwargs):
+    """Give a new borrowed item the batch of the request it was issued from"""
+    if not created or instance.batch_id:
+        return
+    if instance.supply_request_id:
+        batch_id = SupplyRequest.objects.filter(pk=instance.supply_request_id).values_list('batch_id', flat=True).first()
+    elif instance.batch_group_id:
+        batch_id = RequestBatch.objects.filter(group_id=instance.batch_group_id).values_list('id', flat=True).first()
+    else:
+        batch_id = None
+    if batch_id:
+        instance.batch_id = batch_id
+        BorrowedItem.objects.filter(pk=instance.pk).update(batch_id=batch_id)
+
+
+@receiver([post_save, post_delete], sender=SupplyRequest)
+@receiver([post_save, post_delete], sender=BorrowedItem)
+def refresh_batch_summary(sender, instance, **kwargs):
+    """Recompute the denormalized status and counts of the affected batch"""
+    schedule_batch_refresh(instance.batch_id)
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_save, sender=EquipmentInstance)
+@receiver(post_save, sender=SupplyRequest)
+def register_qr_payloads(sender, instance, created, **kwargs):
+    """Record the QR payloads a new object's labels carry in the scan registry"""
+    if not created:
+        return
+    if sender is Supply:
+        register_codes(supply_codes(instance.pk, instance.name))
+    elif sender is EquipmentInstance:
+        register_codes(instance_codes(instance.pk))
+    else:
+        register_codes(request_codes(
+            instance.pk, instance.user_id, instance.supply_id, instance.purpose,
+            instance.batch.group_id if instance.batch_id else None,
+        ))
@@ -6,6 +6,7 @@ from django.core.paginator import Paginator
 
 from .models import InventoryTransaction, Supply
 from .forms import StockAdjustmentForm
+from .stock_ledger import StockLedger, InsufficientStock
 
 
 @login_required
@@ -78,29 +79,14 @@ def stock_adjustment_create(request):
             quantity = form.cleaned_data['quantity']
             reason = form.cleaned_data['reason']
             
-            # Check if supply has enough quantity
-            if quantity > supply.quantity:
-                messages.error(request, f'Cannot adjust {quantity} items. Only {supply.quantity} items available.')
+            # Reduce the supply quantity and record the transaction, as long as
+            # the supply has enough quantity
+            try:
+                StockLedger(request.user).remove(supply, quantity, reason, transaction_type=adjustment_type)
+            except InsufficientStock as e:
+                messages.error(request, f'Cannot adjust {quantity} items. Only {e.available} items available.')
                 return render(request, 'inventory/stock_adjustment_form.html', {'form': form})
             
-            # Store previous quantity
-            previous_quantity = supply.quantity
-            
-            # Reduce the supply quantity
-            supply.quantity -= quantity
-            supply.save()
-            
-            # Create transaction record
-            InventoryTransaction.objects.create(
-                supply=supply,
-                transaction_type=adjustment_type,
-                quantity=-quantity,
-                previous_quantity=previous_quantity,
-                new_quantity=supply.quantity,
-                reason=reason,
-                performed_by=request.user
-            )
-            
             adjustment_label = 'Lost' if adjustment_type == 'lost' else 'Damaged'
             messages.success(request, f'Successfully recorded {quantity} item(s) as {adjustment_label.lower()}.')
             return redirect('stock_adjustment_list')
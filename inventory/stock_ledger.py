@@ -0,0 +1,153 @@
+"""
+Stock ledger: the one place Supply.quantity is changed.
+
+Views used to read supply.quantity, change it in Python and save(), so two
+staff releasing the same supply at once could both read 10 and both write
+8, losing a release. StockLedger applies a change as one conditional UPDATE
+(quantity = quantity + delta, only if the result stays non-negative) and
+writes the matching InventoryTransaction in the same transaction, taking
+the previous and new quantities from the row it just updated. Every ledger
+row therefore chains onto the one before it.
+
+The UPDATE does not go through Supply.save(), so the caches that the Supply
+post_save signals would drop are invalidated here once the change commits.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .caching import invalidate_dashboard_snapshots, invalidate_low_stock_summary
+from .models import InventoryTransaction, Supply
+
+
+class InsufficientStock(Exception):
+    """A change would take a supply's quantity below zero."""
+
+    def __init__(self, supply, requested, available):
+        self.supply = supply
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Insufficient stock for {supply.name}: {requested} requested, {available} available")
+
+
+def _stock_changed():
+    invalidate_low_stock_summary()
+    invalidate_dashboard_snapshots()
+
+
+class StockLedger:
+    """Applies stock changes made by one user and records each in the ledger."""
+
+    def __init__(self, performed_by):
+        self.performed_by = performed_by
+
+    def apply(self, supply, delta, transaction_type, reason, quantity=None):
+        """
+        Add ``delta`` (negative to remove) to a supply's stock and log it.
+        ``quantity`` is the amount recorded on the transaction when it differs
+        from the change in stock. Raises InsufficientStock, changing nothing,
+        if the stock would go negative. ``supply.quantity`` is refreshed.
+        """
+        with transaction.atomic():
+            if delta:
+                updated = Supply.objects.filter(pk=supply.pk, quantity__gte=-delta).update(
+                    quantity=F('quantity') + delta, updated_at=timezone.now()
+                )
+            new_quantity = Supply.objects.filter(pk=supply.pk).values_list('quantity', flat=True).get()
+            if delta and not updated:
+                supply.quantity = new_quantity
+                raise InsufficientStock(supply, -delta, new_quantity)
+
+            entry = InventoryTransaction.objects.create(
+                supply=supply,
+                transaction_type=transaction_type,
+                quantity=delta if quantity is None else quantity,
+                previous_quantity=new_quantity - delta,
+                new_quantity=new_quantity,
+                reason=reason,
+                performed_by=self.performed_by,
+            )
+            if delta:
+                transaction.on_commit(_stock_changed)
+        supply.quantity = new_quantity
+        return entry
+
+    def remove(self, supply, quantity, reason, transaction_type='out'):
+        """Take ``quantity`` out of stock."""
+        return self.apply(supply, -quantity, transaction_type, reason)
+
+    def add(self, supply, quantity, reason, transaction_type='in'):
+        """Put ``quantity`` back into stock."""
+        return self.apply(supply, quantity, transaction_type, reason)
+
+    def apply_many(self, lines):
+        """
+        Apply several ``(supply, delta, transaction_type, reason, quantity)``
+        changes at once, ``quantity`` being the amount recorded when it
+        differs from ``delta`` (or None). The supplies are locked and the
+        lines allocated in order against their stock; a line that would take
+        a supply below zero is refused. One UPDATE applies the net change per
+        supply and the ledger rows are inserted together, so the cost does
+        not grow with the number of lines. Returns the transactions written
+        and the indexes of the refused lines.
+        """
+        if not lines:
+            return [], []
+        with transaction.atomic():
+            stock = dict(
+                Supply.objects.select_for_update()
+                .filter(pk__in={line[0].pk for line in lines})
+                .values_list('pk', 'quantity')
+            )
+            entries, refused, totals = [], [], defaultdict(int)
+            for index, (supply, delta, transaction_type, reason, quantity) in enumerate(lines):
+                available = stock[supply.pk]
+                if available + delta < 0:
+                    refused.append(index)
+                    continue
+                stock[supply.pk] = available + delta
+                totals[supply.pk] += delta
+                entries.append(InventoryTransaction(
+                    supply=supply,
+                    transaction_type=transaction_type,
+                    quantity=delta if quantity is None else quantity,
+                    previous_quantity=available,
+                    new_quantity=available + delta,
+                    reason=reason,
+                    performed_by=self.performed_by,
+                ))
+
+            totals = {pk: total for pk, total in totals.items() if total}
+            if totals:
+                # The rows are locked, so the guard only fails if the database
+                # does not lock rows and another writer got in between
+                guard = Q()
+                for pk, total in totals.items():
+                    guard |= Q(pk=pk, quantity__gte=max(0, -total))
+                updated = Supply.objects.filter(guard).update(
+                    quantity=F('quantity') + Case(
+                        *[When(pk=pk, then=Value(total)) for pk, total in totals.items()],
+                        output_field=IntegerField(),
+                    ),
+                    updated_at=timezone.now(),
+                )
+                if updated != len(totals):
+                    supply = next(line[0] for line in lines if line[0].pk in totals)
+                    raise InsufficientStock(supply, -totals[supply.pk], None)
+                transaction.on_commit(_stock_changed)
+            InventoryTransaction.objects.bulk_create(entries)
+        for line in lines:
+            line[0].quantity = stock[line[0].pk]
+        return entries, refused
+
+    def remove_many(self, lines, transaction_type='out'):
+        """Take stock out for several ``(supply, quantity, reason)`` lines; see apply_many."""
+        return self.apply_many([
+            (supply, -quantity, transaction_type, reason, None) for supply, quantity, reason in lines
+        ])
+
+    def record(self, supply, transaction_type, quantity, reason):
+        """Log a transaction that leaves stock unchanged, such as a lost loan."""
+        return self.apply(supply, 0, transaction_type, reason, quantity=quantity)
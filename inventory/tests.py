@@ -1,3 +1,220 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from . import views
+from .idempotency import idempotent, request_hash
+from .models import (
+    BorrowedItem, IdempotencyKey, InventorySnapshot, InventoryTransaction, QRScanLog, Supply, SupplyCategory,
+)
+from .qr_rendering import supply_qr_data
+from .snapshots import period_start, stock_as_of, take_snapshots
+from .stock_ledger import InsufficientStock, StockLedger
+
+User = get_user_model()
+
+
+def make_supply(name='Bond paper', quantity=10, **fields):
+    category, _ = SupplyCategory.objects.get_or_create(name='Office')
+    return Supply.objects.create(name=name, description=name, category=category, quantity=quantity, **fields)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='pw', role='gso_staff')
+        self.supply = make_supply(quantity=5)
+        self.ledger = StockLedger(self.user)
+
+    def test_remove_records_previous_and_new_quantity(self):
+        entry = self.ledger.remove(self.supply, 3, 'Issued')
+
+        self.assertEqual((entry.previous_quantity, entry.new_quantity, entry.quantity), (5, 2, -3))
+        self.assertEqual(self.supply.quantity, 2)
+        self.supply.refresh_from_db()
+        self.assertEqual(self.supply.quantity, 2)
+
+    def test_remove_beyond_stock_is_refused(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            self.ledger.remove(self.supply, 6, 'Issued')
+
+        self.assertEqual((raised.exception.requested, raised.exception.available), (6, 5))
+        self.supply.refresh_from_db()
+        self.assertEqual(self.supply.quantity, 5)
+        self.assertFalse(InventoryTransaction.objects.filter(supply=self.supply).exists())
+
+    def test_apply_many_refuses_only_the_lines_that_overdraw(self):
+        entries, refused = self.ledger.remove_many([
+            (self.supply, 4, 'First'),
+            (self.supply, 2, 'Second'),
+            (self.supply, 1, 'Third'),
+        ])
+
+        self.assertEqual(refused, [1])
+        self.assertEqual([(e.previous_quantity, e.new_quantity) for e in entries], [(5, 1), (1, 0)])
+        self.supply.refresh_from_db()
+        self.assertEqual(self.supply.quantity, 0)
+        self.assertEqual(InventoryTransaction.objects.filter(supply=self.supply).count(), 2)
+
+
+class IdempotentViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('scanner', password='pw', role='gso_staff')
+        self.calls = 0
+
+        @idempotent
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'call': self.calls}, status=201)
+
+        self.view = view
+
+    def post(self, body='{"qty": 1}', key='key-1'):
+        request = RequestFactory().post(
+            '/qr-scan/process/', body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key
+        )
+        request.user = self.user
+        return request
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.view(self.post())
+        retry = self.view(self.post())
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((retry.status_code, retry.content), (201, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry['Content-Type'], 'application/json')
+
+    def test_key_still_in_progress_answers_409(self):
+        request = self.post()
+        IdempotencyKey.objects.create(
+            user=self.user, key='key-1', request_hash=request_hash(request),
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+        response = self.view(request)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.calls, 0)
+
+    def test_key_reused_for_a_different_request_answers_422(self):
+        self.view(self.post())
+        response = self.view(self.post(body='{"qty": 2}'))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_key_runs_the_view_again(self):
+        self.view(self.post())
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.view(self.post())
+
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+
+class ProcessQRScanBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('gso', password='pw', role='gso_staff')
+        self.client.force_login(self.user)
+        self.supply = make_supply(quantity=5)
+        self.payload = supply_qr_data(self.supply.pk, self.supply.name)
+
+    def post_batch(self, scans):
+        response = self.client.post(
+            '/qr-scan/process-batch/', json.dumps({'scans': scans}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def issue(self, quantity, client_id):
+        return {'qr_data': self.payload, 'action': 'issue', 'quantity': quantity, 'client_id': client_id}
+
+    def test_rejected_scan_does_not_stop_the_batch(self):
+        body = self.post_batch([self.issue(2, 'a'), self.issue(9, 'b'), self.issue(1, 'c')])
+
+        self.assertEqual((body['processed'], body['failed']), (2, 1))
+        self.assertEqual([r['client_id'] for r in body['results'] if not r['success']], ['b'])
+        self.assertEqual(body['results'][1]['status'], 400)
+        self.supply.refresh_from_db()
+        self.assertEqual(self.supply.quantity, 2)
+        self.assertEqual(InventoryTransaction.objects.filter(supply=self.supply).count(), 2)
+
+    def test_rejected_scan_rolls_back_its_own_writes(self):
+        process_scan = views._process_scan
+
+        def write_then_reject(request, data, codes=None):
+            if data.get('client_id') != 'bad':
+                return process_scan(request, data, codes)
+            # Writes made before a scan is rejected must not survive its savepoint
+            StockLedger(request.user).remove(self.supply, 3, 'Partial issue')
+            BorrowedItem.objects.create(
+                supply=self.supply, borrower=request.user, borrowed_date=timezone.localdate()
+            )
+            return JsonResponse({'error': 'Rejected after writing'}, status=400)
+
+        with mock.patch.object(views, '_process_scan', side_effect=write_then_reject):
+            body = self.post_batch([self.issue(1, 'good'), self.issue(1, 'bad')])
+
+        self.assertEqual([r['success'] for r in body['results']], [True, False])
+        self.assertEqual(body['results'][1]['error'], 'Rejected after writing')
+        self.supply.refresh_from_db()
+        self.assertEqual(self.supply.quantity, 4)
+        self.assertEqual(
+            list(InventoryTransaction.objects.filter(supply=self.supply).values_list('reason', flat=True)),
+            ['Issued 1 items via QR scan'],
+        )
+        self.assertEqual(BorrowedItem.objects.filter(supply=self.supply).count(), 1)
+        self.assertEqual(QRScanLog.objects.filter(supply=self.supply, action='issue').count(), 1)
+
+
+class StockAsOfTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = User.objects.create_user('keeper', password='pw', role='admin')
+        self.supply = make_supply(quantity=10)
+        Supply.objects.filter(pk=self.supply.pk).update(created_at=self.days_ago(10))
+        ledger = StockLedger(self.user)
+        self.at(ledger.remove(self.supply, 3, 'Issued'), self.days_ago(5))
+        self.at(ledger.add(self.supply, 5, 'Restocked'), self.days_ago(2))
+
+    def days_ago(self, days):
+        return self.now - timedelta(days=days)
+
+    def at(self, entry, when):
+        InventoryTransaction.objects.filter(pk=entry.pk).update(created_at=when)
+
+    def test_replays_the_ledger_back_from_current_stock(self):
+        self.assertEqual(stock_as_of(self.days_ago(7))[self.supply.pk], 10)
+        self.assertEqual(stock_as_of(self.days_ago(3))[self.supply.pk], 7)
+        self.assertEqual(stock_as_of(self.days_ago(1))[self.supply.pk], 12)
+
+    def test_snapshots_agree_with_the_ledger(self):
+        for days in (8, 4, 1):
+            take_snapshots('daily', timezone.localdate(self.days_ago(days)))
+
+        for days in range(9, 0, -1):
+            with self.subTest(days_ago=days):
+                when = self.days_ago(days)
+                # A transaction recorded exactly at ``when`` is not yet included
+                expected = 10 if days >= 5 else 7 if days >= 2 else 12
+                self.assertEqual(stock_as_of(when, [self.supply.pk]), {self.supply.pk: expected})
+
+    def test_answers_from_the_nearest_snapshot(self):
+        take_snapshots('daily', timezone.localdate(self.days_ago(8)))
+        as_of = period_start('daily', timezone.localdate(self.days_ago(8)))
+        InventorySnapshot.objects.filter(supply=self.supply, as_of=as_of).update(quantity=40)
+
+        self.assertEqual(stock_as_of(as_of)[self.supply.pk], 40)
+        # Closer to now than to the snapshot, so the current stock is the anchor
+        self.assertEqual(stock_as_of(self.days_ago(1))[self.supply.pk], 12)
+
+    def test_leaves_out_supplies_created_later(self):
+        make_supply(name='Stapler', quantity=4)
+
+        self.assertEqual(set(stock_as_of(self.days_ago(3))), {self.supply.pk})
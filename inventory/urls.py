@@ -58,6 +58,11 @@ urlpatterns = [
         views.equipment_instance_bulk_create,
         name="equipment_instance_bulk_create",
     ),
+    path(
+        "instances/labels.pdf",
+        views.equipment_instance_labels,
+        name="equipment_instance_labels",
+    ),
     path(
         "instances/<int:pk>/",
         views.equipment_instance_detail,
@@ -158,6 +163,8 @@ urlpatterns = [
     # QR Code Scanner
     path("qr-scanner/", views.qr_scanner, name="qr_scanner"),
     path("qr-scan/process/", views.process_qr_scan, name="process_qr_scan"),
+    path("qr-scan/process-batch/", views.process_qr_scan_batch, name="process_qr_scan_batch"),
+    path("qr-scan/metrics/", views.qr_scan_metrics, name="qr_scan_metrics"),
     path("qr-scan/recent/", views.get_recent_scans, name="get_recent_scans"),
     # Borrowed Items
     path("borrowed-items/", views.borrowed_items_list, name="borrowed_items_list"),
@@ -192,6 +199,26 @@ urlpatterns = [
         views.mark_all_notifications_read,
         name="mark_all_notifications_read",
     ),
+    path(
+        "notifications/",
+        views.notification_history,
+        name="notification_history",
+    ),
+    path(
+        "events/stream/",
+        views.event_stream,
+        name="event_stream",
+    ),
+    path(
+        "qr/<str:kind>/<str:key>.png",
+        views.qr_image,
+        name="qr_image",
+    ),
+    path(
+        "qr-jobs/<int:pk>/",
+        views.qr_job_status,
+        name="qr_job_status",
+    ),
     # Reports
     path("reports/", views.reports, name="reports"),
     path(
@@ -1,8 +1,143 @@
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
-from django.db.models import F
-from .models import BorrowedItem, Supply, Notification, User
+from django.db import transaction
+from django.db.models import F, Q, Value, Exists, OuterRef, CharField
+from django.db.models.functions import Cast, Concat
+from .caching import invalidate_user_notifications
+from .models import (
+    BorrowedItem, Supply, Notification, User, SchedulerState,
+    BroadcastNotification, NotificationReceipt,
+)
+
+STAFF_ROLES = ['admin', 'gso_staff']
+
+# Dedupe key prefixes for staff-wide alerts, e.g. "low_stock:12"
+LOW_STOCK_KEY = 'low_stock'
+OVERDUE_KEY = 'overdue'
+
+# Dedupe key prefixes for alerts sent to the borrower, e.g. "borrower_overdue:7"
+BORROWER_DUE_SOON_KEY = 'borrower_due_soon'
+BORROWER_OVERDUE_KEY = 'borrower_overdue'
+
+# Borrowers are warned when an item is due within this many days
+DUE_SOON_DAYS = 1
+
+
+def notification_dedupe_key(kind, object_id):
+    """Build the stable dedupe key stored on a notification for an alert."""
+    return f"{kind}:{object_id}"
+
+
+def _keyed_candidates(candidates, kind):
+    """Annotate each candidate row with its "<kind>:<pk>" dedupe key."""
+    return candidates.order_by().annotate(
+        dedupe=Concat(
+            Value(f"{kind}:"), Cast('pk', output_field=CharField()),
+            output_field=CharField(),
+        )
+    )
+
+
+def invalidate_staff_notifications():
+    """Drop cached notification summaries of every broadcast recipient."""
+    invalidate_user_notifications(
+        User.objects.filter(role__in=STAFF_ROLES).values_list('id', flat=True)
+    )
+
+
+def publish_staff_broadcasts(candidates, kind, fields, build):
+    """
+    Create one staff broadcast per candidate that has no active broadcast yet.
+
+    Candidates without an active broadcast for their dedupe key are found with
+    a single anti-join query and inserted with one bulk_create, so the cost
+    follows the number of new alerts rather than items x staff. ``build``
+    turns a row dict (the requested ``fields`` plus 'dedupe') into an unsaved
+    BroadcastNotification. Returns the number of broadcasts created.
+    """
+    active = BroadcastNotification.objects.filter(is_active=True)
+    rows = _keyed_candidates(candidates, kind).filter(
+        ~Exists(active.filter(dedupe_key=OuterRef('dedupe')))
+    ).values('dedupe', *fields)
+
+    broadcasts = [build(row) for row in rows]
+    if broadcasts:
+        # A concurrent run may have published the same key in the meantime
+        BroadcastNotification.objects.bulk_create(broadcasts, ignore_conflicts=True)
+        invalidate_staff_notifications()
+    return len(broadcasts)
+
+
+def resolve_staff_broadcasts(candidates, kind):
+    """
+    Deactivate active broadcasts of ``kind`` whose subject is no longer among
+    ``candidates`` (e.g. a supply that has been restocked). Returns the
+    number of broadcasts resolved.
+    """
+    resolved = BroadcastNotification.objects.filter(
+        is_active=True, dedupe_key__startswith=f"{kind}:"
+    ).exclude(
+        dedupe_key__in=_keyed_candidates(candidates, kind).values('dedupe')
+    ).update(is_active=False, resolved_at=timezone.now())
+    if resolved:
+        invalidate_staff_notifications()
+    return resolved
+
+
+def unread_broadcasts(user):
+    """Active broadcasts addressed to ``user`` that they have not read yet."""
+    if user.role not in STAFF_ROLES:
+        return BroadcastNotification.objects.none()
+    return BroadcastNotification.objects.filter(
+        audience='staff',
+        is_active=True,
+        created_at__gte=user.date_joined,
+    ).filter(
+        ~Exists(NotificationReceipt.objects.filter(user=user, broadcast=OuterRef('pk')))
+    )
+
+
+def mark_broadcasts_read(user):
+    """Write read receipts for every unread broadcast of ``user``."""
+    receipts = [
+        NotificationReceipt(user=user, broadcast_id=broadcast_id)
+        for broadcast_id in unread_broadcasts(user).values_list('id', flat=True)
+    ]
+    NotificationReceipt.objects.bulk_create(receipts, ignore_conflicts=True)
+    return len(receipts)
+
+
+def create_notifications(notifications):
+    """
+    Insert notifications in one query. bulk_create skips post_save signals,
+    so the recipients' cached counters are invalidated here instead.
+    """
+    created = Notification.objects.bulk_create(notifications)
+    invalidate_user_notifications(n.recipient_id for n in created)
+    return created
+
+
+def _low_stock_broadcast(row, quantity):
+    return BroadcastNotification(
+        title=f"Low Stock Alert: {row['name']}",
+        message=f"Alert: {row['name']} is low on stock ({quantity} remaining).",
+        url=f"/supplies/{row['pk']}/",
+        level='warning',
+        dedupe_key=row['dedupe'],
+    )
+
+
+def _overdue_broadcast(row):
+    return BroadcastNotification(
+        title=f"Overdue Item: {row['supply__name']}",
+        message=(f"Item '{row['supply__name']}' borrowed by {row['borrower__username']} "
+                 f"is overdue (Due: {row['return_deadline']})."),
+        url="/borrowed-items/?status=overdue",
+        level='error',
+        dedupe_key=row['dedupe'],
+    )
+
 
 def check_low_stock_alerts(supply, previous_quantity, new_quantity):
     """
@@ -12,83 +147,105 @@ def check_low_stock_alerts(supply, previous_quantity, new_quantity):
     if new_quantity <= supply.min_stock_level and new_quantity < previous_quantity:
         msg = f"Alert: {supply.name} is low on stock ({new_quantity} remaining)."
         
-        # Notify all admins and GSO staff
-        recipients = User.objects.filter(role__in=['admin', 'gso_staff'])
-        
-        # Avoid spamming duplicate unread notifications for the same supply item
-        title = f"Low Stock Alert: {supply.name}"
-        
-        for recipient in recipients:
-            # Check if an unread notification for this supply already exists for this user
-            exists = Notification.objects.filter(
-                recipient=recipient,
-                title=title,
-                is_read=False
-            ).exists()
-            
-            if not exists:
-                Notification.objects.create(
-                    recipient=recipient,
-                    title=title,
-                    message=msg,
-                    url=f"/supplies/{supply.id}/",
-                    level='warning'
-                )
+        # Broadcast to all admins and GSO staff unless an alert for this
+        # supply item is already active
+        publish_staff_broadcasts(
+            Supply.objects.filter(pk=supply.pk), LOW_STOCK_KEY, ['pk', 'name'],
+            lambda row: _low_stock_broadcast(row, new_quantity),
+        )
             
         return msg
     return None
 
-def check_overdue_borrowed_items():
+def advance_due_states():
     """
-    Check for borrowed items that are overdue or due soon and send alerts
+    Move open borrowed items through on_time -> due_soon -> overdue.
+
+    Each transition is one indexed UPDATE over the rows that just crossed a
+    deadline boundary, so the work done follows the number of transitions
+    rather than the number of open loans. Items whose deadline was extended
+    fall back to on_time without a notification, or to due_soon when the new
+    deadline is within DUE_SOON_DAYS. Returns a dict mapping
+    'due_soon' and 'overdue' to the ids that entered that state.
     """
-    # Get items that are not returned and have a deadline
-    borrowed_items = BorrowedItem.objects.filter(
+    today = timezone.now().date()
+    due_soon_limit = today + timezone.timedelta(days=DUE_SOON_DAYS)
+    open_items = BorrowedItem.objects.filter(
         returned_at__isnull=True,
         return_deadline__isnull=False
+    )
+
+    transitions = {
+        'overdue': open_items.filter(
+            due_state__in=['on_time', 'due_soon'],
+            return_deadline__lt=today
+        ),
+        # Includes overdue items whose deadline was extended into the window
+        'due_soon': open_items.filter(
+            due_state__in=['on_time', 'overdue'],
+            return_deadline__gte=today,
+            return_deadline__lte=due_soon_limit
+        ),
+    }
+
+    transitioned = {}
+    with transaction.atomic():
+        open_items.exclude(due_state='on_time').filter(
+            return_deadline__gt=due_soon_limit
+        ).update(due_state='on_time')
+
+        for state, candidates in transitions.items():
+            ids = list(candidates.select_for_update().values_list('id', flat=True))
+            if ids:
+                BorrowedItem.objects.filter(id__in=ids).update(due_state=state)
+            transitioned[state] = ids
+    return transitioned
+
+
+def check_overdue_borrowed_items():
+    """
+    Advance borrowed item due states and alert borrowers once per transition
+    (due soon, then overdue). Returns the number of alerts sent.
+    """
+    transitioned = advance_due_states()
+    state_by_id = {
+        item_id: state for state, ids in transitioned.items() for item_id in ids
+    }
+    if not state_by_id:
+        return 0
+
+    items = BorrowedItem.objects.filter(
+        id__in=state_by_id
     ).select_related('borrower', 'supply')
-    
-    today = timezone.now().date()
-    alerts_sent = 0
-    
-    for item in borrowed_items:
-        # Check if item is overdue
-        if item.is_overdue:
-            # Send overdue alert
+
+    notifications = []
+    for item in items:
+        deadline = item.return_deadline.strftime('%b %d, %Y')
+        if state_by_id[item.id] == 'overdue':
             send_overdue_alert(item)
-            # Create an in-app notification for the borrower
-            try:
-                Notification.objects.create(
-                    recipient=item.borrower,
-                    title=f"Overdue item: {item.supply.name}",
-                    message=(f"Your borrowed item '{item.supply.name}' (qty: {item.borrowed_quantity}) "
-                             f"was due on {item.return_deadline.strftime('%b %d, %Y %H:%M')} and is now overdue."),
-                    url='',
-                    level='warning'
-                )
-            except Exception as e:
-                print(f"Error creating notification: {e}")
-            alerts_sent += 1
+            notifications.append(Notification(
+                recipient=item.borrower,
+                title=f"Overdue item: {item.supply.name}",
+                message=(f"Your borrowed item '{item.supply.name}' (qty: {item.borrowed_quantity}) "
+                         f"was due on {deadline} and is now overdue."),
+                url='',
+                level='warning',
+                dedupe_key=notification_dedupe_key(BORROWER_OVERDUE_KEY, item.id),
+            ))
         else:
-            # Check if item is due within 1 day
-            if item.days_until_due is not None and item.days_until_due <= 1:
-                # Send due soon alert
-                send_due_soon_alert(item)
-                # Create an in-app notification for due-soon
-                try:
-                    Notification.objects.create(
-                        recipient=item.borrower,
-                        title=f"Due soon: {item.supply.name}",
-                        message=(f"Your borrowed item '{item.supply.name}' (qty: {item.borrowed_quantity}) "
-                                 f"is due on {item.return_deadline.strftime('%b %d, %Y %H:%M')} ({abs(item.days_until_due)} day(s))."),
-                        url='',
-                        level='info'
-                    )
-                except Exception as e:
-                    print(f"Error creating notification: {e}")
-                alerts_sent += 1
-    
-    return alerts_sent
+            send_due_soon_alert(item)
+            notifications.append(Notification(
+                recipient=item.borrower,
+                title=f"Due soon: {item.supply.name}",
+                message=(f"Your borrowed item '{item.supply.name}' (qty: {item.borrowed_quantity}) "
+                         f"is due on {deadline} ({item.days_until_due} day(s))."),
+                url='',
+                level='info',
+                dedupe_key=notification_dedupe_key(BORROWER_DUE_SOON_KEY, item.id),
+            ))
+
+    create_notifications(notifications)
+    return len(notifications)
 
 def send_overdue_alert(item):
     """
@@ -188,76 +345,72 @@ def get_user_overdue_items(user):
 
 def ensure_overdue_notifications():
     """
-    Create in-app overdue notifications for admin/GSO users for borrowed items
-    that are past their return deadline. This is idempotent
-    and will not create duplicate unread notifications for the same borrow instance.
+    Broadcast overdue alerts to admin/GSO users for borrowed items that are
+    past their return deadline. This is idempotent: an item gets one active
+    broadcast until it is returned, at which point the alert is resolved.
+    Returns the number of broadcasts created.
     """
     overdue_items = BorrowedItem.objects.filter(
         returned_at__isnull=True,
         return_deadline__isnull=False,
         return_deadline__lt=timezone.now().date()
-    ).select_related('borrower', 'supply')
-    
-    recipients = User.objects.filter(role__in=['admin', 'gso_staff'])
-
-    for item in overdue_items:
-        title = f"Overdue Item: {item.supply.name}"
-        msg = f"Item '{item.supply.name}' borrowed by {item.borrower.username} is overdue (Due: {item.return_deadline})."
-        
-        for recipient in recipients:
-            # Check if THIS recipient already has an unread notification for this specific overdue item
-            # We use the message to distinguish different overdue items
-            exists_unread = Notification.objects.filter(
-                recipient=recipient, 
-                title=title,
-                message=msg,
-                is_read=False
-            ).exists()
-            
-            if not exists_unread:
-                try:
-                    Notification.objects.create(
-                        recipient=recipient,
-                        title=title,
-                        message=msg,
-                        url=f"/borrowed-items/?status=overdue",
-                        level='error'
-                    )
-                except Exception:
-                    continue
-    return True
+    )
+    resolve_staff_broadcasts(overdue_items, OVERDUE_KEY)
+    return publish_staff_broadcasts(
+        overdue_items, OVERDUE_KEY,
+        ['supply__name', 'borrower__username', 'return_deadline'],
+        _overdue_broadcast,
+    )
 
 
 def ensure_low_stock_notifications():
     """
-    Create in-app low-stock notifications for admin/GSO users for supplies
-    that are currently at or below their minimum stock level. This is idempotent
-    and will not create duplicate unread notifications for the same supply.
+    Broadcast low-stock alerts to admin/GSO users for supplies that are
+    currently at or below their minimum stock level. This is idempotent: a
+    supply gets one active broadcast until it is restocked, at which point
+    the alert is resolved. Returns the number of broadcasts created.
     """
     low_supplies = Supply.objects.filter(quantity__lte=F('min_stock_level'))
-    recipients = User.objects.filter(role__in=['admin', 'gso_staff'])
+    resolve_staff_broadcasts(low_supplies, LOW_STOCK_KEY)
+    return publish_staff_broadcasts(
+        low_supplies, LOW_STOCK_KEY, ['pk', 'name', 'quantity'],
+        lambda row: _low_stock_broadcast(row, row['quantity']),
+    )
 
-    for supply in low_supplies:
-        title = f"Low Stock Alert: {supply.name}"
-        msg = f"Alert: {supply.name} is low on stock ({supply.quantity} remaining)."
-        
-        for recipient in recipients:
-            # Check if THIS recipient already has an unread notification for this supply
-            exists_unread = Notification.objects.filter(
-                recipient=recipient, 
-                title=title, 
-                is_read=False
-            ).exists()
-            
-            if not exists_unread:
-                try:
-                    Notification.objects.create(
-                        recipient=recipient,
-                        title=title,
-                        message=msg,
-                        url=f"/supplies/{supply.id}/",
-                        level='warning'
-                    )
-                except Exception:
-                    continue
-    return True
+
+def acquire_scheduler_lock(name, owner, ttl_seconds, min_interval_seconds=0):
+    """
+    Claim the single-run lock for a scheduled job.
+
+    The claim is one conditional UPDATE, so only one worker can win it even
+    when several processes race. The lock is refused while another worker
+    holds an unexpired lock, or while the job's watermark (``last_run_at``)
+    is younger than ``min_interval_seconds``. Returns True when claimed.
+    """
+    now = timezone.now()
+    SchedulerState.objects.get_or_create(name=name)
+
+    claimable = SchedulerState.objects.filter(name=name).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    )
+    if min_interval_seconds:
+        claimable = claimable.filter(
+            Q(last_run_at__isnull=True)
+            | Q(last_run_at__lte=now - timezone.timedelta(seconds=min_interval_seconds))
+        )
+    return claimable.update(
+        locked_until=now + timezone.timedelta(seconds=ttl_seconds),
+        locked_by=owner,
+    ) == 1
+
+
+def release_scheduler_lock(name, owner, result=None):
+    """
+    Release a lock taken with acquire_scheduler_lock. When ``result`` is given
+    the run is recorded as successful and the watermark is advanced.
+    """
+    updates = {'locked_until': None, 'locked_by': ''}
+    if result is not None:
+        updates['last_run_at'] = timezone.now()
+        updates['last_result'] = result
+    SchedulerState.objects.filter(name=name, locked_by=owner).update(**updates)
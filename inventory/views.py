@@ -2,12 +2,19 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
 from django.urls import reverse
-from django.db.models import Q, Count, Sum, F, Exists, OuterRef
+from django.db import transaction
+from django.db.models import Q, Count, Sum, F, Exists, OuterRef, Max, CharField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.http import require_http_methods
+from django.core.paginator import Paginator
 from django_htmx.http import HttpResponseClientRefresh
+import asyncio
 import json
 import uuid
 import csv
@@ -40,7 +47,25 @@ from .models import (
     BorrowedItem,
     EquipmentInstance,
 )
-from .models import Notification
+from .models import Notification, BroadcastNotification, ArchivedNotification, QRRenderJob, QRCode
+from .caching import invalidate_user_notifications
+from .dashboard import get_dashboard_snapshot
+from .events import broker as event_broker
+from .qr_pipeline import enqueue_qr_render
+from .qr_cache import label_row, get_label_png
+from .batches import batch_borrowed_items, create_batch, get_batch, refresh_batch_summaries
+from .qr_registry import resolve_qr_code, batch_requests
+from .qr_rendering import label_digest, request_qr_data
+from .qr_pdf import draw_qr_code
+from .label_sheets import LabelSheetWriter, DEFAULT_COLUMNS, DEFAULT_ROWS, MAX_COLUMNS, MAX_ROWS
+from .scan_metrics import ScanTrace, scan_branch, metrics as scan_metrics
+from .idempotency import idempotent
+from .allocation import InstancesTaken, allocate_instances, release_reservations, reserve_instances, unreserved
+from .stock_ledger import StockLedger, InsufficientStock
+from .releases import release_batch
+from .returns import RETURN_STATUSES, return_items
+from .provisioning import MAX_INSTANCES, provision_instances, read_serials
+from .snapshots import end_of_day, with_stock_as_of
 from .forms import (
     CustomUserCreationForm,
     SupplyForm,
@@ -55,11 +80,17 @@ from .utils import (
     check_low_stock_alerts,
     has_overdue_items,
     get_user_overdue_items,
-    ensure_low_stock_notifications,
-    ensure_overdue_notifications,
+    mark_broadcasts_read,
 )
 from django.views.decorators.http import require_POST
 
+# Seconds between keepalive comments on an idle event stream
+EVENT_STREAM_KEEPALIVE = 15
+# Lifetime of QR label responses whose URL pins the content digest
+QR_IMAGE_MAX_AGE = 60 * 60 * 24 * 365
+# Largest number of scans accepted by one process_qr_scan_batch request
+QR_SCAN_BATCH_MAX = 200
+
 
 def register_view(request):
     if request.user.is_authenticated:
@@ -131,68 +162,8 @@ def profile_update(request):
 def dashboard(request):
     user = request.user
 
-    # Proactively check for low stock items and notify staff
-    if user.role in ["admin", "gso_staff"]:
-        ensure_low_stock_notifications()
-        ensure_overdue_notifications()
-
-    context = {
-        "user": user,
-        "total_supplies": Supply.objects.count(),
-        "low_stock_count": Supply.objects.filter(
-            quantity__lte=F("min_stock_level")
-        ).count(),
-    }
-
-    # Role-specific request counts
-    if user.role == "admin":
-        context["total_requests"] = SupplyRequest.objects.count()
-        context["pending_requests_count"] = SupplyRequest.objects.filter(
-            status="pending"
-        ).count()
-        context["recent_requests"] = SupplyRequest.objects.order_by("-created_at")[:10]
-        context["low_stock_items"] = Supply.objects.filter(
-            quantity__lte=F("min_stock_level")
-        )[:10]
-        context["recently_borrowed"] = BorrowedItem.objects.filter(
-            returned_at__isnull=True
-        ).order_by("-borrowed_at")[:10]
-        context["overdue_items_list"] = BorrowedItem.objects.filter(
-            returned_at__isnull=True, return_deadline__lt=timezone.now().date()
-        ).order_by("return_deadline")[:10]
-    elif user.role == "gso_staff":
-        context["total_requests"] = SupplyRequest.objects.count()
-        context["pending_requests_count"] = SupplyRequest.objects.filter(
-            status="pending"
-        ).count()
-        context["gso_pending_requests"] = SupplyRequest.objects.filter(
-            status="pending"
-        ).order_by("-created_at")[:10]
-        context["recent_approvals"] = SupplyRequest.objects.filter(
-            approved_by=user
-        ).order_by("-approved_at")[:5]
-        context["low_stock_items"] = Supply.objects.filter(
-            quantity__lte=F("min_stock_level")
-        )[:10]
-        context["recently_borrowed"] = BorrowedItem.objects.filter(
-            returned_at__isnull=True
-        ).order_by("-borrowed_at")[:10]
-        context["overdue_items_list"] = BorrowedItem.objects.filter(
-            returned_at__isnull=True, return_deadline__lt=timezone.now().date()
-        ).order_by("return_deadline")[:10]
-    else:  # department_user
-        # For department users, only show their own requests
-        user_requests = SupplyRequest.objects.filter(user=user)
-        context["total_requests"] = user_requests.count()
-        context["pending_requests_count"] = user_requests.filter(
-            status="pending"
-        ).count()
-        context["my_requests"] = user_requests.order_by("-created_at")[:10]
-        context["my_borrowed_items"] = BorrowedItem.objects.filter(
-            borrower=user, returned_at__isnull=True
-        ).order_by("-borrowed_at")[:10]
-        context["has_overdue_items"] = has_overdue_items(user)
-        context["overdue_items"] = get_user_overdue_items(user)
+    context = {"user": user}
+    context.update(get_dashboard_snapshot(user))
 
     return render(request, "inventory/dashboard.html", context)
 
@@ -205,6 +176,8 @@ def mark_all_notifications_read(request):
         Notification.objects.filter(recipient=request.user, is_read=False).update(
             is_read=True
         )
+        mark_broadcasts_read(request.user)
+        invalidate_user_notifications([request.user.pk])
         return JsonResponse(
             {"success": True, "message": "Marked all notifications as read"}
         )
@@ -213,14 +186,136 @@ def mark_all_notifications_read(request):
 
 
 @login_required
-def supply_list(request):
-    # Ensure admins/GSO staff have low-stock notifications for current low supplies
-    try:
-        ensure_low_stock_notifications()
-    except Exception:
-        # Fail silently to avoid breaking the view if notification creation fails
-        pass
+async def event_stream(request):
+    """
+    Server-Sent Events stream pushing new notifications, staff broadcasts and
+    QR scan activity to the browser. Must be served over ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI would buffer the endless stream in a worker thread; 204 tells
+        # EventSource clients to stop reconnecting.
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    subscription = event_broker.subscribe(user.pk, user.role in ["admin", "gso_staff"])
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=EVENT_STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                data = json.dumps(event["data"], cls=DjangoJSONEncoder)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def notification_history(request):
+    """
+    Paginated notification history. The live table holds the inbox; staff
+    alerts come from broadcasts, and the archive is only read when asked for.
+    """
+    source = request.GET.get("source", "inbox")
+    if source == "alerts" and request.user.role in ["admin", "gso_staff"]:
+        notifications = BroadcastNotification.objects.filter(audience="staff")
+    elif source == "archive":
+        notifications = ArchivedNotification.objects.filter(recipient=request.user)
+    else:
+        source = "inbox"
+        notifications = Notification.objects.filter(recipient=request.user)
+
+    paginator = Paginator(notifications.order_by("-created_at"), 25)
+    notifications = paginator.get_page(request.GET.get("page", 1))
+
+    context = {
+        "notifications": notifications,
+        "source": source,
+    }
+    return render(request, "inventory/notification_history.html", context)
 
+
+def _with_qr_job(url, job):
+    """Append the QR job id to a redirect URL so the page can show progress."""
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}qr_job={job.pk}"
+
+
+def _safe_next_url(request, default):
+    """The ``next`` parameter or referer when it points at this site, else ``default``."""
+    for url in (request.GET.get("next"), request.META.get("HTTP_REFERER")):
+        if url and url_has_allowed_host_and_scheme(
+            url, allowed_hosts={request.get_host()}, require_https=request.is_secure()
+        ):
+            return url
+    return default
+
+
+@login_required
+def qr_job_status(request, pk):
+    """Progress of a background QR render job, polled by the base template."""
+    job = get_object_or_404(QRRenderJob, pk=pk)
+    if job.created_by_id != request.user.id and request.user.role not in ["admin", "gso_staff"]:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    return JsonResponse(
+        {
+            "id": job.pk,
+            "kind": job.kind,
+            "status": job.status,
+            "total": job.total,
+            "completed": job.completed,
+            "failed": job.failed,
+            "progress": job.progress_percent,
+            "error": job.error,
+        }
+    )
+
+
+@login_required
+def qr_image(request, kind, key):
+    """
+    Serve a QR label rendered on demand. Responses carry the label's content
+    digest as a strong ETag; URLs that pin the current digest (``?v=``, see
+    models.qr_image_url) are cacheable for a year, anything else revalidates.
+    """
+    row = label_row(kind, key)
+    if row is None:
+        raise Http404("QR code not found")
+    if kind in ("request", "batch") and request.user.role == "department_user" and row["user_id"] != request.user.id:
+        raise Http404("QR code not found")
+
+    digest = label_digest(kind, row)
+    etag = f'"{digest}"'
+    if request.GET.get("v") and digest.startswith(request.GET["v"]):
+        cache_control = f"private, max-age={QR_IMAGE_MAX_AGE}, immutable"
+    else:
+        cache_control = "private, no-cache"
+
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(get_label_png(kind, row, digest), content_type="image/png")
+        response["Content-Disposition"] = f'inline; filename="{kind}_{key}_qr.png"'
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
+
+
+@login_required
+def supply_list(request):
     supplies = Supply.objects.all()
     categories = SupplyCategory.objects.all()
 
@@ -362,7 +457,6 @@ def supply_create(request):
         form = SupplyForm(request.POST, request.FILES)
         if form.is_valid():
             supply = form.save()
-            supply.generate_qr_code()
             messages.success(request, f'Supply "{supply.name}" created successfully.')
             return redirect("supply_detail", pk=supply.pk)
     else:
@@ -475,9 +569,7 @@ def supply_import_process(request):
                     },
                 )
 
-                # Generate QR code if new
                 if created:
-                    supply.generate_qr_code()
                     created_count += 1
                 else:
                     updated_count += 1
@@ -517,18 +609,38 @@ def supply_edit(request, pk):
         previous_quantity = supply.quantity
         form = SupplyForm(request.POST, request.FILES, instance=supply)
         if form.is_valid():
-            supply = form.save()
-            messages.success(request, f'Supply "{supply.name}" updated successfully.')
+            new_quantity = form.cleaned_data["quantity"]
+            supply = form.save(commit=False)
+            # Stock only changes through the ledger: save every other field and
+            # record a quantity change as an adjustment
+            supply.quantity = previous_quantity
+            try:
+                with transaction.atomic():
+                    supply.save(update_fields=[
+                        field.name for field in Supply._meta.concrete_fields
+                        if field.name not in ("id", "quantity", "created_at")
+                    ])
+                    if new_quantity != previous_quantity:
+                        StockLedger(request.user).apply(
+                            supply,
+                            new_quantity - previous_quantity,
+                            "adjustment",
+                            f"Stock adjusted from {previous_quantity} to {new_quantity} on supply edit",
+                        )
+            except InsufficientStock as e:
+                form.add_error("quantity", f"Stock changed to {e.available} while editing; please review the quantity.")
+            else:
+                messages.success(request, f'Supply "{supply.name}" updated successfully.')
 
-            # Check for low stock alert if quantity changed
-            if previous_quantity != supply.quantity:
-                alert_message = check_low_stock_alerts(
-                    supply, previous_quantity, supply.quantity
-                )
-                if alert_message:
-                    messages.warning(request, alert_message)
+                # Check for low stock alert if quantity changed
+                if previous_quantity != supply.quantity:
+                    alert_message = check_low_stock_alerts(
+                        supply, previous_quantity, supply.quantity
+                    )
+                    if alert_message:
+                        messages.warning(request, alert_message)
 
-            return redirect("supply_detail", pk=supply.pk)
+                return redirect("supply_detail", pk=supply.pk)
     else:
         form = SupplyForm(instance=supply)
 
@@ -564,22 +676,19 @@ def request_list(request):
             | Q(user__username__icontains=search)
         )
 
-    # Grouping requests (by date and user for simple grouping if no group_id)
-    # In a real app, you'd have a Batch/RequestGroup model.
-    # Here we'll group by a combination of created_at date and user.
+    # Group the matching requests by their RequestBatch; return progress comes
+    # from the batch's denormalized counts instead of per-item queries
     from collections import defaultdict
 
     grouped_requests = defaultdict(list)
 
-    for req in requests_qs.order_by("-created_at"):
-        # If purpose has a special pattern like [BATCH:xyz], use that
-        # Otherwise group by (user, date)
-        group_key = (req.user_id, req.created_at.strftime("%Y-%m-%d %H:%M"))
-        grouped_requests[group_key].append(req)
+    for req in requests_qs.select_related("user", "supply", "batch").order_by("-created_at"):
+        grouped_requests[req.batch_id or f"request-{req.pk}"].append(req)
 
     processed_groups = []
-    for key, items in grouped_requests.items():
+    for items in grouped_requests.values():
         first_item = items[0]
+        batch = first_item.batch
         # Determine status of the group
         statuses = set(item.status for item in items)
         if len(statuses) == 1:
@@ -589,21 +698,10 @@ def request_list(request):
 
         is_borrowing = any(item.purpose.startswith("[BORROWING]") for item in items)
 
-        # Calculate return progress for borrowing requests that have been released
-        returned_count = 0
-        total_borrowed_count = 0
-        has_issues = False
-        
-        # Check return progress for any borrowing request that's been released
-        if is_borrowing:
-            for item in items:
-                # Count BorrowedItem records linked to these requests
-                borrowed_items = BorrowedItem.objects.filter(supply_request=item)
-                total_borrowed_count += borrowed_items.count()
-                returned_count += borrowed_items.filter(returned_at__isnull=False).count()
-                if borrowed_items.filter(return_status__in=['damaged', 'lost']).exists():
-                    has_issues = True
-        
+        returned_count = batch.returned_count if batch else 0
+        total_borrowed_count = batch.borrowed_count if batch else 0
+        has_issues = batch.has_issues if batch else False
+
         # Determine display status with progress
         if is_borrowing and total_borrowed_count > 0:
             if returned_count == 0:
@@ -626,7 +724,7 @@ def request_list(request):
 
         processed_groups.append(
             {
-                "id": f"{first_item.user_id}-{first_item.created_at.strftime('%Y%m%d%H%M')}",
+                "id": batch.group_id if batch else first_item.batch_qr_group_id,
                 "group_id": None,  # Could be implemented if needed
                 "items": items,
                 "user": first_item.user,
@@ -668,9 +766,6 @@ def request_create(request):
             supply_request.user = request.user
             supply_request.save()
 
-            # Generate QR code for the request
-            supply_request.generate_borrowing_qr_code()
-
             messages.success(
                 request, f"Request {supply_request.request_id} created successfully."
             )
@@ -712,121 +807,37 @@ def request_detail(request, pk):
         return redirect("request_list")
 
     # Get all items in the same batch (including this one)
-    batch_items = SupplyRequest.objects.filter(
-        user=supply_request.user,
-        created_at__year=supply_request.created_at.year,
-        created_at__month=supply_request.created_at.month,
-        created_at__day=supply_request.created_at.day,
-        created_at__hour=supply_request.created_at.hour,
-        created_at__minute=supply_request.created_at.minute,
-    ).order_by("id")
-
-    is_batch = batch_items.count() > 1
-
-    # Ensure a unified QR code exists for the batch if items are approved or released
-    unified_qr = None
-    if is_batch and any(
-        item.status in ["approved", "released"] for item in batch_items
-    ):
-        # We need a unified QR code for the whole batch (bulk actions)
-        # We'll see if any item already has a batch QR code
-        for item in batch_items:
-            if item.borrowing_qr_code and "batch" in item.borrowing_qr_code.name.lower():
-                unified_qr = item.borrowing_qr_code
-                break
-        
-        if not unified_qr:
-            # Create a temporary one or use a dummy for now? 
-            # Better: Generate one and just don't overwrite everything else.
-            # We'll use the first item to generate it but we won't necessarily 
-            # overwrite its own individual QR IF we handle it carefully.
-            # Actually, let's just use the group_id logic.
-            group_id = f"{supply_request.user.id}-{supply_request.created_at.strftime('%Y%m%d%H%M')}"
-            
-            # To avoid overwriting supply_request's own code, let's use a dummy or separate logic
-            # For now, let's just ENSURE everyone has at least their individual one
-            for item in batch_items:
-                if not item.borrowing_qr_code:
-                    item.generate_borrowing_qr_code()
-            
-            # Re-fetch or generate the unified one for the context only?
-            # Creating a dedicated file for the unified QR if it doesn't exist
-            from django.core.files.base import ContentFile
-            import qrcode
-            from io import BytesIO
-            
-            qr_data = f"BORROW-BATCH-{group_id}"
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            
-            # We can save this to one of the items but don't force it on all
-            first_item = batch_items[0]
-            # If we REALLY want to show it, we need a URL.
-            # Let's just use the first item's borrowing_qr_code if it's already a batch one
-            # otherwise generate it.
-            # This is complex because borrowing_qr_code is a FileField.
-            
-            # Simplest: The individual items keep their QRs. 
-            # The "Unified" QR on the detail page will be based on the first item's QR IF it's batch
-            # ELSE we just show the first item's QR and call it unified? No, that's wrong.
-            
-            # Let's fix the generate logic to be more flexible.
-            pass
-
-    # Ensure all items HAVE unique QR codes (individual tracking)
-    for item in batch_items:
-        if not item.borrowing_qr_code or "batch" in item.borrowing_qr_code.name.lower():
-            # If it doesn't have one or has a batch one, generate an individual one
-            item.generate_borrowing_qr_code() # This will generate BORROW-{id}-...
-    
-    # Now that they all have unique ones, we need a unified one for the summary.
-    # We'll generate it on the fly if needed for display.
-    unified_qr_url = None
-    if is_batch:
-        group_id = f"{supply_request.user.id}-{supply_request.created_at.strftime('%Y%m%d%H%M')}"
-        # Check if we already have it saved in media
-        unified_filename = f"borrowing_batch_{group_id}_qr.png"
-        unified_path = os.path.join(settings.MEDIA_ROOT, 'qrcodes', unified_filename)
-        
-        if os.path.exists(unified_path):
-            unified_qr_url = os.path.join(settings.MEDIA_URL, 'qrcodes', unified_filename)
-        else:
-            # Generate it but don't necessarily link it to a model field yet
-            # Or just link it to the first item but don't overwrite its unique one
-            # (Wait, SupplyRequest only has ONE borrowing_qr_code field)
-            
-            # Let's just generate the unique ones and the batch QR will just be 
-            # the first item's QR if it's treated as a batch QR? No.
-            
-            # Okay, let's do this: 
-            # Individual items get their BORROW-{id}-... codes.
-            # The "Unified" QR is just for convenience.
-            # I will generate it and save it to the media folder.
-            import qrcode
-            qr_data = f"BORROW-BATCH-{group_id}"
-            img = qrcode.make(qr_data)
-            
-            # Ensure folder exists
-            qr_dir = os.path.join(settings.MEDIA_ROOT, 'qrcodes')
-            if not os.path.exists(qr_dir):
-                os.makedirs(qr_dir)
-                
-            img.save(unified_path)
-            unified_qr_url = os.path.join(settings.MEDIA_URL, 'qrcodes', unified_filename)
+    if supply_request.batch_id:
+        batch_items = supply_request.batch.requests.select_related("supply").order_by("id")
+    else:
+        batch_items = SupplyRequest.objects.filter(pk=supply_request.pk)
+    batch_items = list(batch_items)
+
+    is_batch = len(batch_items) > 1
+
+    # Labels are rendered on demand by qr_image; nothing is written on a GET
+    unified_qr_url = supply_request.batch_qr_image_url if is_batch else None
+
+    # Return progress of every batch item in one aggregate query
+    progress = {
+        row["supply_request_id"]: row
+        for row in BorrowedItem.objects.filter(supply_request__in=batch_items)
+        .values("supply_request_id")
+        .annotate(
+            total=Count("id"),
+            returned=Count("id", filter=Q(returned_at__isnull=False)),
+            issues=Count("id", filter=Q(return_status__in=["damaged", "lost"])),
+        )
+    }
 
     # Calculate individual status for each batch item based on BorrowedItems
     processed_batch_items = []
     for item in batch_items:
         # Check return progress for this specific request
-        borrowed_items = BorrowedItem.objects.filter(supply_request=item)
-        total_borrowed = borrowed_items.count()
-        returned_count = borrowed_items.filter(returned_at__isnull=False).count()
-        has_issues = borrowed_items.filter(return_status__in=['damaged', 'lost']).exists()
+        item_progress = progress.get(item.pk, {})
+        total_borrowed = item_progress.get("total", 0)
+        returned_count = item_progress.get("returned", 0)
+        has_issues = bool(item_progress.get("issues"))
         
         # Calculate display status
         item_status = item.status
@@ -882,34 +893,27 @@ def request_approve(request, pk):
     supply_request.save()
 
     # Sync with other items in the same batch
-    batch_qs = SupplyRequest.objects.filter(
-        user=supply_request.user,
-        created_at__year=supply_request.created_at.year,
-        created_at__month=supply_request.created_at.month,
-        created_at__day=supply_request.created_at.day,
-        created_at__hour=supply_request.created_at.hour,
-        created_at__minute=supply_request.created_at.minute,
-        status="pending"
-    )
+    batch_qs = SupplyRequest.objects.filter(batch_id=supply_request.batch_id, status="pending")
 
-    synchronized_count = batch_qs.exclude(pk=supply_request.pk).update(
-        status="approved", approved_by=request.user, approved_at=now
+    synchronized_count = 0
+    if supply_request.batch_id:
+        synchronized_count = batch_qs.exclude(pk=supply_request.pk).update(
+            status="approved", approved_by=request.user, approved_at=now
+        )
+
+    # Hold instances for the approved requests until they are released
+    reserve_instances(
+        SupplyRequest.objects.filter(batch_id=supply_request.batch_id, status="approved")
+        if supply_request.batch_id else [supply_request],
+        request.user,
     )
 
     # Proactively generate/sync batch QR code
     total_batch_count = synchronized_count + 1
     if total_batch_count > 1:
-        group_id = f"{supply_request.user.id}-{supply_request.created_at.strftime('%Y%m%d%H%M')}"
-        supply_request.generate_borrowing_qr_code(group_id=group_id)
         # Update all items in batch including the current one
-        SupplyRequest.objects.filter(
-            user=supply_request.user,
-            created_at__year=supply_request.created_at.year,
-            created_at__month=supply_request.created_at.month,
-            created_at__day=supply_request.created_at.day,
-            created_at__hour=supply_request.created_at.hour,
-            created_at__minute=supply_request.created_at.minute,
-        ).update(borrowing_qr_code=supply_request.borrowing_qr_code.name)
+        supply_request.issue_batch_qr_label()
+        refresh_batch_summaries([supply_request.batch_id])
 
     success_msg = f"Request {supply_request.request_id} approved successfully."
     if synchronized_count > 0:
@@ -947,6 +951,7 @@ def request_reject(request, pk):
     supply_request.approved_by = request.user
     supply_request.approved_at = timezone.now()
     supply_request.save()
+    release_reservations([supply_request])
 
     if request.htmx:
         messages.success(request, f"Request {supply_request.request_id} rejected.")
@@ -962,77 +967,67 @@ def request_reject(request, pk):
 
 @login_required
 @require_http_methods(["POST"])
+@idempotent
 def request_release(request, pk):
     if request.user.role not in ["admin", "gso_staff"]:
         messages.error(request, "Unauthorized")
         return redirect("request_list")
 
-    supply_request = get_object_or_404(SupplyRequest, pk=pk)
+    try:
+        with transaction.atomic():
+            supply_request = get_object_or_404(
+                SupplyRequest.objects.select_for_update().select_related("supply"), pk=pk
+            )
 
-    if supply_request.status != "approved":
-        messages.error(request, "Request must be approved first")
-        return redirect("request_detail", pk=pk)
+            if supply_request.status != "approved":
+                messages.error(request, "Request must be approved first")
+                return redirect("request_detail", pk=pk)
 
-    if supply_request.supply.quantity < supply_request.quantity_requested:
+            entry = StockLedger(request.user).remove(
+                supply_request.supply,
+                supply_request.quantity_requested,
+                f"Released for request {supply_request.request_id}",
+            )
+
+            # Update request status
+            supply_request.status = "released"
+            supply_request.released_by = request.user
+            supply_request.released_at = timezone.now()
+            supply_request.save()
+
+            # Create BorrowedItem record to track the issued items
+            BorrowedItem.objects.create(
+                supply=supply_request.supply,
+                borrower=supply_request.user,
+                supply_request=supply_request,  # Link to the SupplyRequest for return tracking
+                borrowed_quantity=supply_request.quantity_requested,
+                borrowed_date=timezone.now().date(),
+                location_when_borrowed=supply_request.supply.location or "",
+                notes=f"Released for request {supply_request.request_id}",
+            )
+            # Units held for the request at approval are free again
+            release_reservations([supply_request])
+
+            # Log the scan for the scanner's recent transmissions list
+            QRScanLog.objects.create(
+                supply=supply_request.supply,
+                scanned_by=request.user,
+                action="issue",
+                location=supply_request.supply.location or "",
+                notes=f"Released via request detail/scanner (REQ: {supply_request.request_id})",
+                supply_request=supply_request,
+            )
+    except InsufficientStock:
         messages.error(request, "Insufficient stock")
         return redirect("request_detail", pk=pk)
 
-    # Update supply quantity
-    previous_quantity = supply_request.supply.quantity
-    supply_request.supply.quantity -= supply_request.quantity_requested
-    supply_request.supply.save()
-
     # Check for low stock alert
-    new_quantity = supply_request.supply.quantity
     alert_message = check_low_stock_alerts(
-        supply_request.supply, previous_quantity, new_quantity
+        supply_request.supply, entry.previous_quantity, entry.new_quantity
     )
     if alert_message:
         messages.warning(request, alert_message)
 
-    # Update request status
-    supply_request.status = "released"
-    supply_request.released_by = request.user
-    supply_request.released_at = timezone.now()
-    supply_request.save()
-
-    # Create BorrowedItem record to track the issued items
-    try:
-        BorrowedItem.objects.create(
-            supply=supply_request.supply,
-            borrower=supply_request.user,
-            supply_request=supply_request,  # Link to the SupplyRequest for return tracking
-            borrowed_quantity=supply_request.quantity_requested,
-            borrowed_date=timezone.now().date(),
-            location_when_borrowed=supply_request.supply.location or "",
-            notes=f"Released for request {supply_request.request_id}",
-        )
-    except Exception:
-        # If creating the borrowed item fails, log but continue with transaction
-        pass
-
-    # Log the transaction
-    InventoryTransaction.objects.create(
-        supply=supply_request.supply,
-        transaction_type="out",
-        quantity=-supply_request.quantity_requested,
-        previous_quantity=previous_quantity,
-        new_quantity=supply_request.supply.quantity,
-        reason=f"Released for request {supply_request.request_id}",
-        performed_by=request.user,
-    )
-
-    # Log the scan for the scanner's recent transmissions list
-    from .models import QRScanLog
-
-    QRScanLog.objects.create(
-        supply=supply_request.supply,
-        scanned_by=request.user,
-        action="issue",
-        location=supply_request.supply.location or "",
-        notes=f"Released via request detail/scanner (REQ: {supply_request.request_id})",
-    )
-
     if request.htmx:
         messages.success(
             request, f"Request {supply_request.request_id} released successfully."
@@ -1058,58 +1053,47 @@ def qr_scanner(request):
 def get_recent_scans(request):
     """API endpoint to fetch recent QR scans for the current user, grouped by batch"""
     try:
-        import re
-
-        # Get more records to allow for grouping and still return a decent list
-        recent_scans = (
-            QRScanLog.objects.filter(scanned_by=request.user)
-            .select_related("supply", "scanned_by")
-            .order_by("-timestamp")[:40]
+        # Batch scans share a batch_group_id and fold into one entry; a scan
+        # outside a batch is its own group. Grouping, ordering and the limit
+        # all run in SQL so the feed is exact however large a batch is.
+        batch_id = NullIf("batch_group_id", Value(""))
+        scans = QRScanLog.objects.filter(scanned_by=request.user).annotate(
+            group=Coalesce(batch_id, Cast("id", CharField()))
         )
-
-        grouped_data = []
-        # Temporary storage for batch grouping: {group_key: index_in_grouped_data}
-        batch_map = {}
-
-        for scan in recent_scans:
-            # Try to extract Group ID from notes
-            group_id = None
-            if scan.notes:
-                match = re.search(r"\(Group: (.*?)\)", scan.notes)
-                if match:
-                    group_id = match.group(1)
-
-            # Create a key for grouping: (action, group_id, day_hour_minute)
-            timestamp_key = scan.timestamp.strftime("%Y%m%d%H%M")
-            group_key = (
-                f"{scan.action}_{group_id or 'single'}_{timestamp_key}"
-                if group_id
-                else None
+        entries = list(
+            scans.values("action", "group")
+            .annotate(
+                last_scan=Max("timestamp"),
+                item_count=Count("id"),
+                batched=Count(batch_id),
+                last_location=Max("location"),
+            )
+            .order_by("-last_scan")[:10]
+        )
+        batch_groups = [e["group"] for e in entries if e["batched"]]
+        single_ids = [e["group"] for e in entries if not e["batched"]]
+
+        items = {}
+        members = scans.filter(
+            Q(batch_group_id__in=batch_groups) | Q(id__in=single_ids)
+        ).order_by("-timestamp").values("action", "group", "supply_id", "supply__name")
+        for scan in members:
+            items.setdefault((scan["action"], scan["group"]), []).append(
+                {"name": scan["supply__name"], "id": scan["supply_id"]}
             )
 
-            if group_key and group_key in batch_map:
-                # Add to existing group
-                idx = batch_map[group_key]
-                grouped_data[idx]["items"].append(
-                    {"name": scan.supply.name, "id": scan.supply.id}
-                )
-            else:
-                # New entry (single or start of group)
-                entry = {
-                    "action": scan.action,
-                    "scanned_by": {"username": scan.scanned_by.username},
-                    "location": scan.location,
-                    "timestamp": scan.timestamp.isoformat(),
-                    "is_batch": group_id is not None,
-                    "items": [{"name": scan.supply.name, "id": scan.supply.id}],
-                }
-                grouped_data.append(entry)
-                if group_id:
-                    batch_map[group_key] = len(grouped_data) - 1
-
-            # Stop if we have 10 top-level entries
-            if len(grouped_data) >= 10:
-                break
+        grouped_data = [
+            {
+                "action": entry["action"],
+                "scanned_by": {"username": request.user.username},
+                "location": entry["last_location"],
+                "timestamp": entry["last_scan"].isoformat(),
+                "is_batch": bool(entry["batched"]),
+                "item_count": entry["item_count"],
+                "items": items.get((entry["action"], entry["group"]), []),
+            }
+            for entry in entries
+        ]
 
         return JsonResponse({"success": True, "recent_scans": grouped_data})
     except Exception as e:
@@ -1118,16 +1102,35 @@ def get_recent_scans(request):
 
 @login_required
 @require_http_methods(["POST"])
+@idempotent
 def process_qr_scan(request):
     # Parse JSON data if sent as JSON, otherwise use form data
     if request.content_type == "application/json":
         try:
             data = json.loads(request.body)
-            form = QRScanForm(data)
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON data"}, status=400)
     else:
-        form = QRScanForm(request.POST)
+        data = request.POST
+
+    return _process_scan(request, data)
+
+
+def _process_scan(request, data, codes=None):
+    """
+    Handle one scan action. ``data`` holds the scan fields (qr_data, action,
+    quantity, return_status, ...); ``codes`` optionally maps payloads to
+    registry entries that were already loaded, as process_qr_scan_batch does.
+    Time, query count and outcome are recorded in inventory.scan_metrics.
+    """
+    with ScanTrace(data.get("action"), str(data.get("qr_data", ""))) as trace:
+        response = _handle_scan(request, data, codes, trace)
+        trace.status = response.status_code
+    return response
+
+
+def _handle_scan(request, data, codes, trace):
+    form = QRScanForm(data)
 
     if form.is_valid():
         qr_data = form.cleaned_data["qr_data"]
@@ -1140,11 +1143,10 @@ def process_qr_scan(request):
         # Get quantity for issue/return actions
         quantity = 1  # Default to 1
         if action in ["issue", "return"]:
-            # Try to get quantity from form data
-            if request.content_type == "application/json":
+            try:
                 quantity = int(data.get("quantity", 1))
-            else:
-                quantity = int(request.POST.get("quantity", 1))
+            except (TypeError, ValueError):
+                return JsonResponse({"error": "Invalid quantity"}, status=400)
 
             # Validate quantity
             if quantity < 1:
@@ -1154,13 +1156,16 @@ def process_qr_scan(request):
 
         # Extract supply ID from QR data
         try:
-            # Check if this is a borrowing QR code
-            print(f"Processing QR data: {qr_data}")  # Debugging
+            # Resolve the payload through the QR registry (one indexed lookup)
+            if codes is not None and qr_data in codes:
+                code = codes[qr_data]
+            else:
+                code = resolve_qr_code(qr_data)
+            trace.branch = scan_branch(code)
             
             # Handle individual equipment instance QR codes (INSTANCE-{id})
-            if qr_data.startswith("INSTANCE-"):
-                instance_id = int(qr_data.split("-")[1])
-                instance = get_object_or_404(EquipmentInstance, pk=instance_id)
+            if code and code.target_type == "instance":
+                instance = get_object_or_404(EquipmentInstance, pk=code.target_id)
                 
                 if action == "scan":
                     # Check if this instance is currently borrowed
@@ -1202,70 +1207,20 @@ def process_qr_scan(request):
                     # Check if this is an execution request (process return)
                     return_status = data.get('return_status')
                     if return_status:
-                        # Process the return
-                        borrowed_item.returned_at = timezone.now()
-                        borrowed_item.return_status = return_status
-                        
-                        # Add note
-                        notes = data.get('notes', '')
-                        if notes:
-                            note_text = f"[{request.user.username} - {timezone.now().strftime('%Y-%m-%d %H:%M')}] {return_status.upper()}: {notes}"
-                            if borrowed_item.notes:
-                                borrowed_item.notes += f"\n\n{note_text}"
-                            else:
-                                borrowed_item.notes = note_text
-                        
-                        borrowed_item.save()
-                        
-                        # Update instance and supply based on status
-                        supply = borrowed_item.supply
-                        previous_qty = supply.quantity
-                        
-                        if return_status == 'returned':
-                            instance.status = 'available'
-                            supply.quantity += 1
-                            tx_type = 'in'
-                            reason = f"Returned instance {instance.instance_code} (Partial batch return)"
-                        elif return_status == 'damaged':
-                            instance.status = 'maintenance'
-                            # Quantity doesn't increase for damaged (usually)
-                            tx_type = 'damaged'
-                            reason = f"Instance {instance.instance_code} returned damaged"
-                        elif return_status == 'lost':
-                            instance.status = 'retired'
-                            tx_type = 'lost'
-                            reason = f"Instance {instance.instance_code} reported lost"
-                            
-                        instance.save()
-                        supply.save()
-                        
-                        # Log transaction
-                        InventoryTransaction.objects.create(
-                            supply=supply,
-                            transaction_type=tx_type,
-                            quantity=1 if tx_type == 'in' else -1, # Logical adjustment
-                            previous_quantity=previous_qty,
-                            new_quantity=supply.quantity,
-                            reason=reason,
-                            performed_by=request.user,
+                        if return_status not in RETURN_STATUSES:
+                            return JsonResponse({"error": "Invalid return status."}, status=400)
+                        # Only a still-open loan is closed, so a repeated or concurrent
+                        # return of the same instance credits stock once
+                        processed = return_items(
+                            request.user,
+                            {borrowed_item.pk: (return_status, data.get('notes', ''))},
+                            source=f"QR scan of instance {instance.instance_code}",
                         )
-                        
-                        # Update SupplyRequest status if all items are returned
-                        if borrowed_item.supply_request:
-                            supply_request = borrowed_item.supply_request
-                            all_items = BorrowedItem.objects.filter(supply_request=supply_request)
-                            unreturned_items = all_items.filter(returned_at__isnull=True)
-                            
-                            if not unreturned_items.exists():
-                                # All items returned - check if any had issues
-                                has_issues = all_items.filter(return_status__in=['damaged', 'lost']).exists()
-                                supply_request.status = 'returned_with_issues' if has_issues else 'returned'
-                                supply_request.save()
-                            elif all_items.filter(returned_at__isnull=False).exists():
-                                # Some items returned, some still out
-                                supply_request.status = 'partially_returned'
-                                supply_request.save()
-                        
+                        if not processed:
+                            return JsonResponse({
+                                "error": f"Instance {instance.instance_code} has already been returned."
+                            }, status=409)
+
                         return JsonResponse({
                             "success": True,
                             "message": f"Item {instance.instance_code} return processed successfully ({return_status})."
@@ -1314,30 +1269,15 @@ def process_qr_scan(request):
                         "message": f"Instance {instance.instance_code} is available for issue.",
                     })
             
-            elif qr_data.startswith("BORROW-BATCH-") or qr_data.startswith(
-                "SUPPLY-REQ-BATCH-"
-            ):
+            elif code and code.target_type == "batch":
                 # Handle batch request QR code (borrowing or supply)
-                parts = qr_data.split("-")
-                if qr_data.startswith("BORROW-BATCH-"):
-                    is_borrowing_batch = True
-                    user_id = int(parts[2])
-                    timestamp_str = parts[3]
-                else:  # SUPPLY-REQ-BATCH-
-                    is_borrowing_batch = False
-                    user_id = int(parts[3])
-                    timestamp_str = parts[4]
-
-                target_time = timestamp_str[:12]
-                group_id = f"{user_id}-{timestamp_str}"
+                is_borrowing_batch = code.payload.startswith("BORROW-BATCH-")
+                group_id = code.batch_group_id
 
                 # Get all requests in this batch
-                # Filter by user and timestamp proximity
-                batch_items = []
-                all_user_requests = SupplyRequest.objects.filter(user_id=user_id)
-                for req in all_user_requests:
-                    if req.created_at.strftime("%Y%m%d%H%M") == target_time:
-                        batch_items.append(req)
+                batch_items = list(
+                    batch_requests(code).select_related("user", "supply", "equipment_instance")
+                )
 
                 if not batch_items:
                     return JsonResponse(
@@ -1353,7 +1293,9 @@ def process_qr_scan(request):
 
                     # Fetch actual BorrowedItems status
                     borrowed_map = {}
-                    borrowed_items = BorrowedItem.objects.filter(batch_group_id=group_id)
+                    borrowed_items = BorrowedItem.objects.filter(
+                        batch__group_id=group_id
+                    ).select_related("equipment_instance")
                     for bi in borrowed_items:
                         # Map by supply_id (simple mapping, might need instance mapping if multiple same supply)
                         # For now, just track if ANY of this supply is returned? 
@@ -1421,120 +1363,20 @@ def process_qr_scan(request):
 
                 elif action == "issue":
                     # Batch Release/Issue Logic
-                    count = 0
-                    error_items = []
-
-                    for req in batch_items:
-                        # Only process approved requests
-                        if req.status != "approved":
-                            continue
-
-                        # Check stock
-                        if req.supply.quantity < req.quantity_requested:
-                            error_items.append(
-                                f"{req.supply.name} (Insufficient stock)"
-                            )
-                            continue
-
-                        # Update supply quantity
-                        previous_quantity = req.supply.quantity
-                        req.supply.quantity -= req.quantity_requested
-                        req.supply.save()
-
-                        # Update request status
-                        req.status = "released"
-                        req.released_by = request.user
-                        req.released_at = timezone.now()
-                        req.save()
-
-                        # Create BorrowedItem record if it's a borrowing request
-                        # Create BorrowedItem record if it's a borrowing request
-                        if "[BORROWING]" in req.purpose:
-                            # Check if specific instance was requested
-                            if hasattr(req, 'equipment_instance') and req.equipment_instance:
-                                instance = req.equipment_instance
-                                # Check if still available (status might have changed)
-                                if instance.status == 'available':
-                                    BorrowedItem.objects.create(
-                                        supply=req.supply,
-                                        supply_request=req,
-                                        equipment_instance=instance,
-                                        borrower=req.user,
-                                        borrowed_quantity=1,
-                                        borrowed_date=timezone.now().date(),
-                                        location_when_borrowed=req.supply.location or location,
-                                        notes=f"Released via Batch QR Scan (Group: {group_id}) - Instance: {instance.instance_code}",
-                                        batch_group_id=group_id,
-                                    )
-                                    instance.status = 'borrowed'
-                                    instance.save()
-                                else:
-                                    # Requested instance not available, log warning or try fallback
-                                    # For now, fallback to random available instance
-                                    available_instances = req.supply.instances.filter(status='available').exclude(id=instance.id)[:1]
-                                    if available_instances.exists():
-                                        new_instance = available_instances.first()
-                                        BorrowedItem.objects.create(
-                                            supply=req.supply,
-                                            supply_request=req,
-                                            equipment_instance=new_instance,
-                                            borrower=req.user,
-                                            borrowed_quantity=1,
-                                            borrowed_date=timezone.now().date(),
-                                            location_when_borrowed=req.supply.location or location,
-                                            notes=f"Released via Batch QR Scan (Group: {group_id}) - Instance: {new_instance.instance_code} (Requested {instance.instance_code} unavailable)",
-                                            batch_group_id=group_id,
-                                        )
-                                        new_instance.status = 'borrowed'
-                                        new_instance.save()
-                            else:
-                                # Normal flow (no specific instance requested)
-                                # Get available instances for this supply
-                                available_instances = req.supply.instances.filter(
-                                    status='available'
-                                )[:req.quantity_requested]
-                                
-                                # Create a BorrowedItem for each instance (or one if no instances)
-                                if available_instances.exists():
-                                    for instance in available_instances:
-                                        borrowed_item = BorrowedItem.objects.create(
-                                            supply=req.supply,
-                                            supply_request=req,
-                                            equipment_instance=instance,
-                                            borrower=req.user,
-                                            borrowed_quantity=1,
-                                            borrowed_date=timezone.now().date(),
-                                            location_when_borrowed=req.supply.location or location,
-                                            notes=f"Released via Batch QR Scan (Group: {group_id}) - Instance: {instance.instance_code}",
-                                            batch_group_id=group_id,
-                                        )
-                                        # Update instance status
-                                        instance.status = 'borrowed'
-                                        instance.save()
-                                else:
-                                    # No instances, create single borrowed item
-                                    BorrowedItem.objects.create(
-                                        supply=req.supply,
-                                        supply_request=req,
-                                        borrower=req.user,
-                                        borrowed_quantity=req.quantity_requested,
-                                        borrowed_date=timezone.now().date(),
-                                        location_when_borrowed=req.supply.location or location,
-                                        notes=f"Released via Batch QR Scan (Group: {group_id})",
-                                        batch_group_id=group_id,
-                                    )
-
-                        # Log inventory transaction
-                        InventoryTransaction.objects.create(
-                            supply=req.supply,
-                            transaction_type="out",
-                            quantity=-req.quantity_requested,
-                            previous_quantity=previous_quantity,
-                            new_quantity=req.supply.quantity,
-                            reason=f"Released via Batch QR Scan (Group: {group_id})",
-                            performed_by=request.user,
+                    try:
+                        released, error_items = release_batch(
+                            batch_items[0].batch,
+                            request.user,
+                            f"Released via Batch QR Scan (Group: {group_id})",
+                            location=location,
+                            log_scans=False,
+                        )
+                    except InstancesTaken:
+                        return JsonResponse(
+                            {"error": "Some units of this batch were just claimed by another release. Please scan again."},
+                            status=409,
                         )
-                        count += 1
+                    count = len(released)
 
                     if count == 0 and not error_items:
                         return JsonResponse(
@@ -1560,40 +1402,11 @@ def process_qr_scan(request):
 
                 elif action == "return":
                     # Batch Return Logic - redirect to batch return page
-                    # Check if there are any unreturned borrowed items with this batch_group_id
-                    unreturned_items = BorrowedItem.objects.filter(
-                        batch_group_id=group_id,
+                    # Unreturned borrowed items of this batch, joined through RequestBatch
+                    unreturned_items = batch_borrowed_items(group_id).filter(
                         returned_at__isnull=True
                     )
                     
-                    # Fallback: If no items found by batch_group_id, try matching by user and timestamp
-                    if not unreturned_items.exists():
-                        # Parse user_id and target_time from group_id
-                        try:
-                            user_id_str, timestamp_part = group_id.split("-", 1)
-                            target_time = timestamp_part[:12]  # YYYYMMDDHHMM
-                            
-                            # Find unreturned borrowed items for this user with matching borrowed_at timestamp
-                            all_user_borrowed = BorrowedItem.objects.filter(
-                                borrower_id=int(user_id_str),
-                                returned_at__isnull=True
-                            )
-                            
-                            matching_items = []
-                            for item in all_user_borrowed:
-                                if item.borrowed_at.strftime("%Y%m%d%H%M") == target_time:
-                                    matching_items.append(item)
-                                    # Assign batch_group_id for future lookups
-                                    item.batch_group_id = group_id
-                                    item.save(update_fields=['batch_group_id'])
-                            
-                            if matching_items:
-                                unreturned_items = BorrowedItem.objects.filter(
-                                    id__in=[item.id for item in matching_items]
-                                )
-                        except (ValueError, AttributeError):
-                            pass
-                    
                     if not unreturned_items.exists():
                         return JsonResponse(
                             {"error": "No unreturned items found in this batch."},
@@ -1612,25 +1425,10 @@ def process_qr_scan(request):
                         }
                     )
 
-            elif qr_data.startswith("BORROW-") or qr_data.startswith("SUPPLY-REQ-"):
+            elif code and code.target_type == "request":
                 # This is a borrowing or supply request QR code
-                parts = qr_data.split("-")
-                if qr_data.startswith("BORROW-"):
-                    request_id = int(parts[1])
-                    user_id = int(parts[2])
-                    supply_id = int(parts[3])
-                else:  # SUPPLY-REQ-
-                    request_id = int(parts[2])
-                    user_id = int(parts[3])
-                    supply_id = int(parts[4])
-
-                print(
-                    f"Parsed QR data - Request ID: {request_id}, User ID: {user_id}, Supply ID: {supply_id}"
-                )  # Debugging
-
-                # Get the request
                 borrowing_request = get_object_or_404(
-                    SupplyRequest, id=request_id, user_id=user_id, supply_id=supply_id
+                    SupplyRequest.objects.select_related("user", "supply"), id=code.target_id
                 )
                 message = ""
 
@@ -1673,23 +1471,20 @@ def process_qr_scan(request):
                     # Issue the borrowed/requested item
                     supply = borrowing_request.supply
 
-                    # Check if there's enough quantity available
-                    if supply.quantity >= borrowing_request.quantity_requested:
-                        # Reduce supply quantity
-                        previous_quantity = supply.quantity
-                        supply.quantity -= borrowing_request.quantity_requested
-                        if location:
-                            supply.location = location
-                        supply.save()
-
-                        # Track borrowed item with the correct borrower
-                        if "[BORROWING]" in borrowing_request.purpose:
-                            # Get available instances for this supply
-                            available_instances = supply.instances.filter(
-                                status='available'
-                            )[:borrowing_request.quantity_requested]
-                            
-                            if available_instances.exists():
+                    # Reduce supply quantity if there's enough available and claim
+                    # instances in the same transaction, so a lost claim puts the stock back
+                    try:
+                        with transaction.atomic():
+                            StockLedger(request.user).remove(
+                                supply,
+                                borrowing_request.quantity_requested,
+                                f"Released via Request QR Scan (REQ: {borrowing_request.request_id})",
+                            )
+
+                            # Track borrowed item with the correct borrower
+                            if "[BORROWING]" in borrowing_request.purpose:
+                                # Claim available instances for this supply
+                                available_instances = allocate_instances([borrowing_request])[borrowing_request.pk]
                                 for instance in available_instances:
                                     BorrowedItem.objects.create(
                                         supply=supply,
@@ -1701,18 +1496,30 @@ def process_qr_scan(request):
                                         location_when_borrowed=location or supply.location,
                                         notes=f"{notes} Instance: {instance.instance_code}",
                                     )
-                                    instance.status = 'borrowed'
-                                    instance.save()
-                            else:
-                                BorrowedItem.objects.create(
-                                    supply=supply,
-                                    supply_request=borrowing_request,
-                                    borrower=borrowing_request.user,
-                                    borrowed_quantity=borrowing_request.quantity_requested,
-                                    borrowed_date=timezone.now().date(),
-                                    location_when_borrowed=location or supply.location,
-                                    notes=notes,
-                                )
+
+                                if not available_instances:
+                                    BorrowedItem.objects.create(
+                                        supply=supply,
+                                        supply_request=borrowing_request,
+                                        borrower=borrowing_request.user,
+                                        borrowed_quantity=borrowing_request.quantity_requested,
+                                        borrowed_date=timezone.now().date(),
+                                        location_when_borrowed=location or supply.location,
+                                        notes=notes,
+                                    )
+                        released = True
+                    except InsufficientStock:
+                        released = False
+                    except InstancesTaken:
+                        return JsonResponse(
+                            {"error": f"The units of {supply.name} were just claimed by another release. Please scan again."},
+                            status=409,
+                        )
+
+                    if released:
+                        if location:
+                            supply.location = location
+                            supply.save(update_fields=["location"])
 
                         # Mark the request as released
                         borrowing_request.status = "released"
@@ -1720,17 +1527,6 @@ def process_qr_scan(request):
                         borrowing_request.released_at = timezone.now()
                         borrowing_request.save()
 
-                        # Log inventory transaction
-                        InventoryTransaction.objects.create(
-                            supply=supply,
-                            transaction_type="out",
-                            quantity=-borrowing_request.quantity_requested,
-                            previous_quantity=previous_quantity,
-                            new_quantity=supply.quantity,
-                            reason=f"Released via Request QR Scan (REQ: {borrowing_request.request_id})",
-                            performed_by=request.user,
-                        )
-
                         message += f" Fulfilled request {borrowing_request.request_id}."
 
                         # Log the scan
@@ -1740,6 +1536,7 @@ def process_qr_scan(request):
                             action=action,
                             location=location or supply.location,
                             notes=notes,
+                            supply_request=borrowing_request,
                         )
 
                         # Get recent transaction history for this supply
@@ -1797,91 +1594,27 @@ def process_qr_scan(request):
                             "error": f"No active borrow record found for {borrowing_request.supply.name}."
                         }, status=404)
                     
-                    # Handle return status submission (from JSON request)
-                    return_status = None
-                    if request.content_type == "application/json":
-                        try:
-                            # Re-parse JSON data to be sure
-                            data = json.loads(request.body)
-                            return_status = data.get('return_status')
-                        except:
-                            pass
+                    # Handle return status submission
+                    return_status = data.get('return_status')
                     
                     if return_status:
-                        # Process the return
-                        borrowed_item.returned_at = timezone.now()
-                        borrowed_item.return_status = return_status
-                        
-                        # Add note
-                        notes_input = data.get('notes', '') if request.content_type == "application/json" else request.POST.get('notes', '')
-                            
-                        if notes_input:
-                            note_text = f"[{request.user.username} - {timezone.now().strftime('%Y-%m-%d %H:%M')}] {return_status.upper()}: {notes_input}"
-                            if borrowed_item.notes:
-                                borrowed_item.notes += f"\n\n{note_text}"
-                            else:
-                                borrowed_item.notes = note_text
-                        
-                        borrowed_item.save()
-                        
-                        # Update supply quantity and instance if applicable
-                        supply = borrowed_item.supply
-                        previous_qty = supply.quantity
-                        
-                        instance = borrowed_item.equipment_instance
-                        tx_type = 'in' # Default for success
-                        reason = f"Item {supply.name} returned from {borrowing_request.request_id}"
-                        
-                        if return_status == 'returned':
-                            if instance:
-                                instance.status = 'available'
-                                instance.save()
-                            supply.quantity += 1
-                        elif return_status == 'damaged':
-                            if instance:
-                                instance.status = 'maintenance'
-                                instance.save()
-                            tx_type = 'damaged'
-                            reason = f"Item {supply.name} marked as damaged via QR scan (Request: {borrowing_request.request_id})"
-                        elif return_status == 'lost':
-                            if instance:
-                                instance.status = 'retired'
-                                instance.save()
-                            tx_type = 'lost'
-                            reason = f"Item {supply.name} marked as lost via QR scan (Request: {borrowing_request.request_id})"
-                            
-                        supply.save()
-                        
-                        # Update SupplyRequest status if linked
-                        if borrowed_item.supply_request:
-                            supply_request = borrowed_item.supply_request
-                            all_items = BorrowedItem.objects.filter(supply_request=supply_request)
-                            unreturned_items = all_items.filter(returned_at__isnull=True)
-                            
-                            if not unreturned_items.exists():
-                                # All items returned - check for issues
-                                has_issues = all_items.filter(return_status__in=['damaged', 'lost']).exists()
-                                supply_request.status = 'returned_with_issues' if has_issues else 'returned'
-                            elif all_items.filter(returned_at__isnull=False).exists():
-                                # At least one item returned, but some still out
-                                supply_request.status = 'partially_returned'
-                            
-                            supply_request.save()
-                        
-                        # Log transaction
-                        InventoryTransaction.objects.create(
-                            supply=supply,
-                            transaction_type=tx_type,
-                            quantity=1 if tx_type == 'in' else -1,
-                            previous_quantity=previous_qty,
-                            new_quantity=supply.quantity,
-                            reason=reason,
-                            performed_by=request.user,
+                        if return_status not in RETURN_STATUSES:
+                            return JsonResponse({"error": "Invalid return status."}, status=400)
+                        # Only a still-open loan is closed, so a repeated or concurrent
+                        # return credits stock once
+                        processed = return_items(
+                            request.user,
+                            {borrowed_item.pk: (return_status, data.get('notes', ''))},
+                            source=f"QR scan of request {borrowing_request.request_id}",
                         )
+                        if not processed:
+                            return JsonResponse({
+                                "error": f"{borrowed_item.supply.name} has already been returned."
+                            }, status=409)
                         
                         return JsonResponse({
                             "success": True,
-                            "message": f"Return of {supply.name} processed successfully."
+                            "message": f"Return of {borrowed_item.supply.name} processed successfully."
                         })
 
                     else:
@@ -1914,9 +1647,7 @@ def process_qr_scan(request):
             # If the frontend supplied a borrowing_request_id directly (JSON payload),
             # allow the scanner to operate on that request as well. This enables the
             # QR scanner to send an 'issue' action that marks a specific request as released.
-            if request.content_type == "application/json" and data.get(
-                "borrowing_request_id"
-            ):
+            if data.get("borrowing_request_id"):
                 try:
                     br_id = int(data.get("borrowing_request_id"))
                 except (TypeError, ValueError):
@@ -1976,29 +1707,28 @@ def process_qr_scan(request):
                     )
 
             # Handle regular supply QR codes
-            if qr_data.startswith("SUPPLY-"):
-                supply_id = int(qr_data.split("-")[1])
-            else:
-                supply_id = int(qr_data)
-
-            supply = Supply.objects.get(pk=supply_id)
-
-            # Store previous quantity for transaction logging
-            previous_quantity = supply.quantity
+            if code is None or code.target_type != "supply":
+                raise Supply.DoesNotExist
+            supply = Supply.objects.get(pk=code.target_id)
 
             # Implement business logic based on action
             if action == "issue":
                 # Issue action - remove items from stock
-                if supply.quantity >= quantity:
-                    supply.quantity -= quantity
+                try:
+                    entry = StockLedger(request.user).remove(
+                        supply, quantity, f"Issued {quantity} items via QR scan"
+                    )
+                except InsufficientStock:
+                    entry = None
+
+                if entry is not None:
                     supply.location = location
-                    supply.save()
+                    supply.save(update_fields=["location"])
                     message = f"Supply {supply.name} issued successfully. Quantity reduced by {quantity}."
 
                     # Check for low stock alert
-                    new_quantity = supply.quantity
                     alert_message = check_low_stock_alerts(
-                        supply, previous_quantity, new_quantity
+                        supply, entry.previous_quantity, entry.new_quantity
                     )
                     if alert_message:
                         message += f" {alert_message}"
@@ -2045,9 +1775,6 @@ def process_qr_scan(request):
             elif action == "return":
                 # Get return status from request data
                 return_status = data.get("return_status", "returned")
-                print(
-                    f"[DEBUG] Return request - qr_data: {qr_data[:50] if len(qr_data) > 50 else qr_data}..., return_status: '{return_status}'"
-                )  # DEBUG
 
                 # Update borrowed item record
                 # Find any active borrowed item for this supply by this user
@@ -2075,9 +1802,11 @@ def process_qr_scan(request):
                 # Handle different return statuses
                 if return_status == "returned":
                     # Normal return - add items back to stock
-                    supply.quantity += quantity
+                    StockLedger(request.user).add(
+                        supply, quantity, f"Returned via QR scan - {notes}"
+                    )
                     supply.location = location
-                    supply.save()
+                    supply.save(update_fields=["location"])
 
                     borrowed_item.returned_at = timezone.now()
                     borrowed_item.location_when_returned = location
@@ -2090,17 +1819,6 @@ def process_qr_scan(request):
                     ).update(status="returned")
 
                     message = f"Supply {supply.name} returned successfully. Quantity increased by {quantity}."
-
-                    # Log inventory transaction
-                    InventoryTransaction.objects.create(
-                        supply=supply,
-                        transaction_type="in",
-                        quantity=quantity,
-                        previous_quantity=supply.quantity - quantity,
-                        new_quantity=supply.quantity,
-                        reason=f"Returned via QR scan - {notes}",
-                        performed_by=request.user,
-                    )
                 elif return_status in ["damaged", "lost"]:
                     # Write off - do not add back to stock
                     borrowed_item.returned_at = timezone.now()
@@ -2114,14 +1832,8 @@ def process_qr_scan(request):
                     ).update(status="returned")
 
                     # Log write-off transaction
-                    InventoryTransaction.objects.create(
-                        supply=supply,
-                        transaction_type=return_status,
-                        quantity=-quantity,
-                        previous_quantity=supply.quantity,
-                        new_quantity=supply.quantity,
-                        reason=f"Marked as {return_status} via QR scan - {notes}",
-                        performed_by=request.user,
+                    StockLedger(request.user).record(
+                        supply, return_status, -quantity, f"Marked as {return_status} via QR scan - {notes}"
                     )
 
                     label = "Damaged" if return_status == "damaged" else "Lost"
@@ -2140,27 +1852,9 @@ def process_qr_scan(request):
                 notes=notes,
             )
 
-            # Log inventory transaction for issue/return actions
+            # The ledger logged the inventory transaction for issue/return actions
             transaction_history = []
             if action in ["issue", "return"]:
-                transaction_type = "out" if action == "issue" else "in"
-                quantity_change = -quantity if action == "issue" else quantity
-                reason = (
-                    f"Issued {quantity} items via QR scan"
-                    if action == "issue"
-                    else f"Returned {quantity} items via QR scan"
-                )
-
-                InventoryTransaction.objects.create(
-                    supply=supply,
-                    transaction_type=transaction_type,
-                    quantity=quantity_change,
-                    previous_quantity=previous_quantity,
-                    new_quantity=supply.quantity,
-                    reason=reason,
-                    performed_by=request.user,
-                )
-
                 # Get recent transaction history for this supply
                 recent_transactions = supply.transactions.order_by("-created_at")[:5]
                 transaction_history = [
@@ -2224,6 +1918,82 @@ def process_qr_scan(request):
     return JsonResponse({"error": "Invalid form data"}, status=400)
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def qr_scan_metrics(request):
+    """
+    Per-branch scan latency and query-count histograms of this worker
+    process, for admins. POST with reset=1 clears them.
+    """
+    if request.user.role != "admin":
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+    if request.method == "POST" and request.POST.get("reset"):
+        scan_metrics.reset()
+    return JsonResponse(scan_metrics.snapshot())
+
+
+class _ScanRejected(Exception):
+    """Raised inside a scan's savepoint to undo its writes."""
+
+
+@login_required
+@require_http_methods(["POST"])
+@idempotent
+def process_qr_scan_batch(request):
+    """
+    Process an ordered list of scan actions in one request and one
+    transaction. Each entry has the fields process_qr_scan accepts (qr_data,
+    action, quantity, location, notes, return_status) plus an optional
+    client_id that is echoed back. Registry entries for every payload are
+    loaded up front; each scan runs in its own savepoint, so a rejected scan
+    leaves no partial writes and does not stop the rest of the batch.
+    """
+    try:
+        scans = json.loads(request.body).get("scans")
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    if not isinstance(scans, list) or not scans:
+        return JsonResponse({"error": "Expected a non-empty list of scans"}, status=400)
+    if len(scans) > QR_SCAN_BATCH_MAX:
+        return JsonResponse(
+            {"error": f"At most {QR_SCAN_BATCH_MAX} scans can be sent at once"}, status=400
+        )
+    if not all(isinstance(scan, dict) for scan in scans):
+        return JsonResponse({"error": "Each scan must be an object"}, status=400)
+
+    payloads = {str(scan.get("qr_data", "")).strip() for scan in scans}
+    codes = {code.payload: code for code in QRCode.objects.filter(payload__in=payloads)}
+
+    results = []
+    with transaction.atomic():
+        for index, scan in enumerate(scans):
+            try:
+                with transaction.atomic():
+                    response = _process_scan(request, scan, codes)
+                    if response.status_code >= 400:
+                        raise _ScanRejected
+            except _ScanRejected:
+                pass
+            result = json.loads(response.content)
+            result.update(
+                index=index,
+                client_id=scan.get("client_id"),
+                status=response.status_code,
+                success=response.status_code < 400,
+            )
+            results.append(result)
+
+    succeeded = sum(1 for result in results if result["success"])
+    return JsonResponse(
+        {
+            "success": True,
+            "processed": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        }
+    )
+
+
 @login_required
 def reports(request):
     if request.user.role not in ["admin", "gso_staff"]:
@@ -2327,6 +2097,18 @@ def reports(request):
         else:
             filtered_requests = filtered_requests.none()
 
+    # Stock in the supplies report is as of the end of the date range
+    stock_as_of = None
+    if report_type == "supplies":
+        if date_to:
+            try:
+                from datetime import datetime
+
+                stock_as_of = end_of_day(datetime.strptime(date_to, "%Y-%m-%d").date())
+            except ValueError:
+                pass
+        filtered_supplies = with_stock_as_of(filtered_supplies.select_related("category"), stock_as_of)
+
     # Order by creation date
     filtered_requests = filtered_requests.order_by("-created_at")
     filtered_transactions = filtered_transactions.select_related(
@@ -2351,6 +2133,7 @@ def reports(request):
         "filtered_requests": filtered_requests,
         "filtered_transactions": filtered_transactions,
         "filtered_supplies": filtered_supplies,
+        "stock_as_of": stock_as_of,
         "filtered_users": filtered_users,
         "date_from": date_from,
         "date_to": date_to,
@@ -2419,6 +2202,7 @@ def export_supplies_csv(request):
         except ValueError:
             pass
 
+    stock_as_of = None
     if date_to:
         try:
             from datetime import datetime
@@ -2426,11 +2210,15 @@ def export_supplies_csv(request):
             date_to_obj = datetime.strptime(date_to, "%Y-%m-%d")
             from datetime import timedelta
 
+            stock_as_of = end_of_day(date_to_obj.date())
             date_to_obj = date_to_obj + timedelta(days=1)
             supplies = supplies.filter(created_at__lt=date_to_obj)
         except ValueError:
             pass
 
+    # Stock and value as of the end of the date range, from inventory snapshots
+    supplies = with_stock_as_of(supplies, stock_as_of)
+
     # Create the HttpResponse object with CSV header
     response = HttpResponse(content_type="text/csv")
     response["Content-Disposition"] = 'attachment; filename="supplies_report.csv"'
@@ -2445,7 +2233,7 @@ def export_supplies_csv(request):
             "Name",
             "Category",
             "Description",
-            "Quantity",
+            f"Quantity (as of {date_to})" if stock_as_of else "Quantity",
             "Min Stock Level",
             "Unit",
             "Cost Per Unit",
@@ -2463,7 +2251,7 @@ def export_supplies_csv(request):
                 supply.name,
                 supply.category.name if supply.category else "",
                 supply.description,
-                supply.quantity,
+                supply.stock_on_hand,
                 supply.min_stock_level,
                 supply.unit,
                 supply.cost_per_unit,
@@ -2723,24 +2511,19 @@ def generate_qr_codes_bulk(request):
         messages.error(request, "No supplies selected for QR code generation.")
         return redirect("supply_list")
 
-    generated_count = 0
-    failed_count = 0
-
-    for supply_id in supply_ids:
-        try:
-            supply = Supply.objects.get(pk=supply_id)
-            if not supply.qr_code:
-                supply.generate_qr_code()
-                generated_count += 1
-        except Supply.DoesNotExist:
-            failed_count += 1
-        except Exception as e:
-            failed_count += 1
+    pending_ids = list(
+        Supply.objects.filter(pk__in=supply_ids)
+        .filter(Q(qr_code="") | Q(qr_code__isnull=True))
+        .values_list("pk", flat=True)
+    )
+    failed_count = len(set(supply_ids)) - Supply.objects.filter(pk__in=supply_ids).count()
 
-    if generated_count > 0:
+    job = None
+    if pending_ids:
+        job = enqueue_qr_render("supply", pending_ids, request.user)
         messages.success(
             request,
-            f"Successfully generated QR codes for {generated_count} supply item(s).",
+            f"Generating QR codes for {len(pending_ids)} supply item(s) in the background.",
         )
     if failed_count > 0:
         messages.error(
@@ -2748,10 +2531,10 @@ def generate_qr_codes_bulk(request):
         )
 
     # Redirect back to the referring page or supply list
-    next_url = request.GET.get("next") or request.META.get("HTTP_REFERER")
-    if next_url:
-        return redirect(next_url)
-    return redirect("supply_list")
+    next_url = request.GET.get("next") or request.META.get("HTTP_REFERER") or reverse("supply_list")
+    if job:
+        next_url = _with_qr_job(next_url, job)
+    return redirect(next_url)
 
 
 @login_required
@@ -2823,27 +2606,15 @@ def get_qr_code(request, pk):
     """Get QR code for a supply item (AJAX endpoint)"""
     supply = get_object_or_404(Supply, pk=pk)
 
-    # Generate QR code if it doesn't exist
-    if not supply.qr_code:
-        try:
-            supply.generate_qr_code()
-        except Exception as e:
-            return JsonResponse(
-                {"success": False, "error": f"Failed to generate QR code: {str(e)}"}
-            )
-
-    # Make sure we return the QR code URL even if it already existed
-    if supply.qr_code:
-        return JsonResponse(
-            {
-                "success": True,
-                "qr_url": supply.qr_code.url,
-                "supply_name": supply.name,
-                "supply_id": supply.id,
-            }
-        )
-    else:
-        return JsonResponse({"success": False, "error": "QR code not available"})
+    # The label is rendered on demand when the URL is first requested
+    return JsonResponse(
+        {
+            "success": True,
+            "qr_url": supply.qr_image_url,
+            "supply_name": supply.name,
+            "supply_id": supply.id,
+        }
+    )
 
 
 def landing_page(request):
@@ -2902,6 +2673,7 @@ def export_supplies_pdf(request):
         except ValueError:
             pass
 
+    stock_as_of = None
     if date_to:
         try:
             from datetime import datetime
@@ -2909,11 +2681,15 @@ def export_supplies_pdf(request):
             date_to_obj = datetime.strptime(date_to, "%Y-%m-%d")
             from datetime import timedelta
 
+            stock_as_of = end_of_day(date_to_obj.date())
             date_to_obj = date_to_obj + timedelta(days=1)
             supplies = supplies.filter(created_at__lt=date_to_obj)
         except ValueError:
             pass
 
+    # Stock and value as of the end of the date range, from inventory snapshots
+    supplies = with_stock_as_of(supplies, stock_as_of)
+
     # Create the HttpResponse object with PDF header
     response = HttpResponse(content_type="application/pdf")
     response["Content-Disposition"] = 'attachment; filename="supplies_report.pdf"'
@@ -2978,7 +2754,9 @@ def export_supplies_pdf(request):
             report_info_style,
         )
     )
-    elements.append(Paragraph(f"Total Records: {supplies.count()}", report_info_style))
+    elements.append(Paragraph(f"Total Records: {len(supplies)}", report_info_style))
+    if stock_as_of:
+        elements.append(Paragraph(f"Stock as of end of {date_to}", report_info_style))
 
     # Add filter info
     if search_query or date_from or date_to:
@@ -2995,11 +2773,11 @@ def export_supplies_pdf(request):
     elements.append(Spacer(1, 0.2 * inch))
 
     # Summary Statistics
-    low_stock_count = supplies.filter(quantity__lte=F("min_stock_level")).count()
-    total_value = sum(supply.quantity * supply.cost_per_unit for supply in supplies)
+    low_stock_count = sum(1 for supply in supplies if supply.stock_on_hand <= supply.min_stock_level)
+    total_value = sum(supply.stock_value for supply in supplies)
     elements.append(
         Paragraph(
-            f"<b>Summary:</b> {supplies.count()} total items | {low_stock_count} low stock items | Total Value: ₱{total_value:,.2f}",
+            f"<b>Summary:</b> {len(supplies)} total items | {low_stock_count} low stock items | Total Value: ₱{total_value:,.2f}",
             report_info_style,
         )
     )
@@ -3018,13 +2796,13 @@ def export_supplies_pdf(request):
         ]
     ]
     for supply in supplies:
-        item_total = supply.quantity * supply.cost_per_unit
+        item_total = supply.stock_value
         data.append(
             [
                 str(supply.id),
                 str(supply.name)[:25],
                 str(supply.category.name) if supply.category else "",
-                str(supply.quantity),
+                str(supply.stock_on_hand),
                 f"₱{supply.cost_per_unit:,.2f}",
                 f"₱{item_total:,.2f}",
                 str(supply.location),
@@ -3930,7 +3708,7 @@ def export_borrowed_items_csv(request):
     status_filter = request.GET.get("status", "")
 
     # Start with all borrowed items
-    items = BorrowedItem.objects.select_related("supply", "borrower").all()
+    items = BorrowedItem.objects.with_due_status().select_related("supply", "borrower")
 
     # Apply search filter
     if search_query:
@@ -3947,11 +3725,9 @@ def export_borrowed_items_csv(request):
     elif status_filter == "borrowed":
         items = items.filter(returned_at__isnull=True)
     elif status_filter == "overdue":
-        items = items.filter(
-            returned_at__isnull=True,
-            return_deadline__isnull=False,
-            return_deadline__lt=timezone.now().date(),
-        )
+        items = items.filter(due_status_db="overdue")
+    elif status_filter == "due_soon":
+        items = items.filter(due_status_db__in=["due_today", "due_soon"])
 
     # Create the HttpResponse object with CSV header
     response = HttpResponse(content_type="text/csv")
@@ -4021,7 +3797,7 @@ def export_borrowed_items_pdf(request):
     status_filter = request.GET.get("status", "")
 
     # Start with all borrowed items
-    items = BorrowedItem.objects.select_related("supply", "borrower").all()
+    items = BorrowedItem.objects.with_due_status().select_related("supply", "borrower")
 
     # Apply search filter
     if search_query:
@@ -4038,11 +3814,9 @@ def export_borrowed_items_pdf(request):
     elif status_filter == "borrowed":
         items = items.filter(returned_at__isnull=True)
     elif status_filter == "overdue":
-        items = items.filter(
-            returned_at__isnull=True,
-            return_deadline__isnull=False,
-            return_deadline__lt=timezone.now().date(),
-        )
+        items = items.filter(due_status_db="overdue")
+    elif status_filter == "due_soon":
+        items = items.filter(due_status_db__in=["due_today", "due_soon"])
 
     # Create the HttpResponse object with PDF header
     response = HttpResponse(content_type="application/pdf")
@@ -4123,13 +3897,14 @@ def export_borrowed_items_pdf(request):
     elements.append(Spacer(1, 0.2 * inch))
 
     # Summary Statistics
-    overdue_count = items.filter(
-        returned_at__isnull=True, return_deadline__lt=timezone.now().date()
-    ).count()
-    active_count = items.filter(
-        returned_at__isnull=True, return_deadline__gte=timezone.now().date()
-    ).count()
-    returned_count = items.filter(returned_at__isnull=False).count()
+    status_counts = items.aggregate(
+        overdue=Count("id", filter=Q(due_status_db="overdue")),
+        active=Count("id", filter=Q(due_status_db__in=["due_today", "due_soon", "on_time"])),
+        returned=Count("id", filter=Q(due_status_db="returned")),
+    )
+    overdue_count = status_counts["overdue"]
+    active_count = status_counts["active"]
+    returned_count = status_counts["returned"]
     total_value = sum(
         item.borrowed_quantity * item.supply.cost_per_unit for item in items
     )
@@ -4239,16 +4014,13 @@ def borrowed_items_list(request):
     """
     user = request.user
 
-    # Proactively check for overdue items and notify staff
-    if user.role in ["admin", "gso_staff"]:
-        ensure_overdue_notifications()
-
     # For admin and GSO staff, show all borrowed items
     # For department users, show only their borrowed items
-    if user.role in ["admin", "gso_staff"]:
-        borrowed_items = BorrowedItem.objects.all()
-    else:
-        borrowed_items = BorrowedItem.objects.filter(borrower=user)
+    borrowed_items = BorrowedItem.objects.with_due_status().select_related(
+        "supply", "borrower"
+    )
+    if user.role not in ["admin", "gso_staff"]:
+        borrowed_items = borrowed_items.filter(borrower=user)
 
     # Filter by return status
     status_filter = request.GET.get("status", "")  # Default to showing all items
@@ -4257,11 +4029,14 @@ def borrowed_items_list(request):
     elif status_filter == "borrowed":
         borrowed_items = borrowed_items.filter(returned_at__isnull=True)
     elif status_filter == "overdue":
-        borrowed_items = borrowed_items.filter(
-            returned_at__isnull=True,
-            return_deadline__isnull=False,
-            return_deadline__lt=timezone.now().date(),
-        )
+        borrowed_items = borrowed_items.filter(due_status_db="overdue")
+    elif status_filter == "due_soon":
+        borrowed_items = borrowed_items.filter(due_status_db__in=["due_today", "due_soon"])
+
+    # Most urgent first: overdue, due today, due soon, on time, returned
+    sort_by = request.GET.get("sort", "")
+    if sort_by == "due":
+        borrowed_items = borrowed_items.order_by("due_priority", "return_deadline", "-borrowed_at")
 
     # Search functionality
     search = request.GET.get("search", "")
@@ -4311,6 +4086,7 @@ def borrowed_items_list(request):
     context = {
         "borrowed_items": enhanced_borrowed_items,
         "status_filter": status_filter,
+        "sort_by": sort_by,
         "search": search,
         "batch_groups": batch_groups,
     }
@@ -4345,21 +4121,11 @@ def manage_borrowed_item(request, pk):
                 borrowed_item.notes = request.POST.get("notes", borrowed_item.notes)
                 borrowed_item.save()
 
-                # Update the supply quantity
-                supply = borrowed_item.supply
-                previous_quantity = supply.quantity
-                supply.quantity += borrowed_item.borrowed_quantity
-                supply.save()
-
-                # Log inventory transaction
-                InventoryTransaction.objects.create(
-                    supply=supply,
-                    transaction_type="in",
-                    quantity=borrowed_item.borrowed_quantity,
-                    previous_quantity=previous_quantity,
-                    new_quantity=supply.quantity,
-                    reason=f"Returned borrowed item (ID: {borrowed_item.id})",
-                    performed_by=request.user,
+                # Put the items back into stock
+                StockLedger(request.user).add(
+                    borrowed_item.supply,
+                    borrowed_item.borrowed_quantity,
+                    f"Returned borrowed item (ID: {borrowed_item.id})",
                 )
 
                 messages.success(
@@ -4400,15 +4166,11 @@ def manage_borrowed_item(request, pk):
                 borrowed_item.save()
 
                 # Log inventory transaction (item is lost, doesn't return to stock)
-                supply = borrowed_item.supply
-                InventoryTransaction.objects.create(
-                    supply=supply,
-                    transaction_type="lost",
-                    quantity=-borrowed_item.borrowed_quantity,
-                    previous_quantity=supply.quantity,
-                    new_quantity=supply.quantity,  # Stock doesn't increase since item is lost
-                    reason=f"Item reported as lost (Borrowed Item ID: {borrowed_item.id}). {reason}",
-                    performed_by=request.user,
+                StockLedger(request.user).record(
+                    borrowed_item.supply,
+                    "lost",
+                    -borrowed_item.borrowed_quantity,
+                    f"Item reported as lost (Borrowed Item ID: {borrowed_item.id}). {reason}",
                 )
 
                 messages.warning(
@@ -4433,15 +4195,11 @@ def manage_borrowed_item(request, pk):
                 borrowed_item.save()
 
                 # Log inventory transaction (item is damaged, doesn't return to stock)
-                supply = borrowed_item.supply
-                InventoryTransaction.objects.create(
-                    supply=supply,
-                    transaction_type="damaged",
-                    quantity=-borrowed_item.borrowed_quantity,
-                    previous_quantity=supply.quantity,
-                    new_quantity=supply.quantity,  # Stock doesn't increase since item is damaged
-                    reason=f"Item reported as damaged (Borrowed Item ID: {borrowed_item.id}). {reason}",
-                    performed_by=request.user,
+                StockLedger(request.user).record(
+                    borrowed_item.supply,
+                    "damaged",
+                    -borrowed_item.borrowed_quantity,
+                    f"Item reported as damaged (Borrowed Item ID: {borrowed_item.id}). {reason}",
                 )
 
                 messages.warning(
@@ -4504,149 +4262,27 @@ def batch_return_items(request, batch_group_id):
         return redirect("borrowed_items_list")
 
     # Get all unreturned items in the batch
-    borrowed_items = BorrowedItem.objects.filter(
-        batch_group_id=batch_group_id,
+    borrowed_items = batch_borrowed_items(batch_group_id).filter(
         returned_at__isnull=True
     ).select_related('supply', 'borrower')
 
-    # Fallback: If no items found by batch_group_id, try matching by user and timestamp
-    if not borrowed_items.exists():
-        try:
-            user_id_str, timestamp_part = batch_group_id.split("-", 1)
-            target_time = timestamp_part[:12]  # YYYYMMDDHHMM
-            
-            # Find unreturned borrowed items for this user with matching borrowed_at timestamp
-            all_user_borrowed = BorrowedItem.objects.filter(
-                borrower_id=int(user_id_str),
-                returned_at__isnull=True
-            )
-            
-            matching_ids = []
-            for item in all_user_borrowed:
-                if item.borrowed_at.strftime("%Y%m%d%H%M") == target_time:
-                    matching_ids.append(item.id)
-                    # Assign batch_group_id for future lookups
-                    item.batch_group_id = batch_group_id
-                    item.save(update_fields=['batch_group_id'])
-            
-            if matching_ids:
-                borrowed_items = BorrowedItem.objects.filter(
-                    id__in=matching_ids
-                ).select_related('supply', 'borrower')
-        except (ValueError, AttributeError):
-            pass
-
     if not borrowed_items.exists():
         messages.info(request, "No unreturned items found in this batch.")
         return redirect("borrowed_items_list")
 
     if request.method == "POST":
-        returned_count = 0
-        damaged_count = 0
-        lost_count = 0
-
-        for item in borrowed_items:
-            status = request.POST.get(f"status_{item.id}")
-            notes = request.POST.get(f"notes_{item.id}", "").strip()
-            
-            if status in ["returned", "damaged", "lost"]:
-                item.returned_at = timezone.now()
-                item.return_status = status
-                
-                # Add note with status
-                if notes:
-                    note_text = f"[{request.user.username} - {timezone.now().strftime('%Y-%m-%d %H:%M')}] {status.upper()}: {notes}"
-                    if item.notes:
-                        item.notes += f"\n\n{note_text}"
-                    else:
-                        item.notes = note_text
-                
-                item.save()
-
-                supply = item.supply
-                previous_quantity = supply.quantity
-
-                if status == "returned":
-                    # Item returned in good condition - add back to stock
-                    supply.quantity += item.borrowed_quantity
-                    supply.save()
-                    
-                    # Update equipment instance status if linked
-                    if item.equipment_instance:
-                        item.equipment_instance.status = 'available'
-                        item.equipment_instance.save()
-                    
-                    InventoryTransaction.objects.create(
-                        supply=supply,
-                        transaction_type="in",
-                        quantity=item.borrowed_quantity,
-                        previous_quantity=previous_quantity,
-                        new_quantity=supply.quantity,
-                        reason=f"Returned borrowed item (Batch return, ID: {item.id}){' - Instance: ' + item.equipment_instance.instance_code if item.equipment_instance else ''}",
-                        performed_by=request.user,
-                    )
-                    returned_count += 1
-
-                elif status == "damaged":
-                    # Item damaged - don't add to stock
-                    # Update equipment instance status if linked
-                    if item.equipment_instance:
-                        item.equipment_instance.status = 'maintenance'
-                        item.equipment_instance.save()
-                    
-                    # Update item status
-                    item.return_status = "damaged"
-                    
-                    # Add detailed note
-                    note_text = f"[{request.user.username} - {timezone.now().strftime('%Y-%m-%d %H:%M')}] DAMAGED: {notes}"
-                    if item.notes:
-                        item.notes += f"\n\n{note_text}"
-                    else:
-                        item.notes = note_text
-                    
-                    # Log transaction
-                    InventoryTransaction.objects.create(
-                        supply=supply,
-                        transaction_type="damaged",
-                        quantity=-item.borrowed_quantity,
-                        previous_quantity=previous_quantity,
-                        new_quantity=supply.quantity,
-                        reason=f"Item reported damaged during batch return: {notes}",
-                        performed_by=request.user,
-                    )
-                    damaged_count += 1
-
-                elif status == "lost":
-                    # Item lost - don't add to stock
-                    # Update equipment instance status if linked
-                    if item.equipment_instance:
-                        item.equipment_instance.status = 'retired'
-                        item.equipment_instance.save()
-                    
-                    # Update item status
-                    item.return_status = "lost"
-                    
-                    # Add detailed note
-                    note_text = f"[{request.user.username} - {timezone.now().strftime('%Y-%m-%d %H:%M')}] LOST: {notes}"
-                    if item.notes:
-                        item.notes += f"\n\n{note_text}"
-                    else:
-                        item.notes = note_text
-                    
-                    # Log transaction
-                    InventoryTransaction.objects.create(
-                        supply=supply,
-                        transaction_type="lost",
-                        quantity=-item.borrowed_quantity,
-                        previous_quantity=previous_quantity,
-                        new_quantity=supply.quantity,
-                        reason=f"Item reported lost during batch return: {notes}",
-                        performed_by=request.user,
-                    )
-                    lost_count += 1
-                
-                item.returned_at = timezone.now()
-                item.save()
+        # Condition and notes chosen for each item of the batch
+        manifest = {
+            item_id: (
+                request.POST.get(f"status_{item_id}"),
+                request.POST.get(f"notes_{item_id}", "").strip(),
+            )
+            for item_id in borrowed_items.values_list("id", flat=True)
+        }
+        processed = return_items(request.user, manifest)
+        returned_count = processed["returned"]
+        damaged_count = processed["damaged"]
+        lost_count = processed["lost"]
 
         # Build success message
         msg_parts = []
@@ -4662,33 +4298,6 @@ def batch_return_items(request, batch_group_id):
         else:
             messages.info(request, "No items were processed.")
 
-        # Update SupplyRequest status for all related requests in this batch
-        # Get all unique supply_request IDs from the returned borrowed items
-        related_request_ids = BorrowedItem.objects.filter(
-            batch_group_id=batch_group_id
-        ).exclude(supply_request__isnull=True).values_list('supply_request_id', flat=True).distinct()
-        
-        for req_id in related_request_ids:
-            try:
-                supply_request = SupplyRequest.objects.get(pk=req_id)
-                
-                # Check if all borrowed items for this request are returned
-                all_items = BorrowedItem.objects.filter(supply_request=supply_request)
-                returned_items = all_items.filter(returned_at__isnull=False)
-                unreturned_items = all_items.filter(returned_at__isnull=True)
-                
-                if not unreturned_items.exists():
-                    # All items returned - determine final status
-                    has_issues = all_items.filter(return_status__in=['damaged', 'lost']).exists()
-                    supply_request.status = 'returned_with_issues' if has_issues else 'returned'
-                elif returned_items.exists():
-                    # Some items returned, some still out
-                    supply_request.status = 'partially_returned'
-                
-                supply_request.save()
-            except SupplyRequest.DoesNotExist:
-                pass
-
         return redirect("borrowed_items_list")
 
     context = {
@@ -4728,38 +4337,22 @@ def department_request_history(request):
     # Order by creation date (newest first)
     requests = requests.order_by("-created_at")
 
-    # Group batch requests by creation time (within 5 seconds = batch submission)
-    requests_list = list(requests)
+    # Group requests by their RequestBatch
     grouped_requests = []
-
-    i = 0
-    while i < len(requests_list):
-        current = requests_list[i]
-        batch = [current]
-
-        # Look ahead to see if next requests are part of the same batch
-        # (created within 5 seconds and same purpose)
-        j = i + 1
-        while j < len(requests_list):
-            next_req = requests_list[j]
-            time_diff = (current.created_at - next_req.created_at).total_seconds()
-
-            # If requests are within 5 seconds and have same purpose, they're in same batch
-            if abs(time_diff) <= 5 and current.purpose == next_req.purpose:
-                batch.append(next_req)
-                j += 1
-            else:
-                break
-
-        grouped_requests.append(
-            {
-                "is_batch": len(batch) > 1,
-                "batch_id": current.created_at.strftime("%Y%m%d%H%M%S"),
-                "items": batch,
+    groups_by_batch = {}
+    for req in requests.select_related("supply", "batch"):
+        group = groups_by_batch.get(req.batch_id) if req.batch_id else None
+        if group is None:
+            group = {
+                "batch_id": req.batch.group_id if req.batch_id else req.created_at.strftime("%Y%m%d%H%M%S"),
+                "items": [],
             }
-        )
-
-        i = j if j > i + 1 else i + 1
+            grouped_requests.append(group)
+            if req.batch_id:
+                groups_by_batch[req.batch_id] = group
+        group["items"].append(req)
+    for group in grouped_requests:
+        group["is_batch"] = len(group["items"]) > 1
 
     context = {
         "grouped_requests": grouped_requests,
@@ -4810,27 +4403,27 @@ def approve_borrow_request(request, pk):
             supply_request.approved_at = now
             supply_request.save()
 
-            # Sync with other items in the same batch (created by same user within same minute)
-            batch_qs = SupplyRequest.objects.filter(
-                user=supply_request.user,
-                created_at__year=supply_request.created_at.year,
-                created_at__month=supply_request.created_at.month,
-                created_at__day=supply_request.created_at.day,
-                created_at__hour=supply_request.created_at.hour,
-                created_at__minute=supply_request.created_at.minute,
-            )
+            # Sync with other items in the same batch
+            batch_qs = SupplyRequest.objects.filter(batch_id=supply_request.batch_id)
 
-            synchronized_count = (
-                batch_qs.filter(status="pending")
-                .exclude(pk=supply_request.pk)
-                .update(status="approved", approved_by=request.user, approved_at=now)
-            )
+            synchronized_count = 0
+            if supply_request.batch_id:
+                synchronized_count = (
+                    batch_qs.filter(status="pending")
+                    .exclude(pk=supply_request.pk)
+                    .update(status="approved", approved_by=request.user, approved_at=now)
+                )
 
-            # Proactively generate/sync batch QR code
-            if batch_qs.count() > 1:
-                group_id = f"{supply_request.user.id}-{supply_request.created_at.strftime('%Y%m%d%H%M')}"
-                supply_request.generate_borrowing_qr_code(group_id=group_id)
-                batch_qs.update(borrowing_qr_code=supply_request.borrowing_qr_code.name)
+                # Proactively generate/sync batch QR code
+                if batch_qs.count() > 1:
+                    supply_request.issue_batch_qr_label()
+                refresh_batch_summaries([supply_request.batch_id])
+
+            # Hold instances for the approved requests until they are released
+            reserve_instances(
+                batch_qs.filter(status="approved") if supply_request.batch_id else [supply_request],
+                request.user,
+            )
 
             if synchronized_count > 0:
                 messages.success(
@@ -4848,52 +4441,44 @@ def approve_borrow_request(request, pk):
             # Default behavior: create BorrowedItem and mark as released (existing behavior)
             form = BorrowedItemForm(request.POST)
             if form.is_valid():
-                borrowed_item = form.save(commit=False)
-                borrowed_item.supply = supply_request.supply
-                borrowed_item.borrower = supply_request.user
-                borrowed_item.borrowed_quantity = supply_request.quantity_requested
-                
-                # Assign batch_group_id for items in the same batch
-                batch_group_id = f"{supply_request.user.id}-{supply_request.created_at.strftime('%Y%m%d%H%M')}"
-                borrowed_item.batch_group_id = batch_group_id
-                
-                borrowed_item.save()
+                try:
+                    with transaction.atomic():
+                        borrowed_item = form.save(commit=False)
+                        borrowed_item.supply = supply_request.supply
+                        borrowed_item.borrower = supply_request.user
+                        borrowed_item.borrowed_quantity = supply_request.quantity_requested
 
-                # Update supply request status to released
-                now = timezone.now()
-                supply_request.status = "released"
-                supply_request.approved_by = request.user
-                supply_request.approved_at = now
-                supply_request.released_by = request.user
-                supply_request.released_at = now
-                supply_request.save()
-
-                # Also synchronize approval for other pending items in the same batch
-                SupplyRequest.objects.filter(
-                    user=supply_request.user,
-                    status="pending",
-                    created_at__year=supply_request.created_at.year,
-                    created_at__month=supply_request.created_at.month,
-                    created_at__day=supply_request.created_at.day,
-                    created_at__hour=supply_request.created_at.hour,
-                    created_at__minute=supply_request.created_at.minute,
-                ).update(status="approved", approved_by=request.user, approved_at=now)
-
-                # Update supply quantity
-                previous_quantity = supply_request.supply.quantity
-                supply_request.supply.quantity -= supply_request.quantity_requested
-                supply_request.supply.save()
-
-                # Log inventory transaction
-                InventoryTransaction.objects.create(
-                    supply=supply_request.supply,
-                    transaction_type="out",
-                    quantity=-supply_request.quantity_requested,
-                    previous_quantity=previous_quantity,
-                    new_quantity=supply_request.supply.quantity,
-                    reason=f"Borrowed item (ID: {borrowed_item.id}) - Return by {borrowed_item.return_deadline}",
-                    performed_by=request.user,
-                )
+                        # Assign the batch of the request for items in the same batch
+                        borrowed_item.batch = supply_request.batch
+                        borrowed_item.batch_group_id = supply_request.batch_qr_group_id
+
+                        borrowed_item.save()
+
+                        # Update supply request status to released
+                        now = timezone.now()
+                        supply_request.status = "released"
+                        supply_request.approved_by = request.user
+                        supply_request.approved_at = now
+                        supply_request.released_by = request.user
+                        supply_request.released_at = now
+                        supply_request.save()
+
+                        # Also synchronize approval for other pending items in the same batch
+                        if supply_request.batch_id:
+                            SupplyRequest.objects.filter(
+                                batch_id=supply_request.batch_id, status="pending"
+                            ).update(status="approved", approved_by=request.user, approved_at=now)
+                            refresh_batch_summaries([supply_request.batch_id])
+
+                        # Update supply quantity and log the inventory transaction
+                        StockLedger(request.user).remove(
+                            supply_request.supply,
+                            supply_request.quantity_requested,
+                            f"Borrowed item (ID: {borrowed_item.id}) - Return by {borrowed_item.return_deadline}",
+                        )
+                except InsufficientStock:
+                    messages.error(request, "Insufficient stock")
+                    return redirect("request_detail", pk=pk)
 
                 messages.success(
                     request,
@@ -4972,21 +4557,29 @@ def request_borrow_item(request):
                     # OR just link them. The system seems to prefer individual records for instances.
                     # Batch request view creates separate requests for each instance.
                     
-                    batch_group_id = f"BATCH-{uuid.uuid4().hex[:8].upper()}"
+                    # One batch for the whole submission
+                    batch = create_batch(request.user, is_borrowing=True)
                     
+                    selected = []
                     for inst_id in instance_ids:
-                        instance = EquipmentInstance.objects.filter(id=inst_id, status='available').first()
+                        instance = unreserved(EquipmentInstance.objects.filter(id=inst_id, status='available')).first()
                         if instance:
                             req = SupplyRequest.objects.create(
                                 user=request.user,
                                 supply=supply,
+                                equipment_instance=instance,
                                 quantity_requested=1,
                                 status='pending',
                                 requested_location=supply_request.requested_location,
                                 purpose=f"[BORROWING] {supply_request.purpose}\n\nBorrow Duration: {borrow_duration} days (Unit: {instance.instance_code})",
-                                batch_group_id=batch_group_id
+                                batch=batch,
+                                batch_group_id=batch.group_id,
                             )
-                            req.generate_borrowing_qr_code()
+                            selected.append(req)
+                    if not selected:
+                        batch.delete()
+                    # Hold the selected units while the requests await approval
+                    reserve_instances(selected, request.user)
                     
                     messages.success(
                         request,
@@ -4998,9 +4591,6 @@ def request_borrow_item(request):
                     supply_request.purpose = f"[BORROWING] {supply_request.purpose}\n\nBorrow Duration: {borrow_duration} days"
                     supply_request.save()
 
-                    # Generate borrowing QR code
-                    supply_request.generate_borrowing_qr_code()
-
                     messages.success(
                         request,
                         f"Borrow request submitted successfully. GSO staff will review and approve your request.",
@@ -5020,7 +4610,7 @@ def request_borrow_item(request):
         "name"
     ):
         instances_data = []
-        for instance in s.instances.filter(status='available'):
+        for instance in unreserved(s.instances.filter(status='available')):
             instances_data.append({
                 'id': instance.id,
                 'code': instance.instance_code,
@@ -5093,9 +4683,9 @@ def request_borrow_batch(request):
                 messages.error(request, "Please select at least one item to borrow.")
             else:
                 try:
-                    # Generate a consistent group_id for this batch
-                    timestamp = timezone.now().strftime("%Y%m%d%H%M")
-                    group_id = f"{request.user.id}-{timestamp}"
+                    # One batch for the whole submission
+                    batch = create_batch(request.user, is_borrowing=True)
+                    group_id = batch.group_id
 
                     first_request = None
                     batch_requests = []
@@ -5118,6 +4708,7 @@ def request_borrow_batch(request):
                                     quantity_requested=1,
                                     purpose=f"[BORROWING] {purpose}\n\nBorrow Duration: {borrow_duration} days\nInstance: {instance.instance_code}",
                                     status="pending",
+                                    batch=batch,
                                     batch_group_id=group_id,
                                 )
                                 batch_requests.append(supply_request)
@@ -5133,16 +4724,21 @@ def request_borrow_batch(request):
                                     quantity_requested=1,
                                     purpose=f"[BORROWING] {purpose}\n\nBorrow Duration: {borrow_duration} days{unit_tag}",
                                     status="pending",
+                                    batch=batch,
                                     batch_group_id=group_id,
                                 )
                                 batch_requests.append(supply_request)
                                 if not first_request:
                                     first_request = supply_request
 
-                    if batch_requests:
-                        # Generate unique QR code for EACH request in the batch
-                        for req in batch_requests:
-                            req.generate_borrowing_qr_code()
+                    if not batch_requests:
+                        batch.delete()
+                    else:
+                        # Each request carries its own QR label, rendered on demand
+                        # Hold the selected units while the requests await approval
+                        reserve_instances(
+                            [req for req in batch_requests if req.equipment_instance_id], request.user
+                        )
 
                         messages.success(
                             request,
@@ -5156,6 +4752,8 @@ def request_borrow_batch(request):
                     )
                     return redirect("request_list")
                 except ValueError as e:
+                    if not batch_requests:
+                        batch.delete()
                     messages.error(request, f"Error creating borrow request: {str(e)}")
 
     # Prepare supplies data for the template - only non-consumable items with stock
@@ -5167,7 +4765,7 @@ def request_borrow_batch(request):
     ):
         # Format instances for JSON
         instances_data = []
-        for instance in s.instances.filter(status='available'):
+        for instance in unreserved(s.instances.filter(status='available')):
             instances_data.append({
                 'id': instance.id,
                 'code': instance.instance_code,
@@ -5226,20 +4824,11 @@ def bulk_delete_borrowed_items(request):
         for item in borrowed_items:
             # If not returned, restore the supply quantity
             if not item.is_returned:
-                supply = item.supply
-                previous_quantity = supply.quantity
-                supply.quantity += item.borrowed_quantity
-                supply.save()
-
-                # Log inventory transaction
-                InventoryTransaction.objects.create(
-                    supply=supply,
-                    transaction_type="in",
-                    quantity=item.borrowed_quantity,
-                    previous_quantity=previous_quantity,
-                    new_quantity=supply.quantity,
-                    reason=f"Borrowed item (ID: {item.id}) deleted/removed",
-                    performed_by=request.user,
+                # Put the items back into stock
+                StockLedger(request.user).add(
+                    item.supply,
+                    item.borrowed_quantity,
+                    f"Borrowed item (ID: {item.id}) deleted/removed",
                 )
 
             item.delete()
@@ -5772,20 +5361,7 @@ def supply_restock(request, pk):
             reason = request.POST.get("reason", "Restock")
 
             if quantity > 0:
-                previous_quantity = supply.quantity
-                supply.quantity += quantity
-                supply.save()
-
-                # Log transaction
-                InventoryTransaction.objects.create(
-                    supply=supply,
-                    transaction_type="in",
-                    quantity=quantity,
-                    previous_quantity=previous_quantity,
-                    new_quantity=supply.quantity,
-                    reason=reason,
-                    performed_by=request.user,
-                )
+                StockLedger(request.user).add(supply, quantity, reason)
 
                 messages.success(
                     request,
@@ -5823,9 +5399,9 @@ def bulk_request_create(request):
                 messages.error(request, "Purpose is required for bulk requests.")
                 return redirect("supply_list")
 
-            # Generate a consistent group_id for this batch
-            timestamp = timezone.now().strftime("%Y%m%d%H%M")
-            group_id = f"{request.user.id}-{timestamp}"
+            # One batch for the whole submission
+            batch = create_batch(request.user, is_borrowing=is_borrowing)
+            group_id = batch.group_id
 
             first_request = None
             batch_requests = []
@@ -5851,6 +5427,7 @@ def bulk_request_create(request):
                                     supply=supply,
                                     quantity_requested=1,
                                     purpose=f"{final_purpose}{unit_tag}",
+                                    batch=batch,
                                     batch_group_id=group_id,
                                 )
                                 batch_requests.append(req)
@@ -5863,6 +5440,7 @@ def bulk_request_create(request):
                                 supply=supply,
                                 quantity_requested=qty,
                                 purpose=final_purpose,
+                                batch=batch,
                                 batch_group_id=group_id,
                             )
                             batch_requests.append(req)
@@ -5871,25 +5449,17 @@ def bulk_request_create(request):
                 except ValueError:
                     continue
 
+            if not batch_requests:
+                batch.delete()
             if first_request:
                 # Always use group_id for multiple items
                 if len(batch_requests) > 1:
-                    # Generate unique QR code for EACH request in the batch
-                    for req in batch_requests:
-                        # Append unit number if there are multiple requests for the same supply
-                        supply_units = [r for r in batch_requests if r.supply_id == req.supply_id]
-                        if len(supply_units) > 1:
-                            unit_idx = supply_units.index(req) + 1
-                            # We already updated purpose with unit tag above
-                        
-                        req.generate_borrowing_qr_code() # This will generate individual QR
-                        
+                    # Each request carries its own QR label, rendered on demand
                     messages.success(
                         request,
                         f"Batch of {len(batch_requests)} requests created successfully with unique QR codes.",
                     )
                 else:
-                    first_request.generate_borrowing_qr_code()
                     messages.success(
                         request,
                         f"Request {first_request.request_id} created successfully.",
@@ -5916,9 +5486,13 @@ def download_batch_qrcodes(request, group_id):
     """
     Generate a PDF containing all QR codes for a given batch group.
     """
-    batch_requests = SupplyRequest.objects.filter(batch_group_id=group_id)
+    batch_requests = list(
+        SupplyRequest.objects.filter(Q(batch__group_id=group_id) | Q(batch_group_id=group_id))
+        .select_related("supply", "user")
+        .order_by("id")
+    )
 
-    if not batch_requests.exists():
+    if not batch_requests:
         messages.error(request, "Error: Batch group not found.")
         return redirect("request_list")
 
@@ -5931,31 +5505,21 @@ def download_batch_qrcodes(request, group_id):
     # Create the PDF object, using the response object as its "file."
     p = canvas.Canvas(response, pagesize=A4)
     width, height = A4
+    total_pages = len(batch_requests)
 
     for idx, req in enumerate(batch_requests):
-        if not req.borrowing_qr_code:
-            continue
-
         # Draw header
         p.setFont("Helvetica-Bold", 16)
         p.drawCentredString(width / 2, height - (1 * inch), "Smart Supply Management System")
         p.setFont("Helvetica", 12)
         p.drawCentredString(width / 2, height - (1.3 * inch), "Item QR Code")
 
-        # Draw QR Code image
-        qr_path = os.path.join(settings.MEDIA_ROOT, req.borrowing_qr_code.name)
-        if os.path.exists(qr_path):
-            # Calculate QR image size (e.g., 4x4 inches)
-            qr_size = 4 * inch
-            p.drawImage(
-                qr_path,
-                (width - qr_size) / 2,
-                height - (1.5 * inch) - qr_size,
-                width=qr_size,
-                height=qr_size,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
+        # Draw the QR code as vectors straight from the request's scan payload
+        qr_size = 4 * inch
+        qr_data = request_qr_data(
+            req.purpose.startswith("[BORROWING]"), req.pk, req.user_id, req.supply_id
+        )
+        draw_qr_code(p, qr_data, (width - qr_size) / 2, height - (1.5 * inch) - qr_size, qr_size)
 
         # Draw Item Details
         p.setFont("Helvetica-Bold", 14)
@@ -5970,10 +5534,10 @@ def download_batch_qrcodes(request, group_id):
 
         # Page footer
         p.setFont("Helvetica-Oblique", 8)
-        p.drawCentredString(width / 2, 0.5 * inch, f"Page {idx + 1} of {batch_requests.count()}")
+        p.drawCentredString(width / 2, 0.5 * inch, f"Page {idx + 1} of {total_pages}")
 
         # Start a new page for the next QR code
-        if idx < batch_requests.count() - 1:
+        if idx < total_pages - 1:
             p.showPage()
 
     # Close the PDF object cleanly, and we're done.
@@ -5994,35 +5558,24 @@ def bulk_approve_request(request, group_id):
         if "BATCH-" in group_id:
             group_id = group_id.split("BATCH-")[-1]
 
-        user_id, timestamp_str = group_id.split("-", 1)
-        target_time = timestamp_str[:12]
-
-        requests = SupplyRequest.objects.filter(user_id=user_id, status="pending")
+        batch = get_batch(group_id)
+        requests = SupplyRequest.objects.filter(batch=batch, status="pending") if batch else []
 
         count = 0
         now = timezone.now()
         for req in requests:
-            if req.created_at.strftime("%Y%m%d%H%M") == target_time:
-                req.status = "approved"
-                req.approved_by = request.user
-                req.approved_at = now
-                req.save()
-                count += 1
+            req.status = "approved"
+            req.approved_by = request.user
+            req.approved_at = now
+            req.save()
+            count += 1
         
         # Proactively generate/sync batch QR code if items were approved
         if count > 0:
-            approved_batch = SupplyRequest.objects.filter(
-                user_id=user_id, 
-                created_at__year=int(target_time[:4]),
-                created_at__month=int(target_time[4:6]),
-                created_at__day=int(target_time[6:8]),
-                created_at__hour=int(target_time[8:10]),
-                created_at__minute=int(target_time[10:12]),
-            )
+            reserve_instances(batch.requests.filter(status="approved"), request.user)
+            approved_batch = batch.requests.order_by("id")
             if approved_batch.count() > 1:
-                first_req = approved_batch[0]
-                first_req.generate_borrowing_qr_code(group_id=group_id)
-                approved_batch.update(borrowing_qr_code=first_req.borrowing_qr_code.name)
+                approved_batch[0].issue_batch_qr_label()
 
         messages.success(request, f"Successfully approved {count} items in the group.")
     except Exception as e:
@@ -6046,20 +5599,18 @@ def bulk_reject_request(request, group_id):
         if "BATCH-" in group_id:
             group_id = group_id.split("BATCH-")[-1]
 
-        user_id, timestamp_str = group_id.split("-", 1)
-        target_time = timestamp_str[:12]
-
-        requests = SupplyRequest.objects.filter(user_id=user_id, status="pending")
+        batch = get_batch(group_id)
+        requests = SupplyRequest.objects.filter(batch=batch, status="pending") if batch else []
 
         count = 0
         for req in requests:
-            if req.created_at.strftime("%Y%m%d%H%M") == target_time:
-                req.status = "rejected"
-                req.rejected_reason = reason
-                req.approved_by = request.user
-                req.approved_at = timezone.now()
-                req.save()
-                count += 1
+            req.status = "rejected"
+            req.rejected_reason = reason
+            req.approved_by = request.user
+            req.approved_at = timezone.now()
+            req.save()
+            count += 1
+        release_reservations(list(requests))
 
         messages.success(request, f"Successfully rejected {count} items in the group.")
     except Exception as e:
@@ -6071,6 +5622,7 @@ def bulk_reject_request(request, group_id):
 @login_required
 @require_POST
 @login_required
+@idempotent
 def bulk_release_request(request, group_id):
     """Release all approved items in a grouped request."""
     if request.user.role not in ["admin", "gso_staff"]:
@@ -6087,21 +5639,23 @@ def bulk_release_request(request, group_id):
         if "BATCH-" in group_id:
             group_id = group_id.split("BATCH-")[-1]
 
-        user_id, timestamp_str = group_id.split("-", 1)
-        target_time = timestamp_str[:12]
-
-        # Get all approved requests in this batch
-        all_user_approved = SupplyRequest.objects.filter(
-            user_id=user_id, status="approved"
-        )
-
-        batch_items = [
-            req
-            for req in all_user_approved
-            if req.created_at.strftime("%Y%m%d%H%M") == target_time
-        ]
+        # Release all approved requests in this batch in one transaction
+        batch = get_batch(group_id)
+        try:
+            released, error_items = release_batch(
+                batch, request.user, f"Released in bulk batch (Group: {group_id})"
+            ) if batch else ([], [])
+        except InstancesTaken:
+            error = "Some units of this batch were just claimed by another release. Please try again."
+            if (
+                request.headers.get("x-requested-with") == "XMLHttpRequest"
+                or request.content_type == "application/json"
+            ):
+                return JsonResponse({"error": error}, status=409)
+            messages.error(request, error)
+            return redirect("request_list")
 
-        if not batch_items:
+        if not released and not error_items:
             if (
                 request.headers.get("x-requested-with") == "XMLHttpRequest"
                 or request.content_type == "application/json"
@@ -6112,118 +5666,7 @@ def bulk_release_request(request, group_id):
             messages.warning(request, "No approved items found in this batch.")
             return redirect("request_list")
 
-        count = 0
-        error_items = []
-
-        for req in batch_items:
-            # Check stock
-            if req.supply.quantity < req.quantity_requested:
-                error_items.append(f"{req.supply.name} (Insufficient stock)")
-                continue
-
-            # Update supply quantity
-            previous_quantity = req.supply.quantity
-            req.supply.quantity -= req.quantity_requested
-            req.supply.save()
-
-            # Update request status
-            req.status = "released"
-            req.released_by = request.user
-            req.released_at = timezone.now()
-            req.save()
-
-            # Create BorrowedItem record if it's a borrowing request
-            if "[BORROWING]" in req.purpose:
-                try:
-                    # Check if specific instance was requested
-                    if hasattr(req, 'equipment_instance') and req.equipment_instance:
-                        instance = req.equipment_instance
-                        # Check if still available
-                        if instance.status == 'available':
-                            BorrowedItem.objects.create(
-                                supply=req.supply,
-                                equipment_instance=instance,
-                                borrower=req.user,
-                                borrowed_quantity=1,
-                                borrowed_date=timezone.now().date(),
-                                location_when_borrowed=req.supply.location or "",
-                                notes=f"Released in bulk batch (Group: {group_id}) - Instance: {instance.instance_code}",
-                                batch_group_id=group_id,
-                            )
-                            instance.status = 'borrowed'
-                            instance.save()
-                        else:
-                            # Try to find another instance of same supply
-                            available_instances = req.supply.instances.filter(status='available')[:1]
-                            if available_instances.exists():
-                                new_instance = available_instances.first()
-                                BorrowedItem.objects.create(
-                                    supply=req.supply,
-                                    equipment_instance=new_instance,
-                                    borrower=req.user,
-                                    borrowed_quantity=1,
-                                    borrowed_date=timezone.now().date(),
-                                    location_when_borrowed=req.supply.location or "",
-                                    notes=f"Released in bulk batch (Group: {group_id}) - Instance: {new_instance.instance_code} (Requested {instance.instance_code} unavailable)",
-                                    batch_group_id=group_id,
-                                )
-                                new_instance.status = 'borrowed'
-                                new_instance.save()
-                    else:
-                        # Normal flow (no specific instance requested)
-                        available_instances = req.supply.instances.filter(status='available')[:req.quantity_requested]
-                        
-                        if available_instances.exists():
-                            for instance in available_instances:
-                                BorrowedItem.objects.create(
-                                    supply=req.supply,
-                                    equipment_instance=instance,
-                                    borrower=req.user,
-                                    borrowed_quantity=1,
-                                    borrowed_date=timezone.now().date(),
-                                    location_when_borrowed=req.supply.location or "",
-                                    notes=f"Released in bulk batch (Group: {group_id}) - Instance: {instance.instance_code}",
-                                    batch_group_id=group_id,
-                                )
-                                instance.status = 'borrowed'
-                                instance.save()
-                        else:
-                            # Fallback for supplies without instances
-                            BorrowedItem.objects.create(
-                                supply=req.supply,
-                                borrower=req.user,
-                                borrowed_quantity=req.quantity_requested,
-                                borrowed_date=timezone.now().date(),
-                                location_when_borrowed=req.supply.location or "",
-                                notes=f"Released in bulk batch (Group: {group_id})",
-                                batch_group_id=group_id,
-                            )
-                except Exception as e:
-                    print(f"Error creating BorrowedItem for {req.id}: {e}")
-
-            # Log inventory transaction
-            InventoryTransaction.objects.create(
-                supply=req.supply,
-                transaction_type="out",
-                quantity=-req.quantity_requested,
-                previous_quantity=previous_quantity,
-                new_quantity=req.supply.quantity,
-                reason=f"Released in bulk batch (Group: {group_id})",
-                performed_by=request.user,
-            )
-
-            # Log the scan for the scanner's recent transmissions list
-            from .models import QRScanLog
-
-            QRScanLog.objects.create(
-                supply=req.supply,
-                scanned_by=request.user,
-                action="issue",
-                location=req.supply.location or "",
-                notes=f"Released in bulk batch (Group: {group_id})",
-            )
-            count += 1
-
+        count = len(released)
         msg = f"Successfully released {count} items."
         if error_items:
             msg += f" Failed items: {', '.join(error_items)}"
@@ -6252,6 +5695,7 @@ def bulk_release_request(request, group_id):
 
 @login_required
 @require_POST
+@idempotent
 def bulk_return_request(request, group_id):
     """Handle batch return request - redirect to batch return page."""
     if request.user.role not in ["admin", "gso_staff"]:
@@ -6268,37 +5712,11 @@ def bulk_return_request(request, group_id):
         if "BATCH-" in group_id:
             group_id = group_id.split("BATCH-")[-1]
 
-        # Check if there are any unreturned borrowed items with this batch_group_id
-        unreturned_items = BorrowedItem.objects.filter(
-            batch_group_id=group_id,
+        # Unreturned borrowed items of this batch, joined through RequestBatch
+        unreturned_items = batch_borrowed_items(group_id).filter(
             returned_at__isnull=True
         )
 
-        # Fallback: If no items found by batch_group_id, try matching by user and timestamp
-        if not unreturned_items.exists():
-            try:
-                user_id_str, timestamp_part = group_id.split("-", 1)
-                target_time = timestamp_part[:12]  # YYYYMMDDHHMM
-                
-                # Find unreturned borrowed items for this user with matching borrowed_at timestamp
-                all_user_borrowed = BorrowedItem.objects.filter(
-                    borrower_id=int(user_id_str),
-                    returned_at__isnull=True
-                )
-                
-                matching_ids = []
-                for item in all_user_borrowed:
-                    if item.borrowed_at.strftime("%Y%m%d%H%M") == target_time:
-                        matching_ids.append(item.id)
-                        # Assign batch_group_id for future lookups
-                        item.batch_group_id = group_id
-                        item.save(update_fields=['batch_group_id'])
-                
-                if matching_ids:
-                    unreturned_items = BorrowedItem.objects.filter(id__in=matching_ids)
-            except (ValueError, AttributeError):
-                pass
-
         if not unreturned_items.exists():
             if (
                 request.headers.get("x-requested-with") == "XMLHttpRequest"
@@ -6374,6 +5792,54 @@ def equipment_instance_list(request, pk):
     return render(request, 'inventory/equipment_instance_list.html', context)
 
 
+@login_required
+def equipment_instance_labels(request):
+    """
+    Stream an A4 sheet of instance tags (QR, code, supply, brand and model).
+    Instances are selected by ``supply``, ``category`` or a comma-separated
+    ``ids`` list; ``columns`` and ``rows`` set the grid per page.
+    """
+    if request.user.role not in ['admin', 'gso_staff']:
+        messages.error(request, "Unauthorized")
+        return redirect('supply_list')
+
+    supply_id = request.GET.get('supply', '').strip()
+    category_id = request.GET.get('category', '').strip()
+    if (supply_id and not supply_id.isdigit()) or (category_id and not category_id.isdigit()):
+        messages.error(request, "Invalid supply or category for labels.")
+        return redirect(_safe_next_url(request, 'supply_list'))
+
+    instances = EquipmentInstance.objects.all()
+    if supply_id:
+        instances = instances.filter(supply_id=int(supply_id))
+    if category_id:
+        instances = instances.filter(supply__category_id=int(category_id))
+    if request.GET.get('ids'):
+        ids = [value for value in request.GET['ids'].split(',') if value.strip().isdigit()]
+        instances = instances.filter(pk__in=ids)
+
+    if not instances.exists():
+        messages.error(request, "No equipment instances selected for labels.")
+        return redirect(_safe_next_url(request, 'supply_list'))
+
+    try:
+        columns = min(max(int(request.GET.get('columns', DEFAULT_COLUMNS)), 1), MAX_COLUMNS)
+        rows = min(max(int(request.GET.get('rows', DEFAULT_ROWS)), 1), MAX_ROWS)
+    except ValueError:
+        columns, rows = DEFAULT_COLUMNS, DEFAULT_ROWS
+
+    labels = (
+        instances.order_by('supply__name', 'instance_code')
+        .values('id', 'instance_code', 'supply__name', 'brand', 'model_name')
+        .iterator(chunk_size=500)
+    )
+    response = StreamingHttpResponse(
+        LabelSheetWriter(columns, rows).stream(labels), content_type='application/pdf'
+    )
+    response['Content-Disposition'] = 'attachment; filename="equipment_labels.pdf"'
+    return response
+
+
 @login_required
 def equipment_instance_create(request, pk):
     """Create a new equipment instance for a supply"""
@@ -6409,9 +5875,6 @@ def equipment_instance_create(request, pk):
             notes=notes or None,
         )
         
-        # Generate QR code
-        instance.generate_qr_code()
-        
         messages.success(request, f"Equipment instance '{instance_code}' created successfully")
         return redirect('equipment_instance_list', pk=pk)
     
@@ -6441,44 +5904,35 @@ def equipment_instance_bulk_create(request, pk):
     supply = get_object_or_404(Supply, pk=pk)
     
     if request.method == 'POST':
-        count = int(request.POST.get('count', 1))
         brand = request.POST.get('brand', '').strip()
         model_name = request.POST.get('model_name', '').strip()
         
-        if count < 1 or count > 100:
-            messages.error(request, "Count must be between 1 and 100")
+        try:
+            count = int(request.POST.get('count') or 0)
+        except ValueError:
+            messages.error(request, "Count must be a whole number")
             return redirect('equipment_instance_bulk_create', pk=pk)
-        
-        # Generate prefix from supply name
-        prefix = supply.name[:3].upper().replace(' ', '')
-        
-        # Find next available number
-        existing_codes = set(supply.instances.values_list('instance_code', flat=True))
-        next_num = 1
-        
-        created_count = 0
-        for _ in range(count):
-            while f"{prefix}-{next_num:03d}" in existing_codes:
-                next_num += 1
-            
-            instance_code = f"{prefix}-{next_num:03d}"
-            existing_codes.add(instance_code)
-            
-            instance = EquipmentInstance.objects.create(
-                supply=supply,
-                instance_code=instance_code,
-                brand=brand or None,
-                model_name=model_name or None,
+
+        # One instance per serial number when a CSV of serials is uploaded
+        try:
+            serials = read_serials(request.FILES['serials']) if request.FILES.get('serials') else None
+            instances, job = provision_instances(
+                supply, count, serials, brand=brand, model_name=model_name, user=request.user
             )
-            instance.generate_qr_code()
-            created_count += 1
-            next_num += 1
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('equipment_instance_bulk_create', pk=pk)
         
-        messages.success(request, f"Created {created_count} equipment instances successfully")
-        return redirect('equipment_instance_list', pk=pk)
+        messages.success(
+            request,
+            f"Created {len(instances)} equipment instances ({instances[0].instance_code} to "
+            f"{instances[-1].instance_code}). QR labels are being generated in the background.",
+        )
+        return redirect(_with_qr_job(reverse('equipment_instance_list', args=[pk]), job))
     
     context = {
         'supply': supply,
+        'max_instances': MAX_INSTANCES,
     }
     
     return render(request, 'inventory/equipment_instance_bulk_form.html', context)
@@ -6504,17 +5958,8 @@ def equipment_instance_detail(request, pk):
 @login_required
 def get_instance_qr_code(request, pk):
     """Get the QR code image for an equipment instance"""
-    instance = get_object_or_404(EquipmentInstance, pk=pk)
-    
-    if not instance.qr_code:
-        instance.generate_qr_code()
-    
-    if instance.qr_code:
-        response = HttpResponse(instance.qr_code.read(), content_type='image/png')
-        response['Content-Disposition'] = f'inline; filename="{instance.instance_code}_qr.png"'
-        return response
-    
-    return JsonResponse({'error': 'QR code not available'}, status=404)
+    instance = get_object_or_404(EquipmentInstance.objects.select_related('supply'), pk=pk)
+    return redirect(instance.qr_image_url)
 
 
 @login_required
@@ -6583,31 +6028,19 @@ def return_instance(request, pk):
     if return_status == 'returned':
         instance.status = 'available'
         # Return stock to supply
-        previous_qty = instance.supply.quantity
-        instance.supply.quantity += borrowed_item.borrowed_quantity
-        instance.supply.save()
-        
-        # Log transaction
-        InventoryTransaction.objects.create(
-            supply=instance.supply,
-            transaction_type='in',
-            quantity=borrowed_item.borrowed_quantity,
-            previous_quantity=previous_qty,
-            new_quantity=instance.supply.quantity,
-            reason=f"Returned instance {instance.instance_code} via QR scan",
-            performed_by=request.user,
+        StockLedger(request.user).add(
+            instance.supply,
+            borrowed_item.borrowed_quantity,
+            f"Returned instance {instance.instance_code} via QR scan",
         )
     elif return_status in ['lost', 'damaged']:
         instance.status = 'retired' if return_status == 'lost' else 'maintenance'
         # Log write-off
-        InventoryTransaction.objects.create(
-            supply=instance.supply,
-            transaction_type=return_status,
-            quantity=-borrowed_item.borrowed_quantity,
-            previous_quantity=instance.supply.quantity,
-            new_quantity=instance.supply.quantity,
-            reason=f"Instance {instance.instance_code} marked as {return_status}. {notes}",
-            performed_by=request.user,
+        StockLedger(request.user).record(
+            instance.supply,
+            return_status,
+            -borrowed_item.borrowed_quantity,
+            f"Instance {instance.instance_code} marked as {return_status}. {notes}",
         )
     
     instance.save()
@@ -6627,6 +6060,8 @@ def return_instance(request, pk):
         action='return',
         location=location or instance.supply.location,
         notes=f"Returned instance {instance.instance_code}",
+        supply_request_id=borrowed_item.supply_request_id,
+        batch_group_id=batch_context,
     )
     
     message = f"Instance '{instance.instance_code}' returned successfully."
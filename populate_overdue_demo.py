@@ -87,12 +87,11 @@ def populate_overdue_demo_data():
                 approved_at=timezone.now(),
                 released_at=timezone.now()
             )
-            request_overdue.generate_borrowing_qr_code()
             
             print(f"Created overdue item #{i}: {overdue_item.supply.name} (ID: {overdue_item.id})")
             print(f"  - Return deadline: {overdue_item.return_deadline}")
             print(f"  - Is overdue: {overdue_item.is_overdue}")
-            print(f"  - QR Code generated: {request_overdue.borrowing_qr_code.name}")
+            print(f"  - QR Code: {request_overdue.qr_image_url}")
         except Exception as e:
             print(f"Error creating overdue item #{i}: {e}")
     
@@ -118,13 +117,12 @@ def populate_overdue_demo_data():
             approved_at=timezone.now(),
             released_at=timezone.now()
         )
-        request_due_soon.generate_borrowing_qr_code()
         
         print(f"Created due soon item: {due_soon_item.supply.name} (ID: {due_soon_item.id})")
         print(f"  - Borrowed by: {due_soon_item.borrower.username}")
         print(f"  - Return deadline: {due_soon_item.return_deadline}")
         print(f"  - Days until due: {due_soon_item.days_until_due}")
-        print(f"  - QR Code generated: {request_due_soon.borrowing_qr_code.name}")
+        print(f"  - QR Code: {request_due_soon.qr_image_url}")
     except Exception as e:
         print(f"Error creating due soon item: {e}")
         return
@@ -153,7 +151,6 @@ def populate_overdue_demo_data():
             approved_at=timezone.now() - timedelta(days=4), # matched borrow date roughly
             released_at=timezone.now() - timedelta(days=4)
         )
-        request_returned.generate_borrowing_qr_code()
         
         print(f"Created returned item: {returned_item.supply.name} (ID: {returned_item.id})")
         print(f"  - Borrowed by: {returned_item.borrower.username}")
@@ -161,7 +158,7 @@ def populate_overdue_demo_data():
         print(f"  - Return deadline: {returned_item.return_deadline}")
         print(f"  - Is returned: {returned_item.is_returned}")
         print(f"  - Is overdue: {returned_item.is_overdue}")
-        print(f"  - QR Code generated: {request_returned.borrowing_qr_code.name}")
+        print(f"  - QR Code: {request_returned.qr_image_url}")
     except Exception as e:
         print(f"Error creating returned item: {e}")
         return
@@ -80,6 +80,44 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'supply_.wsgi.application'
+ASGI_APPLICATION = 'supply_.asgi.application'
+
+# Seconds between database polls of the in-process event broker that feeds
+# the Server-Sent Events stream (see inventory/events.py)
+EVENT_STREAM_POLL_INTERVAL = 2
+
+# Bulk QR label rendering (see inventory/qr_pipeline.py). Jobs run in a
+# background thread of the web process unless QR_RENDER_IN_PROCESS is off,
+# in which case `manage.py process_qr_jobs` picks them up. Workers defaults
+# to the CPU count. Jobs still running after QR_RENDER_STALE_AFTER seconds
+# are requeued by process_qr_jobs.
+QR_RENDER_IN_PROCESS = True
+QR_RENDER_WORKERS = None
+QR_RENDER_STALE_AFTER = 15 * 60
+
+# On-demand QR labels (see inventory/qr_cache.py): rendered PNGs are kept in
+# an in-process LRU of this many entries, backed by a content-addressed disk
+# cache that is safe to delete at any time. The disk cache is trimmed to
+# QR_CACHE_MAX_BYTES, least recently used first, every QR_CACHE_PRUNE_EVERY
+# new files and by `manage.py prune_qr_cache`.
+QR_MEMORY_CACHE_ENTRIES = 256
+QR_CACHE_DIR = os.path.join(BASE_DIR, 'qr_cache')
+QR_CACHE_MAX_BYTES = 200 * 1024 * 1024
+QR_CACHE_PRUNE_EVERY = 500
+
+# QR scan metrics (see inventory/scan_metrics.py): scans slower than this many
+# milliseconds are logged as warnings (logger 'inventory.scan_metrics') and
+# listed by /qr-scan/metrics/. None disables it.
+QR_SCAN_SLOW_MS = 500
+
+# Idempotency keys (see inventory/idempotency.py): responses to POSTs sent
+# with an Idempotency-Key header are replayed for retries within this many
+# seconds. `manage.py prune_idempotency_keys` deletes expired keys.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Instance reservations (see inventory/allocation.py): units picked on a borrow
+# request or held at approval stay reserved for it for this many seconds.
+INSTANCE_RESERVATION_TTL = 30 * 60
 
 
 # Database
@@ -89,9 +127,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transactions take the write lock when they begin, so concurrent
+            # stock changes (inventory/stock_ledger.py) wait their turn
+            # instead of failing with "database is locked".
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Database cache shared by every web worker and by the management commands
+# (run_alert_scheduler, check_overdue_items, ...), so an invalidation made in
+# any process reaches all of them. The table is created by migration 0043;
+# Redis or Memcached can replace it without code changes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'inventory_cache',
     }
 }
 
+# Seconds the navbar notification counters may be served from cache
+NOTIFICATION_COUNTER_CACHE_TIMEOUT = 300
+
+# Seconds a role-specific dashboard snapshot may be served from cache
+DASHBOARD_SNAPSHOT_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators